@@ -8,7 +8,7 @@
 import logging
 import sqlite3
 import pandas as pd
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Callable
 from dataclasses import dataclass
 from datetime import datetime
 import re
@@ -437,9 +437,15 @@ class BaseQualityAssessment:
         
         return 'D'  # 默认最低等级
     
-    def assess_batch_materials(self, materials: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """批量评估物料质量"""
+    def assess_batch_materials(self, materials: List[Dict[str, Any]],
+                               assess_func: Optional[Callable[[Dict[str, Any]], QualityScore]] = None
+                               ) -> Dict[str, Any]:
+        """批量评估物料质量
         
+        assess_func可替换单物料评估函数（如带缓存的实现），默认使用assess_material_quality
+        """
+        
+        assess = assess_func or self.assess_material_quality
         logger.info(f"开始批量质量评估，物料数量: {len(materials)}")
         
         batch_results = []
@@ -449,7 +455,7 @@ class BaseQualityAssessment:
         
         for i, material in enumerate(materials):
             try:
-                quality_score = self.assess_material_quality(material)
+                quality_score = assess(material)
                 
                 # 收集统计信息
                 batch_results.append({
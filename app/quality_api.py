@@ -4,11 +4,16 @@
 为MMP系统提供质量评估服务接口
 """
 
-from flask import Blueprint, request, jsonify
-from typing import Dict, Any, List
+from flask import Blueprint, Response, request, jsonify
+from typing import Dict, Any, Optional, Tuple
 import logging
 import traceback
-from datetime import datetime
+import copy
+from datetime import date, datetime
+from functools import lru_cache
+import hashlib
+import json
+import time
 
 from app.base_quality_assessment import (
     BaseQualityAssessment, QualityIntegratedClassifier
@@ -24,6 +29,103 @@ quality_bp = Blueprint('quality', __name__, url_prefix='/api/quality')
 quality_assessor = None
 integrated_classifier = None
 
+# 秒级时间戳缓存：[整秒时刻, ISO字符串]
+_TS_CACHE = [-1, '']
+
+def _now_iso() -> str:
+    """返回当前时间的ISO字符串（精确到秒），同一整秒内复用缓存值"""
+    second = int(time.time())
+    cache = _TS_CACHE
+    if second != cache[0]:
+        cache[1] = datetime.fromtimestamp(second).isoformat(timespec='seconds')
+        cache[0] = second
+    return cache[1]
+
+# 单物料评估结果缓存容量（热点物料占大部分请求）
+ASSESS_CACHE_SIZE = 4096
+
+class _MaterialKey:
+    """评估缓存键：按规范化元组比较和哈希，同时携带原始物料数据供评估使用"""
+    __slots__ = ('key', 'material_data', '_hash')
+    
+    def __init__(self, key: Tuple, material_data: Dict[str, Any]):
+        self.key = key
+        self.material_data = material_data
+        self._hash = hash(key)
+    
+    def __hash__(self) -> int:
+        return self._hash
+    
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, _MaterialKey) and self.key == other.key
+
+def _material_cache_key(material_data: Any) -> Optional[_MaterialKey]:
+    """将物料数据规范化为缓存键（值统一转为字符串并带上类型名），非字典时返回None"""
+    if not isinstance(material_data, dict):
+        return None
+    try:
+        key = tuple(sorted((k, type(v).__name__, str(v)) for k, v in material_data.items()))
+    except TypeError:
+        return None
+    return _MaterialKey(key, dict(material_data))
+
+@lru_cache(maxsize=ASSESS_CACHE_SIZE)
+def _cached_assess(material_key: _MaterialKey, day: date):
+    """按规范化键缓存的质量评估；可靠性得分随数据时效变化，缓存按自然日失效"""
+    return quality_assessor.assess_material_quality(material_key.material_data)
+
+def _assess_material(material_data: Dict[str, Any]):
+    """评估单个物料，字典输入走LRU缓存（返回副本，调用方修改结果不影响缓存）"""
+    key = _material_cache_key(material_data)
+    if key is None:
+        return quality_assessor.assess_material_quality(material_data)
+    return copy.deepcopy(_cached_assess(key, date.today()))
+
+def _material_digest(material_data: Any) -> Optional[bytes]:
+    """计算物料内容摘要（BLAKE2b），用于批次内去重"""
+    try:
+        content = json.dumps(material_data, sort_keys=True, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+def _make_batch_assess_func():
+    """创建批次内按内容去重的评估函数，重复物料只评估一次"""
+    batch_results = {}
+    
+    def assess(material_data: Dict[str, Any]):
+        digest = _material_digest(material_data)
+        if digest is None:
+            return _assess_material(material_data)
+        result = batch_results.get(digest)
+        if result is None:
+            result = batch_results[digest] = _assess_material(material_data)
+        return result
+    
+    return assess
+
+# /report 数据库查询语句缓存，键为 (按类别过滤, 按制造商过滤)
+_REPORT_QUERIES: Dict[Tuple[bool, bool], str] = {}
+
+def _get_report_query(has_category: bool, has_manufacturer: bool) -> str:
+    """获取（必要时构建）/report 数据库查询语句"""
+    key = (has_category, has_manufacturer)
+    query = _REPORT_QUERIES.get(key)
+    if query is None:
+        conditions = []
+        if has_category:
+            conditions.append("category = ?")
+        if has_manufacturer:
+            conditions.append("manufacturer = ?")
+        
+        query = "SELECT * FROM material_categories"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " LIMIT 1000"  # 限制查询数量
+        
+        _REPORT_QUERIES[key] = query
+    return query
+
 def init_quality_assessment(app):
     """初始化质量评估系统"""
     global quality_assessor, integrated_classifier
@@ -33,6 +135,7 @@ def init_quality_assessment(app):
         
         # 初始化质量评估器
         quality_assessor = BaseQualityAssessment(config_db_path)
+        _cached_assess.cache_clear()
         
         # 初始化统一分类器
         unified_classifier = UnifiedMaterialClassifier({
@@ -86,7 +189,7 @@ def assess_single_material():
         material_data = data['material_data']
         
         # 执行质量评估
-        quality_result = quality_assessor.assess_material_quality(material_data)
+        quality_result = _assess_material(material_data)
         
         return jsonify({
             'success': True,
@@ -97,7 +200,7 @@ def assess_single_material():
                 'quality_issues': quality_result.quality_issues,
                 'improvement_suggestions': quality_result.improvement_suggestions
             },
-            'timestamp': datetime.now().isoformat()
+            'timestamp': _now_iso()
         }), 200
         
     except Exception as e:
@@ -148,13 +251,15 @@ def assess_batch_materials():
                 'error': 'materials必须是非空数组'
             }), 400
         
-        # 执行批量质量评估
-        batch_result = quality_assessor.assess_batch_materials(materials)
+        # 执行批量质量评估（命中缓存的物料不再重复评估）
+        batch_result = quality_assessor.assess_batch_materials(
+            materials, assess_func=_make_batch_assess_func()
+        )
         
         return jsonify({
             'success': True,
             'data': batch_result,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': _now_iso()
         }), 200
         
     except Exception as e:
@@ -211,7 +316,7 @@ def classify_with_quality_assessment():
         return jsonify({
             'success': True,
             'data': result,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': _now_iso()
         }), 200
         
     except Exception as e:
@@ -249,7 +354,7 @@ def get_quality_dimensions():
                 'quality_grades': quality_assessor.quality_grades,
                 'total_weight': sum(dim.weight for dim in quality_assessor.quality_dimensions.values())
             },
-            'timestamp': datetime.now().isoformat()
+            'timestamp': _now_iso()
         }), 200
         
     except Exception as e:
@@ -308,33 +413,23 @@ def generate_quality_report():
         elif source == 'database':
             # 从数据库获取物料数据（简化实现）
             import sqlite3
-            import pandas as pd
             
-            conn = sqlite3.connect(quality_assessor.config_db_path)
-            
-            # 构建查询
-            query = "SELECT * FROM material_categories"
             filters = data.get('filters', {})
-            conditions = []
-            params = []
-            
-            if filters.get('category'):
-                conditions.append("category = ?")
-                params.append(filters['category'])
-            
-            if filters.get('manufacturer'):
-                conditions.append("manufacturer = ?")
-                params.append(filters['manufacturer'])
+            params = [
+                value for value in (filters.get('category'), filters.get('manufacturer'))
+                if value
+            ]
+            query = _get_report_query(bool(filters.get('category')),
+                                      bool(filters.get('manufacturer')))
             
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-            
-            query += " LIMIT 1000"  # 限制查询数量
-            
-            df = pd.read_sql(query, conn, params=params)
-            conn.close()
-            
-            materials = df.to_dict('records')
+            # 直接从游标构建记录，跳过DataFrame构建
+            conn = sqlite3.connect(quality_assessor.config_db_path)
+            try:
+                cursor = conn.execute(query, params)
+                columns = [desc[0] for desc in cursor.description]
+                materials = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            finally:
+                conn.close()
             
         else:
             return jsonify({
@@ -342,8 +437,10 @@ def generate_quality_report():
                 'error': 'source参数必须是database或materials'
             }), 400
         
-        # 执行批量质量评估
-        batch_result = quality_assessor.assess_batch_materials(materials)
+        # 执行批量质量评估（重复物料只评估一次）
+        batch_result = quality_assessor.assess_batch_materials(
+            materials, assess_func=_make_batch_assess_func()
+        )
         
         return jsonify({
             'success': True,
@@ -351,7 +448,7 @@ def generate_quality_report():
                 'report_type': 'quality_assessment',
                 'source': source,
                 'batch_results': batch_result,
-                'report_generated_at': datetime.now().isoformat()
+                'report_generated_at': _now_iso()
             }
         }), 200
         
@@ -399,7 +496,7 @@ def get_quality_statistics():
         return jsonify({
             'success': True,
             'data': statistics,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': _now_iso()
         }), 200
         
     except Exception as e:
@@ -419,7 +516,8 @@ def get_quality_service_status():
             'integrated_classifier_status': 'active' if integrated_classifier else 'inactive',
             'supported_dimensions': list(quality_assessor.quality_dimensions.keys()) if quality_assessor else [],
             'quality_grades': list(quality_assessor.quality_grades.keys()) if quality_assessor else [],
-            'timestamp': datetime.now().isoformat()
+            'assessment_cache': _cached_assess.cache_info()._asdict(),
+            'timestamp': _now_iso()
         }
         
         return jsonify({
@@ -434,24 +532,22 @@ def get_quality_service_status():
             'error': f'获取质量服务状态失败: {str(e)}'
         }), 500
 
-# 错误处理
+# 错误处理（响应体在导入时预先序列化）
+def _error_body(message: str) -> bytes:
+    return json.dumps({'success': False, 'error': message}, ensure_ascii=False).encode('utf-8')
+
+_ERR_404 = _error_body('接口不存在')
+_ERR_405 = _error_body('请求方法不被允许')
+_ERR_500 = _error_body('内部服务器错误')
+
 @quality_bp.errorhandler(404)
 def not_found(error):
-    return jsonify({
-        'success': False,
-        'error': '接口不存在'
-    }), 404
+    return Response(_ERR_404, status=404, mimetype='application/json')
 
 @quality_bp.errorhandler(405)
 def method_not_allowed(error):
-    return jsonify({
-        'success': False,
-        'error': '请求方法不被允许'
-    }), 405
+    return Response(_ERR_405, status=405, mimetype='application/json')
 
 @quality_bp.errorhandler(500)
 def internal_error(error):
-    return jsonify({
-        'success': False,
-        'error': '内部服务器错误'
-    }), 500
\ No newline at end of file
+    return Response(_ERR_500, status=500, mimetype='application/json')
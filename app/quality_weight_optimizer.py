@@ -7,18 +7,79 @@
 import numpy as np
 import pandas as pd
 import sqlite3
-from typing import Dict, List, Any, Tuple
-from sklearn.model_selection import cross_val_score, train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from typing import Dict, List, Any, Iterator
+from sklearn.model_selection import KFold
 import optuna
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 import logging
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# 物料名称中的明确类别词（一致性评分）
+CATEGORY_KEYWORDS = ['阀', '泵', '管', '轴承', '密封', '法兰', '螺栓']
+
+# 标准规格格式标记（合规性评分）
+SPEC_STANDARD_MARKERS = ['DN', 'PN', 'φ', 'M', '*']
+
+# 预编译的关键词匹配正则
+CATEGORY_KEYWORD_RE = re.compile('|'.join(map(re.escape, CATEGORY_KEYWORDS)))
+SPEC_STANDARD_MARKER_RE = re.compile('|'.join(map(re.escape, SPEC_STANDARD_MARKERS)))
+
+# 完整性评分字段：(字段名, 最小长度(不含), 分值)
+COMPLETENESS_FIELDS = [
+    ('material_name', 2, 0.4),
+    ('specification', 2, 0.3),
+    ('manufacturer', 2, 0.2),
+    ('predicted_category', 1, 0.1)
+]
+COMPLETENESS_WEIGHTS = np.array([weight for _, _, weight in COMPLETENESS_FIELDS])
+
+# _materialize_text_features 生成的中间列，评分完成后删除
+TEXT_FEATURE_COLUMNS = ['_name_lc', '_pred_lc', '_has_category_kw', '_has_spec_marker', '_name_matches_pred']
+
+# 维度评分取值在[0, 1]，float32精度足够且内存带宽减半
+DIMENSION_DTYPE = np.float32
+
+# 加权质量分数的二分类阈值
+QUALITY_THRESHOLD = 0.75
+
+# 权重搜索空间：(权重名, 下限, 上限)，顺序与 DIMENSION_COLUMNS 一致
+WEIGHT_SEARCH_SPACE = [
+    ('confidence_score', 0.1, 0.5),
+    ('consistency_score', 0.1, 0.4),
+    ('completeness_score', 0.1, 0.3),
+    ('accuracy_score', 0.05, 0.25),
+    ('compliance_score', 0.05, 0.2)
+]
+
+# 优化历史表列类型，避免读取时推断为object
+OPTIMIZATION_HISTORY_DTYPES = {
+    'id': 'Int64',
+    'weights_config': 'object',
+    'baseline_accuracy': 'float64',
+    'optimized_accuracy': 'float64',
+    'improvement': 'float64',
+    'adopted': 'Int8',
+    'training_samples': 'Int64'
+}
+
+# 质量维度列（顺序与权重向量一致）
+DIMENSION_COLUMNS = [
+    'confidence_dimension', 'consistency_dimension', 'completeness_dimension',
+    'accuracy_dimension', 'compliance_dimension'
+]
+
 class QualityWeightOptimizer:
     """质量评估权重优化器"""
     
@@ -39,6 +100,10 @@ class QualityWeightOptimizer:
         # 历史最优权重记录
         self.optimization_history = []
         
+        # 优化历史库连接（首次使用时打开，建表只执行一次），可跨线程使用，访问由锁串行化
+        self._history_conn = None
+        self._history_lock = threading.Lock()
+        
     def collect_training_data(self, days_back: int = 30) -> pd.DataFrame:
         """收集训练数据，基于现有MMP系统的分类结果和用户反馈"""
         
@@ -82,8 +147,6 @@ class QualityWeightOptimizer:
     def _create_mock_training_data(self) -> pd.DataFrame:
         """创建模拟训练数据用于演示和测试"""
         
-        mock_data = []
-        
         # 基于现有智能分类器的实际案例创建模拟数据
         classifications = [
             ('不锈钢球阀', 'DN100 PN16', '上海阀门厂', '球阀', 0.95, 'correct', '球阀'),
@@ -95,155 +158,145 @@ class QualityWeightOptimizer:
             ('管件', '90度弯头 DN50', '管道公司', '管件', 0.79, 'correct', '弯头'),
             ('轴承', '6205-2RS', '轴承厂', '轴承', 0.91, 'correct', '滚动轴承'),
         ]
+        variations = 5  # 每个基础案例的变体数量
+        
+        names, specs, mfgs, pred_cats, confs, feedbacks, final_cats = (
+            np.repeat(np.array(column), variations) for column in zip(*classifications)
+        )
+        n_rows = len(names)
         
-        for i, (name, spec, mfg, pred_cat, conf, feedback, final_cat) in enumerate(classifications):
-            # 为每个基础案例创建多个变体
-            for variation in range(5):
-                # 添加一些随机变化
-                conf_variation = conf + np.random.normal(0, 0.05)
-                conf_variation = max(0.1, min(0.99, conf_variation))
-                
-                mock_data.append({
-                    'material_name': name,
-                    'specification': spec,
-                    'manufacturer': mfg,
-                    'predicted_category': pred_cat,
-                    'confidence_score': conf_variation,
-                    'user_feedback': feedback,
-                    'final_category': final_cat,
-                    'created_at': datetime.now() - timedelta(days=np.random.randint(1, 30))
-                })
-        
-        return pd.DataFrame(mock_data)
+        # 添加一些随机变化（一次性抽样）
+        confidence = np.clip(
+            confs.astype(np.float64) + np.random.normal(0, 0.05, size=n_rows), 0.1, 0.99
+        )
+        days_ago = np.random.randint(1, 30, size=n_rows)
+        
+        return pd.DataFrame({
+            'material_name': names,
+            'specification': specs,
+            'manufacturer': mfgs,
+            'predicted_category': pred_cats,
+            'confidence_score': confidence,
+            'user_feedback': feedbacks,
+            'final_category': final_cats,
+            'created_at': pd.Timestamp.now() - pd.to_timedelta(days_ago, unit='D')
+        })
     
     def _calculate_quality_dimensions(self, df: pd.DataFrame) -> pd.DataFrame:
         """计算质量评估的各个维度评分"""
         
-        enhanced_df = df.copy()
-        
-        # 1. 置信度评分（直接使用）
-        enhanced_df['confidence_dimension'] = enhanced_df['confidence_score']
-        
-        # 2. 一致性评分（基于历史相似物料的分类一致性）
-        enhanced_df['consistency_dimension'] = enhanced_df.apply(
-            lambda row: self._calculate_consistency_score(row), axis=1
-        )
-        
-        # 3. 完整性评分（基于字段完整度）
-        enhanced_df['completeness_dimension'] = enhanced_df.apply(
-            lambda row: self._calculate_completeness_score(row), axis=1
+        enhanced_df = self._materialize_text_features(df.copy())
+        
+        # 随机扰动在核函数外生成，保持与逐行计算相同的抽样顺序
+        n_rows = len(enhanced_df)
+        consistency_noise = np.random.normal(0, 0.1, size=n_rows)
+        compliance_noise = np.random.normal(0, 0.1, size=n_rows)
+        
+        # 1-5. 置信度/一致性/完整性/准确性/合规性评分，合并为一次矩阵计算
+        enhanced_df[DIMENSION_COLUMNS] = self._fill_dimension_matrix(
+            enhanced_df['confidence_score'].to_numpy(dtype=np.float64),
+            enhanced_df['_has_category_kw'].to_numpy(dtype=bool),
+            self._fields_filled_matrix(enhanced_df),
+            enhanced_df['_name_matches_pred'].to_numpy(dtype=bool),
+            enhanced_df['_has_spec_marker'].to_numpy(dtype=bool),
+            consistency_noise,
+            compliance_noise
         )
         
-        # 4. 准确性评分（基于规则匹配）
-        enhanced_df['accuracy_dimension'] = enhanced_df.apply(
-            lambda row: self._calculate_accuracy_score(row), axis=1
-        )
+        # 6. 目标标签（用户反馈转换为二分类）
+        enhanced_df['quality_label'] = (enhanced_df['user_feedback'] == 'correct').astype(np.int8)
         
-        # 5. 合规性评分（基于行业标准）
-        enhanced_df['compliance_dimension'] = enhanced_df.apply(
-            lambda row: self._calculate_compliance_score(row), axis=1
+        return enhanced_df.drop(columns=TEXT_FEATURE_COLUMNS)
+    
+    def _materialize_text_features(self, df: pd.DataFrame) -> pd.DataFrame:
+        """一次性预计算各评分函数共用的小写文本和关键词掩码，避免逐行重复扫描"""
+        
+        df['_name_lc'] = df['material_name'].astype(str).str.lower()
+        df['_pred_lc'] = df['predicted_category'].astype(str).str.lower()
+        df['_has_category_kw'] = self._regex_mask(df['_name_lc'], CATEGORY_KEYWORD_RE)
+        df['_has_spec_marker'] = self._regex_mask(
+            df['specification'].astype(str), SPEC_STANDARD_MARKER_RE
         )
         
-        # 6. 目标标签（用户反馈转换为二分类）
-        enhanced_df['quality_label'] = enhanced_df['user_feedback'].apply(
-            lambda x: 1 if x == 'correct' else 0
-        )
+        # 名称与预测分类互相包含
+        df['_name_matches_pred'] = [
+            pred in name or name in pred
+            for name, pred in zip(df['_name_lc'], df['_pred_lc'])
+        ]
         
-        return enhanced_df
+        return df
     
-    def _calculate_consistency_score(self, row) -> float:
-        """计算一致性评分"""
-        # 模拟一致性计算（实际应该基于历史相似物料）
-        base_score = 0.8
+    @staticmethod
+    def _regex_mask(series: pd.Series, pattern: re.Pattern) -> np.ndarray:
+        """返回字符串列是否包含正则匹配的布尔掩码，可用时在PyArrow中执行"""
         
-        # 如果物料名称包含明确的类别词，一致性较高
-        name = row['material_name'].lower()
-        category_keywords = ['阀', '泵', '管', '轴承', '密封', '法兰', '螺栓']
+        if PYARROW_AVAILABLE:
+            arr = pa.array(series.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+            mask = pc.match_substring_regex(arr, pattern.pattern)
+            return pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
         
-        for keyword in category_keywords:
-            if keyword in name:
-                base_score += 0.1
-                break
-        
-        return min(base_score + np.random.normal(0, 0.1), 1.0)
+        return series.str.contains(pattern, na=False).to_numpy(dtype=bool)
     
-    def _calculate_completeness_score(self, row) -> float:
-        """计算完整性评分"""
-        score = 0.0
-        
-        # 检查关键字段完整性
-        if row['material_name'] and len(str(row['material_name']).strip()) > 2:
-            score += 0.4
-        if row['specification'] and len(str(row['specification']).strip()) > 2:
-            score += 0.3
-        if row['manufacturer'] and len(str(row['manufacturer']).strip()) > 2:
-            score += 0.2
-        if row['predicted_category'] and len(str(row['predicted_category']).strip()) > 1:
-            score += 0.1
-        
-        return min(score, 1.0)
+    def _fields_filled_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """完整性字段填充情况，返回 (N, 字段数) 布尔矩阵"""
+        
+        filled = np.zeros((len(df), len(COMPLETENESS_FIELDS)), dtype=bool)
+        for j, (field, min_len, _) in enumerate(COMPLETENESS_FIELDS):
+            filled[:, j] = df[field].fillna('').astype(str).str.strip().str.len().to_numpy() > min_len
+        
+        return filled
     
-    def _calculate_accuracy_score(self, row) -> float:
-        """计算准确性评分"""
-        # 基于分类置信度和名称匹配度
-        base_score = row['confidence_score'] * 0.6
+    @staticmethod
+    def _fill_dimension_matrix(confidence: np.ndarray, has_category_kw: np.ndarray,
+                               fields_filled: np.ndarray, name_matches_pred: np.ndarray,
+                               has_spec_marker: np.ndarray, consistency_noise: np.ndarray,
+                               compliance_noise: np.ndarray) -> np.ndarray:
+        """单次计算五个质量维度，返回 (N, 5) float32评分矩阵，列顺序同 DIMENSION_COLUMNS"""
         
-        # 名称与预测分类的匹配度
-        name = str(row['material_name']).lower()
-        pred_category = str(row['predicted_category']).lower()
+        dims = np.empty((len(confidence), len(DIMENSION_COLUMNS)), dtype=DIMENSION_DTYPE)
         
-        # 简单的匹配逻辑
-        if pred_category in name or name in pred_category:
-            base_score += 0.3
+        # 置信度评分（直接使用）
+        dims[:, 0] = confidence
         
-        return min(base_score + 0.1, 1.0)
-    
-    def _calculate_compliance_score(self, row) -> float:
-        """计算合规性评分"""
-        # 基于规格格式的标准化程度
-        spec = str(row['specification'])
+        # 一致性评分：名称包含明确类别词时较高（模拟，实际应基于历史相似物料）
+        dims[:, 1] = np.minimum(0.8 + 0.1 * has_category_kw + consistency_noise, 1.0)
+        
+        # 完整性评分：关键字段完整度加权
+        dims[:, 2] = np.minimum(fields_filled @ COMPLETENESS_WEIGHTS, 1.0)
         
-        score = 0.7  # 基础分
+        # 准确性评分：分类置信度和名称匹配度
+        dims[:, 3] = np.minimum(confidence * 0.6 + 0.3 * name_matches_pred + 0.1, 1.0)
         
-        # 检查是否包含标准规格格式
-        if any(pattern in spec for pattern in ['DN', 'PN', 'φ', 'M', '*']):
-            score += 0.2
+        # 合规性评分：规格格式的标准化程度
+        dims[:, 4] = np.minimum(0.7 + 0.2 * has_spec_marker + compliance_noise, 1.0)
         
-        return min(score + np.random.normal(0, 0.1), 1.0)
+        return dims
     
     def optimize_weights_optuna(self, training_data: pd.DataFrame, 
-                               n_trials: int = 100) -> Dict[str, float]:
-        """使用Optuna优化权重配置"""
+                               n_trials: int = 100, n_jobs: int = 1) -> Dict[str, float]:
+        """使用Optuna优化权重配置
+        
+        目标函数无状态（只读维度矩阵），n_jobs > 1 时可在多线程中并行执行试验
+        """
+        
+        # 维度矩阵和标签只提取一次，目标函数内不再经过字典/DataFrame
+        dimension_matrix = training_data[DIMENSION_COLUMNS].to_numpy()
+        labels = training_data['quality_label'].to_numpy()
         
         def objective(trial):
-            # 定义权重搜索空间
-            weights = {
-                'confidence_score': trial.suggest_float('confidence_score', 0.1, 0.5),
-                'consistency_score': trial.suggest_float('consistency_score', 0.1, 0.4),
-                'completeness_score': trial.suggest_float('completeness_score', 0.1, 0.3),
-                'accuracy_score': trial.suggest_float('accuracy_score', 0.05, 0.25),
-                'compliance_score': trial.suggest_float('compliance_score', 0.05, 0.2)
-            }
-            
-            # 归一化权重
-            total_weight = sum(weights.values())
-            normalized_weights = {k: v/total_weight for k, v in weights.items()}
-            
-            # 计算加权质量分数
-            quality_scores = self._calculate_weighted_quality_score(
-                training_data, normalized_weights
-            )
+            # 在搜索空间内采样权重并归一化
+            weights = np.array([
+                trial.suggest_float(name, low, high) for name, low, high in WEIGHT_SEARCH_SPACE
+            ], dtype=dimension_matrix.dtype)
+            weights /= weights.sum()
             
-            # 计算预测准确率
-            accuracy = self._evaluate_quality_prediction_accuracy(
-                quality_scores, training_data['quality_label']
-            )
-            
-            return accuracy
+            # 加权质量分数阈值二分类的准确率
+            predicted = (dimension_matrix @ weights) >= QUALITY_THRESHOLD
+            return float(np.mean(predicted == labels))
         
         # 运行优化
         study = optuna.create_study(direction='maximize')
-        study.optimize(objective, n_trials=n_trials)
+        study.optimize(objective, n_trials=n_trials, n_jobs=n_jobs)
         
         # 获取最优权重
         best_params = study.best_params
@@ -255,51 +308,12 @@ class QualityWeightOptimizer:
         
         return optimal_weights
     
-    def _calculate_weighted_quality_score(self, df: pd.DataFrame, 
-                                        weights: Dict[str, float]) -> np.ndarray:
-        """计算加权质量分数"""
-        
-        dimension_columns = [
-            'confidence_dimension', 'consistency_dimension', 'completeness_dimension',
-            'accuracy_dimension', 'compliance_dimension'
-        ]
-        
-        weight_values = [
-            weights['confidence_score'], weights['consistency_score'], 
-            weights['completeness_score'], weights['accuracy_score'], 
-            weights['compliance_score']
-        ]
-        
-        # 计算加权分数
-        weighted_scores = np.zeros(len(df))
-        for i, (col, weight) in enumerate(zip(dimension_columns, weight_values)):
-            weighted_scores += df[col].values * weight
-        
-        return weighted_scores
-    
-    def _evaluate_quality_prediction_accuracy(self, quality_scores: np.ndarray, 
-                                           true_labels: np.ndarray) -> float:
-        """评估质量预测准确率"""
-        
-        # 使用质量分数阈值进行二分类
-        threshold = 0.75  # 质量阈值
-        predicted_labels = (quality_scores >= threshold).astype(int)
-        
-        # 计算准确率
-        accuracy = accuracy_score(true_labels, predicted_labels)
-        return accuracy
-    
     def cross_validate_weights(self, training_data: pd.DataFrame, 
                              weights: Dict[str, float], cv_folds: int = 5) -> Dict[str, float]:
         """交叉验证权重配置的性能"""
         
         # 准备特征和标签
-        feature_columns = [
-            'confidence_dimension', 'consistency_dimension', 'completeness_dimension',
-            'accuracy_dimension', 'compliance_dimension'
-        ]
-        
-        X = training_data[feature_columns].values
+        X = training_data[DIMENSION_COLUMNS].values
         y = training_data['quality_label'].values
         
         # 应用权重
@@ -307,13 +321,18 @@ class QualityWeightOptimizer:
             weights['confidence_score'], weights['consistency_score'],
             weights['completeness_score'], weights['accuracy_score'],
             weights['compliance_score']
-        ])
+        ], dtype=X.dtype)
         
-        X_weighted = X * weight_vector
+        # 直接按加权分数阈值评估（与Optuna目标函数一致）。
+        # 注意：不要改回在 X * weight_vector 上训练线性分类器——线性模型会吸收
+        # 列缩放，权重对其准确率没有影响，交叉验证结果也就无法区分权重配置。
+        scores = X @ weight_vector
+        predicted = scores >= QUALITY_THRESHOLD
         
-        # 使用逻辑回归进行交叉验证
-        clf = LogisticRegression(random_state=42)
-        cv_scores = cross_val_score(clf, X_weighted, y, cv=cv_folds, scoring='accuracy')
+        cv_scores = np.array([
+            np.mean(predicted[test_idx] == y[test_idx])
+            for _, test_idx in KFold(n_splits=cv_folds).split(X)
+        ])
         
         return {
             'mean_accuracy': np.mean(cv_scores),
@@ -321,8 +340,8 @@ class QualityWeightOptimizer:
             'cv_scores': cv_scores.tolist()
         }
     
-    def run_weight_optimization(self) -> Dict[str, Any]:
-        """运行完整的权重优化流程"""
+    def run_weight_optimization(self, n_jobs: int = 1) -> Dict[str, Any]:
+        """运行完整的权重优化流程，n_jobs 为Optuna并行执行试验的线程数"""
         
         logger.info("开始权重优化流程")
         
@@ -342,7 +361,7 @@ class QualityWeightOptimizer:
         logger.info(f"基准性能: {baseline_performance['mean_accuracy']:.4f}")
         
         # 3. 运行权重优化
-        optimal_weights = self.optimize_weights_optuna(training_data, n_trials=50)
+        optimal_weights = self.optimize_weights_optuna(training_data, n_trials=50, n_jobs=n_jobs)
         
         # 4. 验证优化后的性能
         optimized_performance = self.cross_validate_weights(training_data, optimal_weights)
@@ -375,15 +394,23 @@ class QualityWeightOptimizer:
         
         return optimization_result
     
-    def _save_optimization_result(self, result: Dict[str, Any]):
-        """保存优化结果到数据库"""
+    @contextmanager
+    def _history_db(self) -> Iterator[sqlite3.Connection]:
+        """独占优化历史库连接，首次使用时建表并启用WAL"""
         
-        try:
-            conn = sqlite3.connect(self.training_db_path)
-            cursor = conn.cursor()
+        with self._history_lock:
+            yield self._get_history_conn()
+    
+    def _get_history_conn(self) -> sqlite3.Connection:
+        """获取优化历史库连接（须持有 _history_lock）"""
+        
+        if self._history_conn is None:
+            conn = sqlite3.connect(self.training_db_path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
             
             # 创建权重优化历史表
-            cursor.execute('''
+            conn.execute('''
             CREATE TABLE IF NOT EXISTS weight_optimization_history (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 weights_config TEXT,
@@ -395,23 +422,37 @@ class QualityWeightOptimizer:
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
             ''')
-            
-            # 保存优化记录
-            cursor.execute('''
-            INSERT INTO weight_optimization_history 
-            (weights_config, baseline_accuracy, optimized_accuracy, improvement, adopted, training_samples)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                json.dumps(result['optimal_weights'], ensure_ascii=False),
-                result['baseline_performance']['mean_accuracy'],
-                result['optimized_performance']['mean_accuracy'],
-                result['improvement'],
-                1 if result['adopted'] else 0,
-                result['training_samples']
-            ))
-            
             conn.commit()
-            conn.close()
+            
+            self._history_conn = conn
+        
+        return self._history_conn
+    
+    def _save_optimization_result(self, result: Dict[str, Any]):
+        """保存优化结果到数据库"""
+        
+        self._save_optimization_results([result])
+    
+    def _save_optimization_results(self, results: List[Dict[str, Any]]):
+        """批量保存优化结果，一次事务写入"""
+        
+        try:
+            with self._history_db() as conn, conn:
+                conn.executemany('''
+                INSERT INTO weight_optimization_history 
+                (weights_config, baseline_accuracy, optimized_accuracy, improvement, adopted, training_samples)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', [
+                    (
+                        json.dumps(result['optimal_weights'], ensure_ascii=False),
+                        result['baseline_performance']['mean_accuracy'],
+                        result['optimized_performance']['mean_accuracy'],
+                        result['improvement'],
+                        1 if result['adopted'] else 0,
+                        result['training_samples']
+                    )
+                    for result in results
+                ])
             
         except Exception as e:
             logger.error(f"保存优化结果失败: {e}")
@@ -420,15 +461,29 @@ class QualityWeightOptimizer:
         """获取权重优化历史"""
         
         try:
-            conn = sqlite3.connect(self.training_db_path)
-            df = pd.read_sql('''
-                SELECT * FROM weight_optimization_history 
-                ORDER BY created_at DESC LIMIT 20
-            ''', conn)
-            conn.close()
-            return df
+            with self._history_db() as conn:
+                return pd.read_sql_query('''
+                    SELECT * FROM weight_optimization_history 
+                    ORDER BY created_at DESC LIMIT 20
+                ''', conn,
+                    parse_dates=['created_at'],
+                    dtype=OPTIMIZATION_HISTORY_DTYPES)
         except:
             return pd.DataFrame()
+    
+    def close(self):
+        """关闭优化历史库连接"""
+        
+        with self._history_lock:
+            if self._history_conn is not None:
+                self._history_conn.close()
+                self._history_conn = None
+    
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
 # 使用示例和集成现有系统
 def integrate_with_existing_system():
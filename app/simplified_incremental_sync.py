@@ -7,17 +7,225 @@
 
 import logging
 import sqlite3
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Any, Optional, Tuple, Union
-from dataclasses import dataclass, asdict
-from datetime import datetime, timedelta
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple, Union
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+import atexit
 import hashlib
+import itertools
 import json
+import os
+import sys
+import weakref
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import lru_cache
+from operator import attrgetter
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from ulid import ULID
+    ULID_AVAILABLE = True
+except ImportError:
+    ULID_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# 单条 IN (...) 查询的参数上限（SQLite 默认限制为 999）
+SQLITE_IN_CHUNK_SIZE = 900
+
+# 同步历史缓冲写入间隔（秒）
+HISTORY_FLUSH_INTERVAL_SECONDS = 5
+
+# 冲突窗口：两端修改时间相差不超过该秒数且内容不同，视为冲突
+CONFLICT_WINDOW_SECONDS = 300
+
+# 每个数据源在内存中缓存的已同步内容指纹上限
+KNOWN_HASH_CACHE_LIMIT = 500000
+
+# 参与内容哈希计算的关键字段及拼接分隔符
+CONTENT_HASH_FIELDS = [
+    'material_name', 'specification', 'manufacturer',
+    'material_type', 'unit', 'category'
+]
+CONTENT_HASH_SEPARATOR = '\x1f'
+
+# 取值须为正整数的同步配置项
+POSITIVE_INT_CONFIG_KEYS = (
+    'batch_size', 'max_conflicts_per_batch', 'sync_interval_minutes',
+    'retention_days', 'hash_workers'
+)
+
+# 连接的预编译语句缓存容量（默认128）
+SQLITE_CACHED_STATEMENTS = 256
+
+# SQLite 3.24+ 支持 UPSERT（ON CONFLICT DO UPDATE），旧版本退回 INSERT OR REPLACE
+SQLITE_SUPPORTS_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+# 写入同步历史
+_INSERT_HISTORY_SQL = '''
+INSERT OR REPLACE INTO sync_history (
+    sync_id, source_system, sync_type, total_records,
+    new_records, updated_records, conflicts, errors,
+    processing_time, started_at, completed_at, status, error_details
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# 按数据源和物料编码读取完整同步记录（原始数据取自 sync_record_payloads，旧记录取自 raw_data 列）
+_SELECT_SYNC_RECORD_SQL = '''
+SELECT r.record_id, r.source_system, r.material_code, r.content_hash,
+       r.last_modified, r.sync_timestamp, r.sync_status, r.version,
+       COALESCE(p.raw_data, r.raw_data)
+FROM sync_records r
+LEFT JOIN sync_record_payloads p
+       ON p.source_system = r.source_system AND p.material_code = r.material_code
+WHERE r.source_system = ? AND r.material_code = ?
+'''
+
+# 保存记录的原始数据（与同步记录分表存放，仅在冲突时按需读取）
+_SAVE_PAYLOAD_SQL = '''
+INSERT OR REPLACE INTO sync_record_payloads (source_system, material_code, raw_data)
+VALUES (?, ?, ?)
+'''
+
+# 按 (source_system, material_code) 原地更新同步记录，哈希未变时不写入
+_UPSERT_SYNC_SQL = '''
+INSERT INTO sync_records (
+    record_id, source_system, material_code, content_hash,
+    last_modified, sync_timestamp, sync_status, version
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(source_system, material_code) DO UPDATE SET
+    content_hash = excluded.content_hash,
+    last_modified = excluded.last_modified,
+    sync_timestamp = excluded.sync_timestamp,
+    sync_status = excluded.sync_status,
+    version = excluded.version,
+    raw_data = NULL,
+    updated_at = CURRENT_TIMESTAMP
+WHERE sync_records.content_hash != excluded.content_hash
+'''
+
+# SQLite 3.24 以下不支持 UPSERT 时的替代写法
+_REPLACE_SYNC_SQL = '''
+INSERT OR REPLACE INTO sync_records (
+    record_id, source_system, material_code, content_hash,
+    last_modified, sync_timestamp, sync_status, version
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# 改写同步记录的内容哈希
+_REWRITE_HASH_SQL = '''
+UPDATE sync_records SET content_hash = ?
+WHERE source_system = ? AND material_code = ?
+'''
+
+# 写入冲突记录
+_INSERT_CONFLICT_SQL = '''
+INSERT INTO sync_conflicts (
+    conflict_id, material_code, conflict_type, conflicting_sources,
+    resolution_strategy, resolved, conflict_data,
+    local_record_id, remote_record_ids
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# 将冲突胜出记录写入主库
+_APPLY_MAIN_RECORD_SQL = '''
+INSERT OR REPLACE INTO main.material_categories (
+    material_name, category, specification, manufacturer,
+    material_type, unit, last_updated, source_system
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# 标记冲突已解决（同步库以 sync 挂载在主库连接上）
+_MARK_CONFLICT_RESOLVED_SQL = '''
+UPDATE sync.sync_conflicts 
+SET resolved = TRUE, resolver = ?, resolved_at = ?
+WHERE material_code = ? AND resolved = FALSE
+'''
+
+# 按冲突ID标记人工解决结果
+_MARK_CONFLICT_RESOLVED_BY_ID_SQL = '''
+UPDATE sync.sync_conflicts 
+SET resolved = TRUE, resolver = ?, resolved_at = ?
+WHERE conflict_id = ? AND resolved = FALSE
+'''
+
+# 按物料编码批量读取哈希/时间/版本（IN 参数个数不同，语句分别缓存）
+_SELECT_EXISTING_SQL = '''
+SELECT material_code, content_hash, last_modified, version
+FROM sync_records
+WHERE source_system = ? AND material_code IN ({placeholders})
+'''
+
+@lru_cache(maxsize=64)
+def _select_existing_sql(param_count: int) -> str:
+    """生成并缓存指定参数个数的批量查询语句，保证相同语句复用同一字符串"""
+    
+    return _SELECT_EXISTING_SQL.format(placeholders=','.join('?' * param_count))
+
+# Python 3.10+ 的 dataclass 支持 __slots__，旧版本退回普通实例
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+def _chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """将任意可迭代对象按固定大小切分为列表，逐块产出"""
+    
+    iterator = iter(iterable)
+    return iter(lambda: list(itertools.islice(iterator, size)), [])
+
+def _json_default(obj: Any) -> Any:
+    """标准库json的兜底转换，与orjson的输出保持一致（时间为ISO格式，枚举取值）"""
+    
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    return str(obj)
+
+def _json_dumps(obj: Any) -> str:
+    """序列化为JSON文本（优先使用orjson，无法识别的类型按str处理）"""
+    
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, default=_json_default, ensure_ascii=False)
+
+def _json_loads(text: str) -> Any:
+    """解析JSON文本"""
+    
+    if ORJSON_AVAILABLE:
+        return orjson.loads(text)
+    return json.loads(text)
+
+_id_sequence = itertools.count()
+
+def new_sync_id(prefix: str) -> str:
+    """生成按时间排序且不重复的ID（有python-ulid时使用ULID，否则为纳秒时间戳+进程内序号）"""
+    if ULID_AVAILABLE:
+        return f"{prefix}_{ULID()}"
+    return f"{prefix}_{time.time_ns():016x}{next(_id_sequence) & 0xffff:04x}"
+
+def _flush_history_at_exit(sync_ref: 'weakref.ref'):
+    """进程退出时写入尚未落库的同步历史（弱引用，不阻止实例回收）"""
+    
+    sync_system = sync_ref()
+    if sync_system is not None:
+        sync_system.flush_history()
+
 class SyncStatus(Enum):
     """同步状态枚举"""
     PENDING = "pending"
@@ -33,7 +241,7 @@ class ConflictResolution(Enum):
     MANUAL_REVIEW = "manual_review"
     MERGE_FIELDS = "merge_fields"
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class SyncRecord:
     """同步记录"""
     record_id: str
@@ -45,8 +253,24 @@ class SyncRecord:
     sync_status: SyncStatus
     version: int
     raw_data: Dict[str, Any]
+    source_id: int = 99         # 数据源优先级（数字越小优先级越高），构造时确定
+    
+    def to_snapshot(self) -> Dict[str, Any]:
+        """转换为可持久化的快照（时间为ISO格式、状态取枚举值，与JSON库无关）"""
+        return {
+            'record_id': self.record_id,
+            'source_system': self.source_system,
+            'material_code': self.material_code,
+            'content_hash': self.content_hash,
+            'last_modified': self.last_modified.isoformat(),
+            'sync_timestamp': self.sync_timestamp.isoformat(),
+            'sync_status': self.sync_status.value,
+            'version': self.version,
+            'raw_data': self.raw_data,
+            'source_id': self.source_id
+        }
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class SyncConflict:
     """同步冲突"""
     material_code: str
@@ -57,7 +281,7 @@ class SyncConflict:
     resolution_strategy: ConflictResolution
     resolved: bool = False
 
-@dataclass 
+@dataclass(**_DATACLASS_SLOTS)
 class SyncResult:
     """同步结果"""
     total_records: int
@@ -67,6 +291,19 @@ class SyncResult:
     errors: int
     processing_time: float
     sync_timestamp: datetime
+    sync_id: str = ''
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典（字段均为标量，不需要 asdict 的递归复制）"""
+        return {
+            'total_records': self.total_records,
+            'new_records': self.new_records,
+            'updated_records': self.updated_records,
+            'conflicts': self.conflicts,
+            'errors': self.errors,
+            'processing_time': self.processing_time,
+            'sync_timestamp': self.sync_timestamp
+        }
 
 class SimplifiedIncrementalSync:
     """简化增量同步系统"""
@@ -94,21 +331,212 @@ class SimplifiedIncrementalSync:
             'conflict_resolution_strategy': ConflictResolution.LATEST_WINS,
             'enable_auto_resolution': True,
             'sync_interval_minutes': 30,
-            'retention_days': 90
+            'retention_days': 90,
+            'hash_workers': min(os.cpu_count() or 1, 8)
         }
         
+        # 配置版本：修改 sync_config 或 source_priority 后递增，update_config 据此拒绝过期的修改
+        self.sync_config_version = 0
+        self._config_lock = threading.Lock()
+        
         # 初始化同步数据库
         self._init_sync_database()
         
+        # 同步库持久连接：自动提交模式，由同步流程显式控制事务
+        self._conn = self._connect_sync_db()
+        self._conn_lock = threading.RLock()
+        
+        # 单独的只读连接，通过 PRAGMA data_version 感知任何连接（含其他进程）的提交
+        self._version_conn = self._connect_sync_db()
+        self._version_lock = threading.Lock()
+        self._instance_token = os.urandom(4).hex()
+        
+        # 已提交的内容指纹：source_system -> {material_code: content_hash}
+        # 与同步库保持一致，命中即可跳过该行的数据库查询与比较
+        self._known_hashes: Dict[str, Dict[str, str]] = {}
+        self._pending_known_hashes: Dict[str, str] = {}
+        # 缓存对应的同步库 data_version（本连接的提交不改变它），其他连接写入后缓存作废
+        self._known_hashes_version: Optional[int] = None
+        
+        # 主数据库表结构缓存，DDL变更后调用 refresh_schema() 刷新
+        self._main_tables: frozenset = frozenset()
+        self.refresh_schema()
+        
+        # 同步历史先写入内存缓冲，定时或退出时批量落库
+        self._history_buf: List[Tuple] = []
+        self._history_lock = threading.Lock()
+        # 累计写入缓冲的历史条数，只增不减，计入版本标识
+        self._history_seq = 0
+        self._history_timer: Optional[threading.Timer] = None
+        atexit.register(_flush_history_at_exit, weakref.ref(self))
+        
         logger.info("简化增量同步系统初始化完成")
     
+    def _connect_sync_db(self) -> sqlite3.Connection:
+        """创建同步库连接并应用写入优化参数"""
+        
+        conn = sqlite3.connect(self.sync_db_path, isolation_level=None,
+                               check_same_thread=False,
+                               cached_statements=SQLITE_CACHED_STATEMENTS)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-65536')
+        conn.execute('PRAGMA mmap_size=268435456')
+        # 批量写入时减少检查点次数（默认每1000页一次）
+        conn.execute('PRAGMA wal_autocheckpoint=10000')
+        return conn
+    
+    def refresh_schema(self):
+        """重新读取主数据库中的表名"""
+        
+        conn = sqlite3.connect(self.main_db_path)
+        try:
+            self._main_tables = frozenset(
+                row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            )
+        finally:
+            conn.close()
+    
+    def _has_main_table(self, conn: sqlite3.Connection, table_name: str) -> bool:
+        """主数据库中是否存在该表（缓存中没有时重新查询，表可能在启动后才创建）"""
+        
+        if table_name in self._main_tables:
+            return True
+        
+        row = conn.execute(
+            "SELECT 1 FROM main.sqlite_master WHERE type='table' AND name = ?", (table_name,)
+        ).fetchone()
+        if row is None:
+            return False
+        
+        self._main_tables = self._main_tables | {table_name}
+        return True
+    
+    def close(self):
+        """写入缓冲的同步历史并关闭同步库连接"""
+        
+        with self._history_lock:
+            if self._history_timer is not None:
+                self._history_timer.cancel()
+                self._history_timer = None
+        
+        self.flush_history()
+        
+        with self._conn_lock:
+            self._conn.close()
+        with self._version_lock:
+            self._version_conn.close()
+    
+    @staticmethod
+    def _validated_config(sync_config: Optional[Dict[str, Any]],
+                          source_priority: Optional[Dict[str, int]]) -> Dict[str, Any]:
+        """校验待更新的配置，返回规范化后的 sync_config（策略转换为枚举），不合法时抛出 ValueError"""
+        
+        if sync_config is not None and not isinstance(sync_config, dict):
+            raise ValueError('sync_config必须是对象')
+        if source_priority is not None and not isinstance(source_priority, dict):
+            raise ValueError('source_priority必须是对象')
+        
+        config = dict(sync_config or {})
+        for key in POSITIVE_INT_CONFIG_KEYS:
+            if key in config:
+                value = config[key]
+                if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                    raise ValueError(f'{key}必须是正整数')
+        
+        if 'enable_auto_resolution' in config and not isinstance(config['enable_auto_resolution'], bool):
+            raise ValueError('enable_auto_resolution必须是布尔值')
+        
+        if 'conflict_resolution_strategy' in config:
+            strategy = config['conflict_resolution_strategy']
+            try:
+                config['conflict_resolution_strategy'] = ConflictResolution(strategy)
+            except ValueError:
+                supported = ', '.join(res.value for res in ConflictResolution)
+                raise ValueError(f'conflict_resolution_strategy必须是以下之一: {supported}') from None
+        
+        for source_system, priority in (source_priority or {}).items():
+            if not isinstance(priority, int) or isinstance(priority, bool):
+                raise ValueError(f'数据源 {source_system} 的优先级必须是整数')
+        
+        return config
+    
+    def update_config(self, expected_version: int,
+                      sync_config: Optional[Dict[str, Any]] = None,
+                      source_priority: Optional[Dict[str, int]] = None) -> Optional[int]:
+        """按版本号更新配置，返回新版本；expected_version 不是当前版本时不做修改并返回None
+        
+        配置值不合法时抛出 ValueError，不做任何修改。
+        """
+        
+        sync_config = self._validated_config(sync_config, source_priority)
+        
+        with self._config_lock:
+            if expected_version != self.sync_config_version:
+                return None
+            
+            if sync_config:
+                self.sync_config.update(sync_config)
+            if source_priority:
+                self.source_priority.update(source_priority)
+            
+            self.sync_config_version += 1
+            return self.sync_config_version
+    
+    @property
+    def version(self) -> str:
+        """同步数据与配置的版本标识，同步库有提交或配置修改后改变（可用作ETag）
+        
+        包含实例标识，不同进程的实例不会得到相同的版本。
+        只读取版本信息，不写数据库：缓冲中尚未落库的历史由累计条数体现，
+        读取历史的查询自行先落库。
+        """
+        
+        with self._version_lock:
+            data_version = self._version_conn.execute('PRAGMA data_version').fetchone()[0]
+        
+        return (f"{self._instance_token}.{data_version}."
+                f"{self._history_seq}.{self.sync_config_version}")
+    
+    def flush_history(self):
+        """将缓冲的同步历史在一个事务中写入数据库"""
+        
+        with self._history_lock:
+            rows, self._history_buf = self._history_buf, []
+            self._history_timer = None
+        
+        if not rows:
+            return
+        
+        with self._conn_lock:
+            # 同一线程在同步事务内调用时并入当前事务
+            own_transaction = not self._conn.in_transaction
+            try:
+                if own_transaction:
+                    self._conn.execute('BEGIN IMMEDIATE')
+                
+                self._conn.executemany(_INSERT_HISTORY_SQL, rows)
+                
+                if own_transaction:
+                    self._conn.execute('COMMIT')
+                    
+            except Exception as e:
+                if own_transaction and self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                logger.error(f"写入同步历史失败: {e}")
+    
     def _init_sync_database(self):
         """初始化同步跟踪数据库"""
         
-        conn = sqlite3.connect(self.sync_db_path)
+        conn = sqlite3.connect(self.sync_db_path, isolation_level=None)
         cursor = conn.cursor()
         
         try:
+            # 页大小只对尚未写入的新库生效，必须在建表之前设置
+            cursor.execute('PRAGMA page_size=8192')
+            cursor.execute('BEGIN IMMEDIATE')
+            
             # 同步记录表
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS sync_records (
@@ -126,6 +554,16 @@ class SimplifiedIncrementalSync:
                 UNIQUE(source_system, material_code)
             )''')
             
+            # 同步记录的原始数据：sync_records 只保留哈希等比较用的列，
+            # 原始数据单独存放，冲突审核与解决时按 (数据源, 物料编码) 读取
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_record_payloads (
+                source_system TEXT NOT NULL,
+                material_code TEXT NOT NULL,
+                raw_data TEXT,
+                PRIMARY KEY (source_system, material_code)
+            )''')
+            
             # 同步冲突表
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS sync_conflicts (
@@ -138,9 +576,17 @@ class SimplifiedIncrementalSync:
                 resolver TEXT,
                 resolved_at TIMESTAMP,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                conflict_data TEXT
+                conflict_data TEXT,
+                local_record_id TEXT,
+                remote_record_ids TEXT
             )''')
             
+            # 旧版本创建的冲突表补充记录指针列
+            conflict_columns = {row[1] for row in cursor.execute('PRAGMA table_info(sync_conflicts)')}
+            for column in ('local_record_id', 'remote_record_ids'):
+                if column not in conflict_columns:
+                    cursor.execute(f'ALTER TABLE sync_conflicts ADD COLUMN {column} TEXT')
+            
             # 同步历史表
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS sync_history (
@@ -161,84 +607,120 @@ class SimplifiedIncrementalSync:
             
             # 创建索引
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_records_material ON sync_records(material_code)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_records_source ON sync_records(source_system)')
+            # 覆盖索引：按数据源+物料编码查询哈希/时间/版本时无需回表；其前缀可替代单列的数据源索引
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sync_records_cover ON sync_records(
+                source_system, material_code, content_hash, last_modified, version
+            )''')
+            cursor.execute('DROP INDEX IF EXISTS idx_sync_records_source')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_records_timestamp ON sync_records(sync_timestamp)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_conflicts_material ON sync_conflicts(material_code)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_source ON sync_history(source_system)')
             
-            conn.commit()
+            cursor.execute('COMMIT')
+            
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute('ROLLBACK')
+            raise
             
         finally:
             conn.close()
     
     def sync_from_source(self, source_system: str, 
-                        source_data: List[Dict[str, Any]],
+                        source_data: Iterable[Dict[str, Any]],
                         sync_type: str = 'incremental') -> SyncResult:
-        """从指定数据源同步数据"""
+        """从指定数据源同步数据（source_data 可为列表或生成器，按批次流式处理）"""
         
-        start_time = time.time()
-        logger.info(f"开始从 {source_system} 同步 {len(source_data)} 条记录")
+        result = self.sync_from_sources([(source_system, source_data)], sync_type)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def sync_from_sources(self, sources: Iterable[Tuple[str, Iterable[Dict[str, Any]]]],
+                          sync_type: str = 'batch') -> List[Union[SyncResult, Exception]]:
+        """在一个事务中依次同步多个数据源
         
-        # 生成同步ID
-        sync_id = f"SYNC_{source_system}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        每个数据源使用一个保存点，失败时只回滚该数据源；全部处理完后统一提交一次。
+        返回与 sources 顺序一致的结果列表，失败的数据源对应其异常对象。
+        """
         
-        try:
-            # 初始化统计计数
-            stats = {
-                'total_records': len(source_data),
-                'new_records': 0,
-                'updated_records': 0,
-                'conflicts': 0,
-                'errors': 0
-            }
-            
-            conflicts = []
-            
-            # 获取现有同步记录
-            existing_records = self._get_existing_sync_records(source_system)
-            existing_lookup = {rec.material_code: rec for rec in existing_records}
-            
-            # 批量处理数据
-            for batch_start in range(0, len(source_data), self.sync_config['batch_size']):
-                batch_end = min(batch_start + self.sync_config['batch_size'], len(source_data))
-                batch_data = source_data[batch_start:batch_end]
+        outcomes: List[Union[Dict[str, Any], Exception]] = []
+        succeeded: List[Tuple[str, Dict[str, str]]] = []  # (数据源, 待确认的指纹)
+        conflicts: List[SyncConflict] = []
+        
+        with self._conn_lock:
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._invalidate_stale_known_hashes()
                 
-                batch_result = self._process_sync_batch(
-                    source_system, batch_data, existing_lookup, sync_id
-                )
+                for source_system, source_data in sources:
+                    outcome = self._sync_source_in_transaction(
+                        source_system, source_data, sync_type, conflicts
+                    )
+                    outcomes.append(outcome)
+                    if not isinstance(outcome, Exception):
+                        succeeded.append((source_system, self._pending_known_hashes))
                 
-                # 累积统计
-                stats['new_records'] += batch_result['new_records']
-                stats['updated_records'] += batch_result['updated_records']
-                stats['conflicts'] += batch_result['conflicts']
-                stats['errors'] += batch_result['errors']
-                conflicts.extend(batch_result['conflicts_list'])
-            
-            processing_time = time.time() - start_time
-            
-            # 记录同步历史
-            self._record_sync_history(
-                sync_id, source_system, sync_type, stats, 
-                processing_time, 'completed'
-            )
-            
-            # 处理冲突（如果启用自动解决）
-            if self.sync_config['enable_auto_resolution'] and conflicts:
-                self._auto_resolve_conflicts(conflicts)
+                self._conn.execute('COMMIT')
+                
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                raise
             
-            logger.info(f"同步完成: {stats}")
+            finally:
+                self._pending_known_hashes = {}
             
-            return SyncResult(
-                total_records=stats['total_records'],
-                new_records=stats['new_records'],
-                updated_records=stats['updated_records'],
-                conflicts=stats['conflicts'],
-                errors=stats['errors'],
-                processing_time=processing_time,
-                sync_timestamp=datetime.now()
-            )
+            for source_system, pending_hashes in succeeded:
+                self._pending_known_hashes = pending_hashes
+                self._commit_known_hashes(source_system)
+        
+        # 处理冲突（如果启用自动解决）
+        if self.sync_config['enable_auto_resolution'] and conflicts:
+            self._auto_resolve_conflicts(conflicts)
+        
+        sync_timestamp = datetime.now()
+        return [
+            outcome if isinstance(outcome, Exception)
+            else SyncResult(sync_timestamp=sync_timestamp, **outcome)
+            for outcome in outcomes
+        ]
+    
+    def _sync_source_in_transaction(self, source_system: str,
+                                    source_data: Iterable[Dict[str, Any]],
+                                    sync_type: str,
+                                    conflicts: List[SyncConflict]) -> Union[Dict[str, Any], Exception]:
+        """在当前事务的保存点内同步单个数据源，返回统计结果或失败异常"""
+        
+        start_time = time.time()
+        logger.info(f"开始从 {source_system} 同步数据")
+        
+        # 生成同步ID
+        sync_id = new_sync_id(f"SYNC_{source_system}")
+        
+        # 初始化统计计数
+        stats = {
+            'total_records': 0,
+            'new_records': 0,
+            'updated_records': 0,
+            'conflicts': 0,
+            'errors': 0
+        }
+        
+        source_conflicts = []
+        self._pending_known_hashes = {}
+        self._conn.execute('SAVEPOINT source_sync')
+        
+        try:
+            self._sync_batches(source_system, source_data, sync_id, stats, source_conflicts)
+            self._conn.execute('RELEASE source_sync')
             
         except Exception as e:
+            self._conn.execute('ROLLBACK TO source_sync')
+            self._conn.execute('RELEASE source_sync')
+            self._pending_known_hashes = {}
+            
             # 记录失败的同步历史
             processing_time = time.time() - start_time
             self._record_sync_history(
@@ -247,45 +729,173 @@ class SimplifiedIncrementalSync:
             )
             
             logger.error(f"同步失败: {e}")
-            raise
+            return e
+        
+        processing_time = time.time() - start_time
+        
+        # 记录同步历史
+        self._record_sync_history(
+            sync_id, source_system, sync_type, stats, 
+            processing_time, 'completed'
+        )
+        
+        conflicts.extend(source_conflicts)
+        logger.info(f"同步完成: {stats}")
+        
+        return dict(stats, processing_time=processing_time, sync_id=sync_id)
     
-    def _get_existing_sync_records(self, source_system: str) -> List[SyncRecord]:
-        """获取现有的同步记录"""
+    def _sync_batches(self, source_system: str, source_data: Iterable[Dict[str, Any]],
+                      sync_id: str, stats: Dict[str, int], conflicts: List[SyncConflict]):
+        """分批处理同步数据，累积统计和冲突"""
         
-        conn = sqlite3.connect(self.sync_db_path)
+        batches = _chunked(source_data, self.sync_config['batch_size'])
         
+        # 哈希计算在线程池中提前进行，当前线程作为唯一写入者按顺序处理各批次
+        hashed_batches = self._iter_hashed_batches(batches)
         try:
-            query = '''
-            SELECT record_id, source_system, material_code, content_hash,
-                   last_modified, sync_timestamp, sync_status, version, raw_data
-            FROM sync_records
-            WHERE source_system = ?
-            '''
-            
-            df = pd.read_sql(query, conn, params=[source_system])
-            
-            records = []
-            for _, row in df.iterrows():
-                records.append(SyncRecord(
-                    record_id=row['record_id'],
-                    source_system=row['source_system'],
-                    material_code=row['material_code'],
-                    content_hash=row['content_hash'],
-                    last_modified=pd.to_datetime(row['last_modified']),
-                    sync_timestamp=pd.to_datetime(row['sync_timestamp']),
-                    sync_status=SyncStatus(row['sync_status']),
-                    version=row['version'],
-                    raw_data=json.loads(row['raw_data']) if row['raw_data'] else {}
-                ))
+            for batch_data, content_hashes in hashed_batches:
+                self._sync_hashed_batch(
+                    source_system, batch_data, content_hashes, sync_id, stats, conflicts
+                )
+        finally:
+            hashed_batches.close()
+    
+    def _iter_hashed_batches(self, batches: Iterator[List[Dict[str, Any]]]
+                             ) -> Iterator[Tuple[List[Dict[str, Any]], List[str]]]:
+        """按顺序产出 (批次数据, 内容哈希)，哈希计算最多提前 2×工作线程数 个批次"""
+        
+        workers = self.sync_config.get('hash_workers', 1)
+        
+        if workers <= 1:
+            for batch_data in batches:
+                yield batch_data, self._calculate_content_hashes_batch(batch_data)
+            return
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for batch_data in batches:
+                pending.append(
+                    (batch_data, executor.submit(self._calculate_content_hashes_batch, batch_data))
+                )
+                if len(pending) >= workers * 2:
+                    ready_data, future = pending.popleft()
+                    yield ready_data, future.result()
             
-            return records
+            while pending:
+                ready_data, future = pending.popleft()
+                yield ready_data, future.result()
+    
+    def _sync_hashed_batch(self, source_system: str, batch_data: List[Dict[str, Any]],
+                           content_hashes: List[str], sync_id: str,
+                           stats: Dict[str, int], conflicts: List[SyncConflict]):
+        """处理一个已计算哈希的批次：跳过指纹未变的行，其余比对后写入"""
+        
+        stats['total_records'] += len(batch_data)
+        
+        # 跳过指纹与已提交记录一致的行
+        known = self._known_hashes.get(source_system, {})
+        
+        pending_data = []
+        pending_hashes = []
+        for data, content_hash in zip(batch_data, content_hashes):
+            material_code = data.get('material_code')
+            if material_code and known.get(material_code) == content_hash:
+                continue
+            pending_data.append(data)
+            pending_hashes.append(content_hash)
+        
+        # 只加载剩余物料的现有同步状态
+        codes = [data.get('material_code') for data in pending_data if data.get('material_code')]
+        existing_lookup = self._load_existing_for_codes(source_system, codes)
+        
+        batch_result = self._process_sync_batch(
+            source_system, pending_data, existing_lookup, sync_id, pending_hashes
+        )
+        
+        # 累积统计
+        stats['new_records'] += batch_result['new_records']
+        stats['updated_records'] += batch_result['updated_records']
+        stats['conflicts'] += batch_result['conflicts']
+        stats['errors'] += batch_result['errors']
+        conflicts.extend(batch_result['conflicts_list'])
+    
+    def _invalidate_stale_known_hashes(self):
+        """其他连接（含其他进程）提交过写入时清空指纹缓存（须在写事务内调用）"""
+        
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self._known_hashes_version:
+            self._known_hashes.clear()
+            self._known_hashes_version = data_version
+    
+    def _commit_known_hashes(self, source_system: str):
+        """事务提交后将本次同步确认的指纹并入缓存"""
+        
+        known = self._known_hashes.setdefault(source_system, {})
+        for material_code, content_hash in self._pending_known_hashes.items():
+            # 已缓存的物料必须更新，避免缓存与数据库不一致；新物料受上限约束
+            if material_code in known or len(known) < KNOWN_HASH_CACHE_LIMIT:
+                known[material_code] = content_hash
+        
+        self._pending_known_hashes = {}
+    
+    def _load_existing_for_codes(self, source_system: str,
+                                 codes: List[str]) -> Dict[str, Tuple[str, datetime, int]]:
+        """获取指定物料的现有同步状态：material_code -> (content_hash, last_modified, version)"""
+        
+        existing = {}
+        unique_codes = list(dict.fromkeys(codes))
+        
+        for chunk_start in range(0, len(unique_codes), SQLITE_IN_CHUNK_SIZE):
+            chunk = unique_codes[chunk_start:chunk_start + SQLITE_IN_CHUNK_SIZE]
+            rows = self._conn.execute(
+                _select_existing_sql(len(chunk)), [source_system] + chunk
+            ).fetchall()
             
-        finally:
-            conn.close()
+            for material_code, content_hash, last_modified, version in rows:
+                existing[material_code] = (
+                    content_hash, self._parse_stored_timestamp(last_modified), version
+                )
+        
+        return existing
+    
+    def _load_sync_record(self, source_system: str, material_code: str) -> Optional[SyncRecord]:
+        """按需加载完整的同步记录（仅在产生冲突时使用）"""
+        
+        row = self._conn.execute(_SELECT_SYNC_RECORD_SQL, (source_system, material_code)).fetchone()
+        
+        if row is None:
+            return None
+        
+        return SyncRecord(
+            record_id=row[0],
+            source_system=row[1],
+            material_code=row[2],
+            content_hash=row[3],
+            last_modified=self._parse_stored_timestamp(row[4]),
+            sync_timestamp=self._parse_stored_timestamp(row[5]),
+            sync_status=SyncStatus(row[6]),
+            version=row[7],
+            raw_data=_json_loads(row[8]) if row[8] else {},
+            source_id=self._source_id(row[1])
+        )
+    
+    def _source_id(self, source_system: str) -> int:
+        """数据源优先级编号（source_priority 可通过配置接口修改，因此不做长期缓存）"""
+        
+        return self.source_priority.get(source_system, 99)
+    
+    @staticmethod
+    def _parse_stored_timestamp(value: str) -> datetime:
+        """解析同步库中以isoformat保存的时间"""
+        
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return pd.to_datetime(value)
     
     def _process_sync_batch(self, source_system: str, batch_data: List[Dict[str, Any]],
-                           existing_lookup: Dict[str, SyncRecord], 
-                           sync_id: str) -> Dict[str, Any]:
+                           existing_lookup: Dict[str, Tuple[str, datetime, int]], 
+                           sync_id: str, content_hashes: List[str]) -> Dict[str, Any]:
         """处理同步批次"""
         
         batch_stats = {
@@ -298,82 +908,162 @@ class SimplifiedIncrementalSync:
         
         new_records = []
         updated_records = []
+        rehashed = []
+        known_hashes = self._pending_known_hashes
         
-        for material_data in batch_data:
+        # 逐行提取物料编码与修改时间，整理为并行数组
+        staged = []
+        for material_data, content_hash in zip(batch_data, content_hashes):
             try:
                 material_code = material_data.get('material_code', '')
                 if not material_code:
                     batch_stats['errors'] += 1
                     continue
                 
-                # 计算内容哈希
-                content_hash = self._calculate_content_hash(material_data)
-                
                 # 获取最后修改时间
                 last_modified = self._extract_last_modified(material_data)
+                staged.append((material_data, material_code, content_hash, last_modified))
+                
+            except Exception as e:
+                logger.error(f"处理物料 {material_data.get('material_code', 'unknown')} 失败: {e}")
+                batch_stats['errors'] += 1
+        
+        if staged:
+            existing = [existing_lookup.get(row[1]) for row in staged]
+            hash_new = np.array([row[2] for row in staged], dtype=object)
+            hash_old = np.array([rec[0] if rec else None for rec in existing], dtype=object)
+            
+            # 整批判定：新记录 / 哈希变化 / 未变化
+            new_mask = np.array([rec is None for rec in existing], dtype=bool)
+            changed_mask = ~new_mask & (hash_new != hash_old)
+            
+            # 旧格式哈希且内容未变，仅改写为新格式哈希
+            for idx in np.flatnonzero(changed_mask):
+                material_data, material_code, content_hash, _ = staged[idx]
+                if self._is_legacy_content_hash(hash_old[idx], material_data):
+                    rehashed.append((content_hash, source_system, material_code))
+                    changed_mask[idx] = False
+            
+            # 哈希变化的行比较时间戳，区分冲突与正常更新
+            conflict_mask = np.zeros(len(staged), dtype=bool)
+            error_mask = np.zeros(len(staged), dtype=bool)
+            changed_idx = np.flatnonzero(changed_mask)
+            if len(changed_idx):
+                new_ns, new_aware = self._to_epoch_ns([staged[i][3] for i in changed_idx])
+                old_ns, old_aware = self._to_epoch_ns([existing[i][1] for i in changed_idx])
                 
-                # 创建同步记录
-                sync_record = SyncRecord(
-                    record_id=f"{source_system}_{material_code}_{int(time.time())}",
+                # 带时区与不带时区的时间无法比较，按处理失败计
+                comparable = new_aware == old_aware
+                error_mask[changed_idx] = ~comparable
+                conflict_mask[changed_idx] = comparable & (
+                    np.abs(new_ns - old_ns) <= CONFLICT_WINDOW_SECONDS * 1_000_000_000
+                )
+            update_mask = changed_mask & ~conflict_mask & ~error_mask
+            
+            sync_timestamp = datetime.now()
+            record_suffix = int(time.time())
+            source_id = self._source_id(source_system)
+            
+            def build_record(idx: int, version: int) -> SyncRecord:
+                material_data, material_code, content_hash, last_modified = staged[idx]
+                return SyncRecord(
+                    record_id=f"{source_system}_{material_code}_{record_suffix}",
                     source_system=source_system,
                     material_code=material_code,
                     content_hash=content_hash,
                     last_modified=last_modified,
-                    sync_timestamp=datetime.now(),
+                    sync_timestamp=sync_timestamp,
                     sync_status=SyncStatus.PENDING,
-                    version=1,
-                    raw_data=material_data
+                    version=version,
+                    raw_data=material_data,
+                    source_id=source_id
                 )
-                
-                # 检查是否已存在记录
-                existing_record = existing_lookup.get(material_code)
-                
-                if existing_record is None:
-                    # 新记录
-                    new_records.append(sync_record)
-                    batch_stats['new_records'] += 1
-                    
-                elif existing_record.content_hash != content_hash:
-                    # 内容有变化，需要更新
-                    
-                    # 检查是否有冲突（比较时间戳）
-                    if self._has_temporal_conflict(existing_record, sync_record):
-                        # 创建冲突记录
-                        conflict = self._create_conflict_record(
-                            material_code, existing_record, sync_record
-                        )
-                        batch_stats['conflicts_list'].append(conflict)
-                        batch_stats['conflicts'] += 1
-                        
-                    else:
-                        # 正常更新
-                        sync_record.version = existing_record.version + 1
-                        updated_records.append(sync_record)
-                        batch_stats['updated_records'] += 1
-                
-                # 如果哈希相同，则跳过（无需更新）
-                
-            except Exception as e:
-                logger.error(f"处理物料 {material_data.get('material_code', 'unknown')} 失败: {e}")
-                batch_stats['errors'] += 1
+            
+            for idx in np.flatnonzero(new_mask):
+                new_records.append(build_record(idx, 1))
+            
+            for idx in np.flatnonzero(update_mask):
+                updated_records.append(build_record(idx, existing[idx][2] + 1))
+            
+            for idx in np.flatnonzero(conflict_mask):
+                # 创建冲突记录（此时才加载完整的本地记录），单行失败不影响整个数据源
+                material_code = staged[idx][1]
+                try:
+                    existing_record = self._load_sync_record(source_system, material_code)
+                    conflict = self._create_conflict_record(
+                        material_code, existing_record, build_record(idx, 1)
+                    )
+                except Exception as e:
+                    logger.error(f"处理物料 {material_code} 失败: {e}")
+                    conflict_mask[idx] = False
+                    error_mask[idx] = True
+                    continue
+                batch_stats['conflicts_list'].append(conflict)
+            
+            for idx in np.flatnonzero(error_mask):
+                logger.error(f"处理物料 {staged[idx][1]} 失败: 修改时间时区不一致，无法比较")
+            
+            batch_stats['new_records'] += int(new_mask.sum())
+            batch_stats['updated_records'] += int(update_mask.sum())
+            batch_stats['conflicts'] += int(conflict_mask.sum())
+            batch_stats['errors'] += int(error_mask.sum())
+            
+            # 新增、更新及未变化的行均与提交后的数据库一致
+            for idx in np.flatnonzero(~conflict_mask & ~error_mask):
+                known_hashes[staged[idx][1]] = staged[idx][2]
         
         # 批量保存记录
         self._save_sync_records(new_records + updated_records)
+        self._rewrite_content_hashes(rehashed)
         
         return batch_stats
     
+    def _calculate_content_hashes_batch(self, batch_data: List[Dict[str, Any]]) -> List[str]:
+        """整批计算内容哈希值（标准化与拼接在pandas中向量化完成）"""
+        
+        if not batch_data:
+            return []
+        
+        keys = self._build_content_hash_keys(batch_data)
+        
+        if XXHASH_AVAILABLE:
+            return [xxhash.xxh3_64(key.encode('utf-8')).hexdigest() for key in keys]
+        return [hashlib.md5(key.encode('utf-8')).hexdigest() for key in keys]
+    
+    def _build_content_hash_keys(self, batch_data: List[Dict[str, Any]]) -> List[str]:
+        """构建内容哈希的规范化输入：各字段标准化后以分隔符拼接"""
+        
+        df = pd.DataFrame(batch_data, columns=CONTENT_HASH_FIELDS, dtype=object)
+        df = df.fillna('').astype(str)
+        
+        # 标准化字符串（去除空白、转小写）
+        normalized = [df[field].str.strip().str.lower() for field in CONTENT_HASH_FIELDS]
+        return normalized[0].str.cat(normalized[1:], sep=CONTENT_HASH_SEPARATOR).tolist()
+    
     def _calculate_content_hash(self, material_data: Dict[str, Any]) -> str:
-        """计算内容哈希值"""
+        """计算单条记录的内容哈希值（与批量计算结果一致）"""
         
-        # 选择用于哈希计算的关键字段
-        hash_fields = [
-            'material_name', 'specification', 'manufacturer',
-            'material_type', 'unit', 'category'
-        ]
+        return self._calculate_content_hashes_batch([material_data])[0]
+    
+    def _is_legacy_content_hash(self, stored_hash: str, material_data: Dict[str, Any]) -> bool:
+        """判断已存储的哈希是否为同一内容的旧格式哈希"""
+        
+        if stored_hash == self._calculate_legacy_content_hash(material_data):
+            return True
+        
+        # 安装xxhash之前以MD5写入的分隔符拼接格式
+        if XXHASH_AVAILABLE and len(stored_hash) == 32:
+            key = self._build_content_hash_keys([material_data])[0]
+            return stored_hash == hashlib.md5(key.encode('utf-8')).hexdigest()
+        
+        return False
+    
+    def _calculate_legacy_content_hash(self, material_data: Dict[str, Any]) -> str:
+        """计算旧格式（排序JSON）的内容哈希值，用于识别升级前写入的记录"""
         
         # 构建哈希源字符串
         hash_source = {}
-        for field in hash_fields:
+        for field in CONTENT_HASH_FIELDS:
             value = material_data.get(field, '')
             if value:
                 # 标准化字符串（去除空白、转小写）
@@ -394,8 +1084,11 @@ class SimplifiedIncrementalSync:
                 try:
                     time_value = material_data[field]
                     if isinstance(time_value, str):
-                        # 尝试解析时间字符串
-                        return pd.to_datetime(time_value)
+                        # ISO-8601 字符串走标准库快速解析，其他格式再交给pandas推断
+                        try:
+                            return datetime.fromisoformat(time_value.replace('Z', '+00:00'))
+                        except ValueError:
+                            return pd.to_datetime(time_value)
                     elif isinstance(time_value, datetime):
                         return time_value
                 except:
@@ -404,17 +1097,24 @@ class SimplifiedIncrementalSync:
         # 如果没有找到有效时间戳，使用当前时间
         return datetime.now()
     
-    def _has_temporal_conflict(self, existing_record: SyncRecord, 
-                             new_record: SyncRecord) -> bool:
-        """检查是否存在时间冲突"""
+    @staticmethod
+    def _to_epoch_ns(values: List[datetime]) -> Tuple[np.ndarray, np.ndarray]:
+        """将时间列表转换为纳秒整数数组，带时区的时间统一换算为UTC，同时返回是否带时区"""
         
-        # 如果新记录的修改时间早于已存在记录，可能存在冲突
-        time_diff = (new_record.last_modified - existing_record.last_modified).total_seconds()
+        aware = np.array([value.tzinfo is not None for value in values], dtype=bool)
+        epoch_ns = np.zeros(len(values), dtype=np.int64)
         
-        # 如果时间差在冲突窗口内（比如5分钟），认为可能是冲突
-        conflict_window_seconds = 300  # 5分钟
+        # pandas 2.x 起由datetime构建的索引精度为微秒，统一换算为纳秒后再取整数
+        if (~aware).any():
+            epoch_ns[~aware] = pd.DatetimeIndex(
+                [value for value, is_aware in zip(values, aware) if not is_aware]
+            ).values.astype('datetime64[ns]').view(np.int64)
+        if aware.any():
+            epoch_ns[aware] = pd.to_datetime(
+                [value for value, is_aware in zip(values, aware) if is_aware], utc=True
+            ).tz_convert(None).values.astype('datetime64[ns]').view(np.int64)
         
-        return abs(time_diff) <= conflict_window_seconds
+        return epoch_ns, aware
     
     def _create_conflict_record(self, material_code: str, 
                               existing_record: SyncRecord,
@@ -441,86 +1141,86 @@ class SimplifiedIncrementalSync:
         if not records:
             return
         
-        conn = sqlite3.connect(self.sync_db_path)
-        cursor = conn.cursor()
+        # 准备批量插入数据
+        insert_data = []
+        for record in records:
+            insert_data.append((
+                record.record_id,
+                record.source_system,
+                record.material_code,
+                record.content_hash,
+                record.last_modified.isoformat(),
+                record.sync_timestamp.isoformat(),
+                record.sync_status.value,
+                record.version
+            ))
         
-        try:
-            # 准备批量插入数据
-            insert_data = []
-            for record in records:
-                insert_data.append((
-                    record.record_id,
-                    record.source_system,
-                    record.material_code,
-                    record.content_hash,
-                    record.last_modified.isoformat(),
-                    record.sync_timestamp.isoformat(),
-                    record.sync_status.value,
-                    record.version,
-                    json.dumps(record.raw_data, ensure_ascii=False)
-                ))
-            
-            # 使用INSERT OR REPLACE进行批量更新
-            cursor.executemany('''
-            INSERT OR REPLACE INTO sync_records (
-                record_id, source_system, material_code, content_hash,
-                last_modified, sync_timestamp, sync_status, version, raw_data
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', insert_data)
-            
-            conn.commit()
-            
-        finally:
-            conn.close()
+        # 按 (source_system, material_code) 原地更新，哈希未变时不写入（事务由调用方控制）
+        # 原始数据写入 sync_record_payloads，sync_records 的 raw_data 列不再写入（旧记录更新时清空）
+        if SQLITE_SUPPORTS_UPSERT:
+            sql = _UPSERT_SYNC_SQL
+        else:
+            sql = _REPLACE_SYNC_SQL
+        
+        with self._conn_lock:
+            self._conn.executemany(sql, insert_data)
+            self._conn.executemany(_SAVE_PAYLOAD_SQL, [
+                (record.source_system, record.material_code, _json_dumps(record.raw_data))
+                for record in records
+            ])
+    
+    def _rewrite_content_hashes(self, rehashed: List[Tuple[str, str, str]]):
+        """将旧格式哈希改写为新格式（内容未变，不提升版本）"""
+        
+        if not rehashed:
+            return
+        
+        with self._conn_lock:
+            self._conn.executemany(_REWRITE_HASH_SQL, rehashed)
     
     def _save_conflict_record(self, conflict: SyncConflict):
         """保存冲突记录到数据库"""
         
-        conn = sqlite3.connect(self.sync_db_path)
-        cursor = conn.cursor()
+        conflict_id = new_sync_id('CONF')
         
-        try:
-            conflict_id = f"CONF_{conflict.material_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            
-            conflict_data = {
-                'local_record': asdict(conflict.local_record),
-                'remote_records': [asdict(rec) for rec in conflict.remote_records]
-            }
-            
-            cursor.execute('''
-            INSERT INTO sync_conflicts (
-                conflict_id, material_code, conflict_type, conflicting_sources,
-                resolution_strategy, resolved, conflict_data
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
+        # sync_records 中的本地记录之后会被原地覆盖，冲突时的本地版本和远端记录一样保存快照
+        conflict_data = {
+            'local_record': conflict.local_record.to_snapshot(),
+            'remote_records': [rec.to_snapshot() for rec in conflict.remote_records]
+        }
+        
+        with self._conn_lock:
+            self._conn.execute(_INSERT_CONFLICT_SQL, (
                 conflict_id,
                 conflict.material_code,
                 conflict.conflict_type,
-                json.dumps(conflict.conflicting_sources),
+                _json_dumps(conflict.conflicting_sources),
                 conflict.resolution_strategy.value,
                 conflict.resolved,
-                json.dumps(conflict_data, default=str, ensure_ascii=False)
+                _json_dumps(conflict_data),
+                conflict.local_record.record_id,
+                ','.join(rec.record_id for rec in conflict.remote_records)
             ))
-            
-            conn.commit()
-            
-        finally:
-            conn.close()
     
     def _auto_resolve_conflicts(self, conflicts: List[SyncConflict]):
-        """自动解决冲突"""
+        """自动解决冲突：先确定各冲突的胜出记录，再在一个事务中统一写入"""
         
         logger.info(f"开始自动解决 {len(conflicts)} 个冲突")
         
+        resolutions = []
         for conflict in conflicts:
             try:
                 resolution_strategy = conflict.resolution_strategy
                 
                 if resolution_strategy == ConflictResolution.LATEST_WINS:
-                    self._resolve_latest_wins(conflict)
+                    resolutions.append(
+                        (conflict, self._select_latest_record(conflict), 'auto_latest_wins')
+                    )
                     
                 elif resolution_strategy == ConflictResolution.SOURCE_PRIORITY:
-                    self._resolve_source_priority(conflict)
+                    resolutions.append(
+                        (conflict, self._select_priority_record(conflict), 'auto_source_priority')
+                    )
                     
                 else:
                     # 其他策略暂时标记为需要人工解决
@@ -528,131 +1228,178 @@ class SimplifiedIncrementalSync:
                     
             except Exception as e:
                 logger.error(f"自动解决冲突 {conflict.material_code} 失败: {e}")
-    
-    def _resolve_latest_wins(self, conflict: SyncConflict):
-        """按最新时间戳获胜的策略解决冲突"""
         
-        # 找出最新的记录
-        all_records = [conflict.local_record] + conflict.remote_records
-        latest_record = max(all_records, key=lambda x: x.last_modified)
+        if not resolutions:
+            return
         
-        # 更新主数据库
-        self._apply_record_to_main_db(latest_record)
+        try:
+            self._apply_resolutions(resolutions)
+        except Exception as e:
+            logger.error(f"写入冲突解决结果失败: {e}")
+            return
         
-        # 标记冲突已解决
-        self._mark_conflict_resolved(conflict, 'auto_latest_wins')
+        for conflict, _, resolver in resolutions:
+            logger.info(f"冲突 {conflict.material_code} 已自动解决（{resolver}）")
+    
+    def _select_latest_record(self, conflict: SyncConflict) -> SyncRecord:
+        """按最新时间戳获胜的策略选出记录"""
         
-        logger.info(f"冲突 {conflict.material_code} 已按最新时间戳解决")
+        all_records = [conflict.local_record] + conflict.remote_records
+        return max(all_records, key=attrgetter('last_modified'))
     
-    def _resolve_source_priority(self, conflict: SyncConflict):
-        """按数据源优先级解决冲突"""
+    def _select_priority_record(self, conflict: SyncConflict) -> SyncRecord:
+        """按数据源优先级选出记录"""
         
-        # 找出优先级最高的记录
         all_records = [conflict.local_record] + conflict.remote_records
+        return min(all_records, key=attrgetter('source_id'))
+    
+    def _apply_resolutions(self, resolutions: List[Tuple[SyncConflict, SyncRecord, str]]):
+        """在主数据库连接上挂载同步库，一个事务内写入胜出记录并标记冲突已解决"""
         
-        highest_priority_record = min(
-            all_records,
-            key=lambda x: self.source_priority.get(x.source_system, 99)
-        )
+        conn = sqlite3.connect(self.main_db_path, isolation_level=None,
+                               cached_statements=SQLITE_CACHED_STATEMENTS)
         
-        # 更新主数据库
-        self._apply_record_to_main_db(highest_priority_record)
+        try:
+            conn.execute('ATTACH DATABASE ? AS sync', (self.sync_db_path,))
+            
+            # 假设使用material_categories表作为主表
+            has_main_table = self._has_main_table(conn, 'material_categories')
+            
+            resolved_at = datetime.now().isoformat()
+            
+            conn.execute('BEGIN')
+            try:
+                # 胜出记录（本地或远端）写入主库；升级前同步、没有保存原始数据的记录无法写入
+                if has_main_table:
+                    main_rows = []
+                    for conflict, record, _ in resolutions:
+                        if not record.raw_data:
+                            logger.warning(f"冲突 {conflict.material_code} 的胜出记录缺少原始数据，主库保持不变")
+                            continue
+                        main_rows.append(self._main_record_row(
+                            record.raw_data, record.last_modified.isoformat(), record.source_system
+                        ))
+                    conn.executemany(_APPLY_MAIN_RECORD_SQL, main_rows)
+                
+                conn.executemany(_MARK_CONFLICT_RESOLVED_SQL, [
+                    (resolver, resolved_at, conflict.material_code)
+                    for conflict, _, resolver in resolutions
+                ])
+                
+                conn.execute('COMMIT')
+                
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+                
+        finally:
+            conn.close()
+    
+    def resolve_conflicts(self, resolutions: List[Tuple[str, str, str, Optional[Dict[str, Any]]]]):
+        """在一个事务中写入多条人工冲突解决结果
         
-        # 标记冲突已解决
-        self._mark_conflict_resolved(conflict, 'auto_source_priority')
+        每项为 (conflict_id, resolver, resolved_at, merged_data)；
+        merged_data 非空时作为人工合并后的记录写入主库，否则主库保持不变。
+        """
         
-        logger.info(f"冲突 {conflict.material_code} 已按数据源优先级解决")
-    
-    def _apply_record_to_main_db(self, record: SyncRecord):
-        """将记录应用到主数据库"""
+        if not resolutions:
+            return
         
-        conn = sqlite3.connect(self.main_db_path)
-        cursor = conn.cursor()
+        conn = sqlite3.connect(self.main_db_path, isolation_level=None,
+                               cached_statements=SQLITE_CACHED_STATEMENTS)
         
         try:
-            # 检查主数据库中的表结构
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row[0] for row in cursor.fetchall()]
+            conn.execute('ATTACH DATABASE ? AS sync', (self.sync_db_path,))
+            has_main_table = self._has_main_table(conn, 'material_categories')
             
-            # 假设使用material_categories表作为主表
-            if 'material_categories' in tables:
+            conn.execute('BEGIN')
+            try:
+                if has_main_table:
+                    conn.executemany(_APPLY_MAIN_RECORD_SQL, [
+                        self._main_record_row(merged_data, resolved_at, 'manual')
+                        for _, _, resolved_at, merged_data in resolutions
+                        if merged_data
+                    ])
                 
-                raw_data = record.raw_data
+                conn.executemany(_MARK_CONFLICT_RESOLVED_BY_ID_SQL, [
+                    (resolver, resolved_at, conflict_id)
+                    for conflict_id, resolver, resolved_at, _ in resolutions
+                ])
                 
-                # 构建更新/插入语句
-                cursor.execute('''
-                INSERT OR REPLACE INTO material_categories (
-                    material_name, category, specification, manufacturer,
-                    material_type, unit, last_updated, source_system
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    raw_data.get('material_name', ''),
-                    raw_data.get('category', raw_data.get('material_type', '')),
-                    raw_data.get('specification', ''),
-                    raw_data.get('manufacturer', ''),
-                    raw_data.get('material_type', ''),
-                    raw_data.get('unit', ''),
-                    record.last_modified.isoformat(),
-                    record.source_system
-                ))
+                conn.execute('COMMIT')
                 
-                conn.commit()
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
                 
         finally:
             conn.close()
     
-    def _mark_conflict_resolved(self, conflict: SyncConflict, resolver: str):
-        """标记冲突已解决"""
+    def is_conflict_unresolved(self, conflict_id: str) -> bool:
+        """冲突存在且尚未解决"""
         
         conn = sqlite3.connect(self.sync_db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-            UPDATE sync_conflicts 
-            SET resolved = TRUE, resolver = ?, resolved_at = ?
-            WHERE material_code = ? AND resolved = FALSE
-            ''', (resolver, datetime.now().isoformat(), conflict.material_code))
-            
-            conn.commit()
-            
+            row = conn.execute(
+                'SELECT 1 FROM sync_conflicts WHERE conflict_id = ? AND resolved = FALSE',
+                (conflict_id,)
+            ).fetchone()
+            return row is not None
         finally:
             conn.close()
     
+    @staticmethod
+    def _main_record_row(raw_data: Dict[str, Any], last_updated: str, source_system: str) -> Tuple:
+        """由原始数据构建主库 material_categories 的一行"""
+        
+        return (
+            raw_data.get('material_name', ''),
+            raw_data.get('category', raw_data.get('material_type', '')),
+            raw_data.get('specification', ''),
+            raw_data.get('manufacturer', ''),
+            raw_data.get('material_type', ''),
+            raw_data.get('unit', ''),
+            last_updated,
+            source_system
+        )
+    
     def _record_sync_history(self, sync_id: str, source_system: str, sync_type: str,
                            stats: Dict[str, Any], processing_time: float, 
                            status: str, error_details: str = None):
-        """记录同步历史"""
+        """记录同步历史（写入缓冲，由定时器批量落库）"""
         
-        conn = sqlite3.connect(self.sync_db_path)
-        cursor = conn.cursor()
+        now = datetime.now()
+        row = (
+            sync_id, source_system, sync_type, stats['total_records'],
+            stats['new_records'], stats['updated_records'], 
+            stats['conflicts'], stats['errors'],
+            processing_time, 
+            (now - timedelta(seconds=processing_time)).isoformat(),
+            now.isoformat(),
+            status, error_details
+        )
         
-        try:
-            cursor.execute('''
-            INSERT INTO sync_history (
-                sync_id, source_system, sync_type, total_records,
-                new_records, updated_records, conflicts, errors,
-                processing_time, started_at, completed_at, status, error_details
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                sync_id, source_system, sync_type, stats['total_records'],
-                stats['new_records'], stats['updated_records'], 
-                stats['conflicts'], stats['errors'],
-                processing_time, 
-                (datetime.now() - timedelta(seconds=processing_time)).isoformat(),
-                datetime.now().isoformat(),
-                status, error_details
-            ))
-            
-            conn.commit()
+        with self._history_lock:
+            self._history_buf.append(row)
+            self._history_seq += 1
             
-        finally:
-            conn.close()
+            if self._history_timer is None:
+                self._history_timer = threading.Timer(
+                    HISTORY_FLUSH_INTERVAL_SECONDS, self.flush_history
+                )
+                self._history_timer.daemon = True
+                self._history_timer.start()
     
     def get_sync_status(self) -> Dict[str, Any]:
         """获取同步状态报告"""
         
+        # 先写入缓冲的同步历史，保证最近同步记录完整
+        self.flush_history()
+        
         conn = sqlite3.connect(self.sync_db_path)
+        conn.row_factory = sqlite3.Row
         
         try:
             # 获取各数据源的同步统计
@@ -666,7 +1413,7 @@ class SimplifiedIncrementalSync:
             GROUP BY source_system
             '''
             
-            df_sources = pd.read_sql(source_stats_query, conn)
+            source_stats = [dict(row) for row in conn.execute(source_stats_query).fetchall()]
             
             # 获取未解决的冲突
             conflicts_query = '''
@@ -677,7 +1424,7 @@ class SimplifiedIncrementalSync:
             LIMIT 10
             '''
             
-            df_conflicts = pd.read_sql(conflicts_query, conn)
+            unresolved = [dict(row) for row in conn.execute(conflicts_query).fetchall()]
             
             # 获取最近的同步历史
             recent_syncs_query = '''
@@ -689,14 +1436,14 @@ class SimplifiedIncrementalSync:
             LIMIT 5
             '''
             
-            df_recent = pd.read_sql(recent_syncs_query, conn)
+            recent_syncs = [dict(row) for row in conn.execute(recent_syncs_query).fetchall()]
             
             return {
-                'source_statistics': df_sources.to_dict('records'),
-                'unresolved_conflicts': df_conflicts.to_dict('records'),
-                'recent_syncs': df_recent.to_dict('records'),
-                'total_records': df_sources['total_records'].sum() if not df_sources.empty else 0,
-                'total_conflicts': len(df_conflicts),
+                'source_statistics': source_stats,
+                'unresolved_conflicts': unresolved,
+                'recent_syncs': recent_syncs,
+                'total_records': sum(row['total_records'] for row in source_stats),
+                'total_conflicts': len(unresolved),
                 'sync_config': self.sync_config,
                 'report_timestamp': datetime.now().isoformat()
             }
@@ -704,41 +1451,97 @@ class SimplifiedIncrementalSync:
         finally:
             conn.close()
     
+    def query_sync_history(self, source_system: Optional[str] = None,
+                           status: Optional[str] = None,
+                           limit: int = 20) -> List[Dict[str, Any]]:
+        """按数据源和状态筛选同步历史（筛选和数量限制在SQL中完成）"""
+        
+        self.flush_history()
+        
+        conn = sqlite3.connect(self.sync_db_path)
+        conn.row_factory = sqlite3.Row
+        
+        try:
+            query = '''
+            SELECT sync_id, source_system, total_records, 
+                   new_records, updated_records, conflicts, errors,
+                   status, completed_at
+            FROM sync_history
+            WHERE (? IS NULL OR source_system = ?)
+              AND (? IS NULL OR status = ?)
+            ORDER BY completed_at DESC
+            LIMIT ?
+            '''
+            
+            rows = conn.execute(
+                query, (source_system, source_system, status, status, limit)
+            ).fetchall()
+            return [dict(row) for row in rows]
+            
+        finally:
+            conn.close()
+    
     def get_conflicts_for_review(self) -> List[Dict[str, Any]]:
         """获取需要人工审核的冲突"""
         
+        return list(self.iter_conflicts_for_review())
+    
+    def iter_conflicts_for_review(self) -> Iterator[Dict[str, Any]]:
+        """逐条读取需要人工审核的冲突（游标迭代，不一次性载入全部结果）"""
+        
         conn = sqlite3.connect(self.sync_db_path)
+        conn.row_factory = sqlite3.Row
         
         try:
+            # 本地记录优先取冲突快照；只保存了指针的冲突从 sync_records 关联读取
             query = '''
-            SELECT conflict_id, material_code, conflict_type, 
-                   conflicting_sources, conflict_data, created_at
-            FROM sync_conflicts
-            WHERE resolved = FALSE
-            ORDER BY created_at DESC
+            SELECT c.conflict_id, c.material_code, c.conflict_type, 
+                   c.conflicting_sources, c.conflict_data, c.created_at,
+                   r.record_id, r.source_system, r.content_hash, r.last_modified,
+                   r.sync_timestamp, r.sync_status, r.version,
+                   COALESCE(p.raw_data, r.raw_data) AS raw_data
+            FROM sync_conflicts c
+            LEFT JOIN sync_records r ON r.record_id = c.local_record_id
+            LEFT JOIN sync_record_payloads p
+                   ON p.source_system = r.source_system AND p.material_code = r.material_code
+            WHERE c.resolved = FALSE
+            ORDER BY c.created_at DESC
             '''
             
-            df = pd.read_sql(query, conn)
-            conflicts_list = []
-            
-            for _, row in df.iterrows():
-                conflict_data = json.loads(row['conflict_data'])
-                
-                conflicts_list.append({
+            for row in conn.execute(query):
+                conflict_data = _json_loads(row['conflict_data'])
+                yield {
                     'conflict_id': row['conflict_id'],
                     'material_code': row['material_code'],
                     'conflict_type': row['conflict_type'],
-                    'conflicting_sources': json.loads(row['conflicting_sources']),
-                    'local_record': conflict_data.get('local_record'),
+                    'conflicting_sources': _json_loads(row['conflicting_sources']),
+                    'local_record': self._local_record_from_row(row, conflict_data),
                     'remote_records': conflict_data.get('remote_records'),
                     'created_at': row['created_at']
-                })
-            
-            return conflicts_list
+                }
             
         finally:
             conn.close()
 
+    @staticmethod
+    def _local_record_from_row(row: sqlite3.Row, conflict_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """构建冲突的本地记录（优先使用冲突时保存的快照）"""
+        
+        if 'local_record' in conflict_data or row['record_id'] is None:
+            return conflict_data.get('local_record')
+        
+        return {
+            'record_id': row['record_id'],
+            'source_system': row['source_system'],
+            'material_code': row['material_code'],
+            'content_hash': row['content_hash'],
+            'last_modified': row['last_modified'],
+            'sync_timestamp': row['sync_timestamp'],
+            'sync_status': row['sync_status'],
+            'version': row['version'],
+            'raw_data': _json_loads(row['raw_data']) if row['raw_data'] else {}
+        }
+
 # 使用示例
 def sync_example():
     """增量同步系统使用示例"""
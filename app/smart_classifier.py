@@ -2,9 +2,234 @@
 import re
 import sqlite3
 import os
-from typing import List, Dict, Any, Tuple
+import sys
+import threading
+from typing import List, Dict, Any, Optional, Pattern, Tuple
+from collections import namedtuple
 from dataclasses import dataclass
+import heapq
+import numpy as np
 import logging
+from functools import lru_cache
+from operator import itemgetter
+
+def _combine_patterns(*patterns: str) -> Pattern:
+    """将多个单捕获组模式合并为一个交替模式，对文本只扫描一遍"""
+    return re.compile('|'.join(f'(?:{p})' for p in patterns), re.IGNORECASE)
+
+# 规格特征提取模式（每类特征合并为一个预编译模式）
+_DN_RE = _combine_patterns(
+    r'dn\s*(\d+(?:\*\d+)?)',
+    r'φ\s*(\d+)',
+    r'直径\s*(\d+)'
+)
+_PN_RE = _combine_patterns(
+    r'pn\s*([\d.]+)',
+    r'cl\s*(\d+)',
+    r'(\d+\.?\d*)\s*mpa',
+    r'(\d+)\s*lb'
+)
+_MATERIAL_RE = _combine_patterns(
+    r'(304ss?|316ss?|321ss?)',
+    r'(cs|碳钢)',
+    r'(20#|q235)',
+    r'(a105|a182)',
+    r'(0cr18ni9)'
+)
+_LENGTH_RE = _combine_patterns(
+    r'l\s*=\s*([\d.]+)\s*m',
+    r'长度\s*([\d.]+)\s*[米m]',
+    r'([\d.]+)\s*[米m]'
+)
+_TEMP_RE = _combine_patterns(
+    r'(\d+(?:-\d+)?)\s*℃',
+    r'温度\s*[:：]?\s*(\d+(?:-\d+)?)'
+)
+
+# 名称分词（中文连续字符或英文单词）与关键词（至少两个字符）
+_CJK_WORD_RE = re.compile(r'[\u4e00-\u9fff]+|[a-zA-Z]+')
+_KEYWORD_RE = re.compile(r'[\u4e00-\u9fff]{2,}|[a-zA-Z]{2,}')
+
+@lru_cache(maxsize=4096)
+def _tokenize_cjk(text: str) -> frozenset:
+    """名称分词结果（批量导入时同名物料反复出现，按文本缓存；词条驻留以加快集合运算）"""
+    return frozenset(map(sys.intern, _CJK_WORD_RE.findall(text)))
+
+@lru_cache(maxsize=4096)
+def _tokenize_keywords(text: str) -> frozenset:
+    """关键词提取结果（按文本缓存）"""
+    return frozenset(map(sys.intern, _KEYWORD_RE.findall(text)))
+
+# 管道配件相关的特殊匹配规则
+_PIPE_FITTINGS = {
+    '弯头': ['管道配件', '弯头', '弯管'],
+    '三通': ['管道配件', '三通'],  
+    '法兰': ['管道配件', '法兰', '带颈对焊法兰', '平焊法兰'],
+    '管道': ['管道配件', '管道', '管子'],
+    '软管': ['管道配件', '软管', '金属软管'],
+    '疏水器': ['疏水阀', '管道配件', '疏水器'],
+    '疏水阀': ['疏水阀', '管道配件', '疏水器'],
+    '密封': ['机械密封及配件', '密封'],
+    '接头': ['管道配件', '接头', '终端接头'],
+    '对焊': ['管道配件', '对焊', '焊接'],
+    '压缩机': ['气体压缩机配件', '活塞式压缩机配件', '螺杆式压缩机配件', '离心式压缩机配件'],
+    '泵': ['工业泵配件', '离心泵配件', '往复泵配件', '计量泵配件'],
+    '阀门': ['管道配件', '阀门', '阀'],
+    '金属软管': ['管道配件', '软管', '金属软管'],
+    '螺塞': ['紧固件', '螺栓', '螺丝'],
+    '螺栓': ['紧固件', '螺塞', '螺丝'],
+    '螺钉': ['紧固件', '螺栓', '螺丝'],
+    '螺母': ['紧固件', '螺栓配件'],
+    '垫片': ['紧固件', '密封件']
+}
+
+# 通用词汇相似度匹配 - 优先精确匹配
+_SIMILAR_WORDS = {
+    '疏水器': ['疏水阀', '疏水', '蒸汽疏水器'],
+    '疏水阀': ['疏水器', '疏水', '蒸汽疏水阀'],
+    '蒸汽疏水器': ['疏水阀', '疏水器'],
+    '压缩机': ['压缩', '空压机', '气体压缩机'],
+    '接头': ['连接', '接口', '终端接头', '焊接接头'],
+    '对焊接头': ['接头', '焊接终端接头'],
+    '终端接头': ['接头', '对焊接头'],
+    '法兰': ['连接', '接口', '带颈法兰', '平焊法兰'],
+    '带颈对焊法兰': ['法兰', '对焊法兰'],
+    '密封': ['密封件', '密封圈', '机械密封'],
+    '机械密封': ['密封', '密封件'],
+    '软管': ['管道', '管子', '管', '金属软管'],
+    '金属软管': ['软管', '管道'],
+    '阀门': ['阀', '开关'],
+    '泵': ['水泵', '离心泵', '工业泵'],
+    '离心泵': ['泵', '工业泵'],
+    '往复泵': ['泵', '工业泵']
+}
+
+# 同义词规则中出现的全部候选分类词，加载分类时预先求出各分类名称包含哪些
+_SYNONYM_TERMS = frozenset(
+    sys.intern(term)
+    for rules in (_PIPE_FITTINGS, _SIMILAR_WORDS)
+    for related_terms in rules.values()
+    for term in related_terms
+)
+
+# 疏水器和疏水阀应该高度匹配
+_HIGH_SIMILAR_PAIRS = frozenset({('疏水器', '疏水阀'), ('疏水阀', '疏水器')})
+
+@lru_cache(maxsize=4096)
+def _synonym_candidates(input_name: str) -> Tuple[Tuple[str, float, float], ...]:
+    """按规则顺序列出输入名称命中的候选分类词：(候选词, 与分类名完全相同时的得分, 一般得分)"""
+    candidates = []
+    
+    for material_type, related_categories in _PIPE_FITTINGS.items():
+        if material_type in input_name:
+            # 完全匹配（如疏水器->疏水阀）给更高分数，相关匹配给中等分数
+            exact_score = 0.9 if material_type == input_name.strip() else 0.0
+            candidates.extend((related, exact_score, 0.6) for related in related_categories)
+    
+    for word, similar_list in _SIMILAR_WORDS.items():
+        if word in input_name:
+            candidates.extend(
+                (similar, 0.0, 0.95 if (word, similar) in _HIGH_SIMILAR_PAIRS else 0.7)
+                for similar in similar_list
+            )
+    
+    return tuple(candidates)
+
+_SELECT_SOURCE_CATEGORIES_SQL = '''
+    SELECT DISTINCT category_name, description, level
+    FROM material_categories 
+    WHERE level <= 3
+    ORDER BY level, category_name
+'''
+
+def _category_record(name: str, description: str, level: Any) -> Dict[str, Any]:
+    """构造分类记录及其匹配特征"""
+    # 分类名称会反复用于字典查找和比较，统一驻留
+    name = sys.intern(name)
+    description = description or ''
+    name_lc = sys.intern(name.lower().strip())
+    
+    return {
+        'name': name,
+        'description': description,
+        'level': level,
+        # 预先计算的匹配特征，分类循环中只做集合运算
+        'name_lc': name_lc,
+        'name_words': _tokenize_cjk(name_lc),
+        'synonym_terms': frozenset(term for term in _SYNONYM_TERMS if term in name_lc),
+        'keyword_set': _tokenize_keywords(f"{name} {description}".lower())
+    }
+
+# 分类库长连接的缓存设置（页缓存约20MB，内存映射256MB）
+SQLITE_CACHE_SIZE_KB = 20000
+SQLITE_MMAP_SIZE = 268435456
+
+# 输入物料的规格查询条件（小写后的值集合，None 表示该项不参与比较）
+_SpecQuery = namedtuple('SpecQuery', 'dn_set pn_set mat_set')
+
+def _spec_value_matches(input_values: set, sample_value_lc: str, sample_tokens: frozenset) -> bool:
+    """输入规格值是否出现在样例值中（整词命中走集合求交，否则按子串查找）"""
+    return bool(input_values & sample_tokens) or any(value in sample_value_lc for value in input_values)
+
+# 分类名称分词的倒排结构：词表、展平的词ID、词所属分类下标、各分类词数
+_NameTokenIndex = namedtuple('NameTokenIndex', 'vocab token_ids owners sizes')
+
+def _build_name_token_index(categories: List[Dict[str, Any]]) -> _NameTokenIndex:
+    """把各分类的名称分词编码为整数ID，供批量计算Jaccard"""
+    vocab = {}
+    token_ids = []
+    owners = []
+    sizes = np.zeros(len(categories), dtype=np.int32)
+    for i, category in enumerate(categories):
+        words = category['name_words']
+        sizes[i] = len(words)
+        for word in words:
+            token_ids.append(vocab.setdefault(word, len(vocab)))
+            owners.append(i)
+    
+    return _NameTokenIndex(
+        vocab,
+        np.asarray(token_ids, dtype=np.int32),
+        np.asarray(owners, dtype=np.int32),
+        sizes
+    )
+
+def _batch_name_jaccard(index: _NameTokenIndex, input_words: frozenset) -> np.ndarray:
+    """一次计算输入分词与所有分类名称分词的Jaccard系数（无公共词的分类为0）"""
+    n_categories = len(index.sizes)
+    input_ids = [index.vocab[word] for word in input_words if word in index.vocab]
+    if not input_ids or not index.token_ids.size:
+        return np.zeros(n_categories)
+    
+    hits = np.isin(index.token_ids, input_ids)
+    intersection = np.bincount(index.owners, weights=hits, minlength=n_categories)
+    union = index.sizes + len(input_words) - intersection
+    return np.divide(intersection, union, out=np.zeros(n_categories), where=intersection > 0)
+
+# 分类结果最多返回的条数
+MAX_RESULTS = 5
+
+# 分类循环中以INFO级别输出相似度的重点分类
+_FOCUS_CATEGORIES = frozenset({'疏水阀', '管道配件'})
+
+# 精确匹配的专业分类优先，宽泛的通用分类靠后
+_SPECIFIC_CATEGORIES = frozenset({
+    '疏水阀', '机械密封及配件', '金属软管', '离心泵配件', '往复泵配件', '计量泵配件', '活塞式压缩机配件'
+})
+_GENERAL_CATEGORIES = frozenset({'管道配件', '通用机械设备配件', '工业泵配件', '气体压缩机配件', '其他'})
+
+# 各分类的排序偏置：专业分类加分（仅置信度超过50%时生效），通用分类减分
+_CATEGORY_BIAS = {
+    **{name: 20 for name in _SPECIFIC_CATEGORIES},
+    **{name: -10 for name in _GENERAL_CATEGORIES}
+}
+
+def _rank_score(category_name: str, confidence: float) -> float:
+    """分类结果的排序得分：置信度加上分类偏置"""
+    bias = _CATEGORY_BIAS.get(category_name, 0)
+    if bias > 0 and confidence <= 50:
+        return confidence
+    return confidence + bias
 
 @dataclass
 class MaterialFeature:
@@ -30,6 +255,18 @@ class SmartClassifier:
         self.db_path = db_path
         self.setup_logging()
         
+        # 分类数据（去重并预先分词的物化副本，只保存在内存中，不写入分类库）与示例物料按需加载并缓存，
+        # 分类库被其他连接修改后自动重新加载
+        self._categories = None
+        self._categories_version = None
+        self._samples = None
+        self._name_index = None
+        self._name_index_source = None
+        
+        # 分类库长连接（首次使用时打开），多线程共用时串行访问
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        
     def setup_logging(self):
         """设置日志"""
         logging.basicConfig(level=logging.INFO)
@@ -48,9 +285,9 @@ class SmartClassifier:
         try:
             self.logger.info(f"开始分类物料: {material.name}, 规格: {material.spec}")
             
-            # 1. 加载分类数据和示例
-            classification_data = self._load_classification_data()
-            sample_materials = self._load_sample_materials()
+            # 1. 加载分类数据和示例（使用缓存）
+            classification_data = self.classification_data
+            sample_materials = self.sample_materials
             
             self.logger.info(f"加载了 {len(classification_data)} 个分类, {len(sample_materials)} 个示例组")
             
@@ -58,88 +295,178 @@ class SmartClassifier:
             enhanced_features = self._extract_enhanced_features(material)
             
             # 3. 计算每个分类的相似度
-            results = []
-            for category in classification_data:
+            # 名称分词的Jaccard系数对全部分类一次算出
+            jaccard_scores = _batch_name_jaccard(
+                self._get_name_index(classification_data), enhanced_features['name_words']
+            )
+            # 名称得分占80%，据此估算得分上限；已有足够候选时跳过不可能进入前列的分类
+            candidates = []  # (排序得分, 分类, 置信度, 分类示例)
+            # 循环内的日志只在对应级别启用时才格式化
+            log_info = self.logger.isEnabledFor(logging.INFO)
+            log_debug = self.logger.isEnabledFor(logging.DEBUG)
+            top_scores = []  # 当前前 MAX_RESULTS 名的排序得分（小根堆）
+            for category, jaccard_score in zip(classification_data, jaccard_scores.tolist()):
+                category_samples = sample_materials.get(category['name'], [])
+                name_score = self._calculate_name_similarity(
+                    enhanced_features['name'], enhanced_features['name_words'], category,
+                    jaccard_score=jaccard_score
+                )
+                
+                if (len(top_scores) >= MAX_RESULTS and
+                        self._max_rank_score(category['name'], name_score) < top_scores[0]):
+                    continue
+                
                 similarity = self._calculate_similarity(
                     enhanced_features, 
                     category, 
-                    sample_materials.get(category['name'], [])
+                    category_samples,
+                    name_score=name_score
                 )
                 
-                if category['name'] in ['疏水阀', '管道配件']:
-                    self.logger.info(f"重点分类 '{category['name']}' 相似度: {similarity}")
-                else:
-                    self.logger.debug(f"分类 '{category['name']}' 相似度: {similarity}")
+                if category['name'] in _FOCUS_CATEGORIES:
+                    if log_info:
+                        self.logger.info("重点分类 '%s' 相似度: %s%%", category['name'], similarity)
+                elif log_debug:
+                    self.logger.debug("分类 '%s' 相似度: %s%%", category['name'], similarity)
                 
-                if similarity > 0.02:  # 降低阈值到2%
-                    results.append({
-                        'category': category['name'],
-                        'description': category.get('description', ''),
-                        'confidence': round(similarity * 100, 1),
-                        'attributes': self._build_attributes(category, enhanced_features),
-                        'matching_samples': self._get_matching_samples(
-                            enhanced_features, 
-                            sample_materials.get(category['name'], [])
-                        )[:3]  # 最多返回3个相似样例
-                    })
+                if similarity > 2:  # 降低阈值到2%
+                    confidence = round(similarity, 1)
+                    score = _rank_score(category['name'], confidence)
+                    candidates.append((score, category, confidence, category_samples))
+                    
+                    if len(top_scores) < MAX_RESULTS:
+                        heapq.heappush(top_scores, score)
+                    elif score > top_scores[0]:
+                        heapq.heapreplace(top_scores, score)
             
-            # 4. 按相似度和分类精确度排序
+            # 4. 按相似度和分类精确度排序，取前 MAX_RESULTS 个
             # 优先选择更精确的分类（避免选择过于宽泛的上级分类）
-            def sort_key(result):
-                confidence = result['confidence']
-                category_name = result['category']
-                
-                # 给精确匹配的专业分类更高优先级
-                specific_categories = ['疏水阀', '机械密封及配件', '金属软管', '离心泵配件', '往复泵配件', '计量泵配件', '活塞式压缩机配件']
-                general_categories = ['管道配件', '通用机械设备配件', '工业泵配件', '气体压缩机配件', '其他']
-                
-                if category_name in specific_categories and confidence > 50:
-                    return confidence + 20  # 精确分类加分
-                elif category_name in general_categories:
-                    return confidence - 10  # 通用分类减分
-                else:
-                    return confidence
-            
-            results.sort(key=sort_key, reverse=True)
+            # 属性和相似样例只为最终返回的分类构建
+            self.logger.info(f"找到 {len(candidates)} 个候选分类")
+            results = [
+                {
+                    'category': category['name'],
+                    'description': category.get('description', ''),
+                    'confidence': confidence,
+                    'attributes': self._build_attributes(category, enhanced_features),
+                    'matching_samples': self._get_matching_samples(
+                        enhanced_features['spec_query'], 
+                        category_samples
+                    )[:3]  # 最多返回3个相似样例
+                }
+                for _, category, confidence, category_samples
+                in heapq.nlargest(MAX_RESULTS, candidates, key=itemgetter(0))
+            ]
             
-            self.logger.info(f"找到 {len(results)} 个匹配的分类")
             if results:
                 self.logger.info(f"最佳匹配: {results[0]['category']} (置信度: {results[0]['confidence']}%)")
             
-            return results[:5]  # 返回前5个最相似的分类
+            return results  # 返回前5个最相似的分类
             
         except Exception as e:
             self.logger.error(f"分类错误: {str(e)}")
             return []
     
+    @staticmethod
+    def _max_rank_score(category_name: str, name_score: float) -> float:
+        """仅凭名称得分估算该分类可能达到的最高排序得分（其余三项按满分计）"""
+        upper = name_score * 0.8 + 0.2
+        if name_score > 0.9:
+            upper *= 1.2
+        
+        # 置信度四舍五入最多上浮0.05
+        return _rank_score(category_name, min(upper, 1.0) * 100 + 0.05)
+    
+    @property
+    def classification_data(self) -> List[Dict[str, Any]]:
+        """分类数据（缓存；分类库的 PRAGMA data_version 变化后重新加载）"""
+        # 先取版本再加载：加载期间的提交会使下次调用看到新版本而重新加载
+        version = self._data_version()
+        
+        if self._categories is None or version is None or version != self._categories_version:
+            categories = self._load_classification_data()
+            # 加载失败或为空时不缓存，下次调用重试
+            if categories:
+                self._categories = categories
+                self._categories_version = version
+            return categories
+        
+        return self._categories
+    
+    def _get_name_index(self, categories: List[Dict[str, Any]]) -> _NameTokenIndex:
+        """分类名称分词索引（随分类数据重建）"""
+        if self._name_index_source is not categories:
+            self._name_index = _build_name_token_index(categories)
+            self._name_index_source = categories
+        return self._name_index
+    
+    @property
+    def sample_materials(self) -> Dict[str, List[Dict[str, Any]]]:
+        """示例物料数据（缓存）"""
+        if self._samples is None:
+            self._samples = self._load_sample_materials()
+        return self._samples
+    
+    def refresh(self):
+        """清空缓存，下次分类时重新加载分类数据和示例"""
+        self._categories = None
+        self._categories_version = None
+        self._samples = None
+        self._name_index = None
+        self._name_index_source = None
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取分类库长连接（调用方需持有 _conn_lock）"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+            conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+            self._conn = conn
+        return self._conn
+    
+    def close(self):
+        """关闭分类库长连接"""
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            # data_version 只在同一连接上可比较，重新打开连接后需要重新加载
+            self._categories_version = None
+    
+    def _data_version(self) -> Optional[int]:
+        """分类库的数据版本（其他连接每次提交后变化），读取失败时返回None"""
+        try:
+            with self._conn_lock:
+                return self._get_connection().execute('PRAGMA data_version').fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.warning(f"读取分类库数据版本失败: {str(e)}")
+            self.close()
+            return None
+    
     def _load_classification_data(self) -> List[Dict[str, Any]]:
-        """加载分类数据"""
+        """从源表加载去重后的分类数据，并预先计算匹配特征"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self._conn_lock:
+                conn = self._get_connection()
+                source_rows = conn.execute(_SELECT_SOURCE_CATEGORIES_SQL).fetchall()
             
-            cursor.execute('''
-                SELECT DISTINCT category_name, description, level
-                FROM material_categories 
-                WHERE level <= 3
-                ORDER BY level, category_name
-            ''')
-            
-            categories = []
-            for row in cursor.fetchall():
-                categories.append({
-                    'name': row[0],
-                    'description': row[1] or '',
-                    'level': row[2]
-                })
-            
-            conn.close()
-            return categories
+            return [_category_record(*row) for row in source_rows]
             
         except Exception as e:
             self.logger.error(f"加载分类数据失败: {str(e)}")
+            # 连接可能已失效（如数据库文件被替换），下次重新打开
+            self.close()
             return []
     
+    def refresh_materialized(self) -> int:
+        """立即从源表重新加载分类数据并清空其他缓存，返回加载的分类数
+        
+        分类库被其他连接修改后会自动重新加载；需要立即生效（如批量导入后预热）时调用此方法。
+        """
+        self.refresh()
+        return len(self.classification_data)
+    
     def _load_sample_materials(self) -> Dict[str, List[Dict[str, Any]]]:
         """加载示例物料数据"""
         # 基于您提供的CSV数据，创建一些示例分类数据
@@ -191,12 +518,21 @@ class SmartClassifier:
             ]
         }
         
-        return sample_data
+        # 预先转小写并分词，规格匹配时先做集合求交，未命中再退回子串查找
+        for samples in sample_data.values():
+            for sample in samples:
+                for field in ('dn', 'pn', 'material'):
+                    value_lc = sys.intern(sample.get(field, '').lower())
+                    sample[f'{field}_lc'] = value_lc
+                    sample[f'{field}_tokens'] = frozenset(map(sys.intern, value_lc.split()))
+        
+        # 分类名称键与分类记录中的名称驻留为同一对象
+        return {sys.intern(name): samples for name, samples in sample_data.items()}
     
     def _extract_enhanced_features(self, material: MaterialFeature) -> Dict[str, Any]:
         """提取增强特征"""
         features = {
-            'name': material.name.lower().strip(),
+            'name': sys.intern(material.name.lower().strip()),
             'spec': material.spec.lower().strip(),
             'unit': material.unit,
             'dn_input': material.dn,
@@ -204,78 +540,78 @@ class SmartClassifier:
             'material_input': material.material
         }
         
+        # 名称分词和关键词只与物料有关，在分类循环外计算一次
+        features['name_words'] = _tokenize_cjk(features['name'])
+        features['keywords'] = _tokenize_keywords(f"{features['name']} {features['spec']}".lower())
+        
         # 从规格描述中提取特征
-        spec_text = f"{material.spec} {material.dn} {material.pn} {material.material}".lower()
+        # 只拼接非空字段（模式中的空白均为 \s*，少了多余空格不影响匹配）
+        spec_text = ' '.join(
+            part for part in (material.spec, material.dn, material.pn, material.material) if part
+        ).lower()
         
         # 提取DN值
-        dn_patterns = [
-            r'dn\s*(\d+(?:\*\d+)?)',
-            r'φ\s*(\d+)',
-            r'直径\s*(\d+)'
-        ]
-        features['extracted_dn'] = self._extract_by_patterns(spec_text, dn_patterns)
+        features['extracted_dn'] = self._extract_by_patterns(spec_text, _DN_RE)
         
         # 提取压力等级
-        pn_patterns = [
-            r'pn\s*([\d.]+)',
-            r'cl\s*(\d+)',
-            r'(\d+\.?\d*)\s*mpa',
-            r'(\d+)\s*lb'
-        ]
-        features['extracted_pn'] = self._extract_by_patterns(spec_text, pn_patterns)
+        features['extracted_pn'] = self._extract_by_patterns(spec_text, _PN_RE)
         
         # 提取材质
-        material_patterns = [
-            r'(304ss?|316ss?|321ss?)',
-            r'(cs|碳钢)',
-            r'(20#|q235)',
-            r'(a105|a182)',
-            r'(0cr18ni9)'
-        ]
-        features['extracted_material'] = self._extract_by_patterns(spec_text, material_patterns)
+        features['extracted_material'] = self._extract_by_patterns(spec_text, _MATERIAL_RE)
         
         # 提取长度
-        length_patterns = [
-            r'l\s*=\s*([\d.]+)\s*m',
-            r'长度\s*([\d.]+)\s*[米m]',
-            r'([\d.]+)\s*[米m]'
-        ]
-        features['extracted_length'] = self._extract_by_patterns(spec_text, length_patterns)
+        features['extracted_length'] = self._extract_by_patterns(spec_text, _LENGTH_RE)
         
         # 提取温度
-        temp_patterns = [
-            r'(\d+(?:-\d+)?)\s*℃',
-            r'温度\s*[:：]?\s*(\d+(?:-\d+)?)'
-        ]
-        features['extracted_temp'] = self._extract_by_patterns(spec_text, temp_patterns)
+        features['extracted_temp'] = self._extract_by_patterns(spec_text, _TEMP_RE)
+        
+        # 规格查询条件供所有分类的样例比较共用
+        features['spec_query'] = self._build_spec_query(features)
         
         return features
     
-    def _extract_by_patterns(self, text: str, patterns: List[str]) -> List[str]:
-        """按模式提取文本"""
-        results = []
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                results.extend([match.strip() for match in matches if match.strip()])
-        return list(set(results))  # 去重
+    def _build_spec_query(self, features: Dict[str, Any]) -> _SpecQuery:
+        """构造规格查询条件"""
+        def _value_set(extracted: List[str], input_value: str) -> Optional[set]:
+            if not (extracted or input_value):
+                return None
+            return {value.lower() for value in extracted + [input_value] if value}
+        
+        return _SpecQuery(
+            _value_set(features['extracted_dn'], features['dn_input']),
+            _value_set(features['extracted_pn'], features['pn_input']),
+            _value_set(features['extracted_material'], features['material_input'])
+        )
+    
+    def _extract_by_patterns(self, text: str, pattern: Pattern) -> List[str]:
+        """按合并后的模式单次扫描提取文本（每个分支只有一个捕获组）"""
+        seen = {}  # 按出现顺序去重
+        for match in pattern.finditer(text):
+            value = match.group(match.lastindex).strip()
+            if value:
+                seen[value] = None
+        return list(seen)
     
     def _calculate_similarity(self, features: Dict[str, Any], 
                             category: Dict[str, Any], 
-                            samples: List[Dict[str, Any]]) -> float:
-        """计算相似度"""
+                            samples: List[Dict[str, Any]],
+                            name_score: float = None) -> float:
+        """计算相似度，返回百分比（name_score 可由调用方预先计算传入）"""
         
         # 1. 名称匹配（权重80%，大幅提高权重）
-        name_score = self._calculate_name_similarity(features['name'], category['name'])
+        if name_score is None:
+            name_score = self._calculate_name_similarity(
+                features['name'], features['name_words'], category
+            )
         
         # 2. 规格特征匹配（权重10%）
-        spec_score = self._calculate_spec_similarity(features, samples)
+        spec_score = self._calculate_spec_similarity(features['spec_query'], samples)
         
         # 3. 单位匹配（权重5%）
         unit_score = self._calculate_unit_similarity(features['unit'], samples)
         
         # 4. 关键词匹配（权重5%）
-        keyword_score = self._calculate_keyword_similarity(features, category)
+        keyword_score = self._calculate_keyword_similarity(features['keywords'], category)
         
         # 加权计算总相似度
         total_score = (
@@ -286,19 +622,25 @@ class SmartClassifier:
         )
         
         # 精确匹配奖励：如果是高精度同义词匹配，给额外加分
+        # （各项得分不超过1，无奖励时总分不会超过1.0，只需在此处截断）
         if name_score > 0.9:
             total_score = min(total_score * 1.2, 1.0)  # 最多120%，但不超过100%
         
         # 调试日志
         if total_score > 0:
-            self.logger.debug(f"分类 '{category['name']}' 得分: name={name_score:.2f}, spec={spec_score:.2f}, unit={unit_score:.2f}, keyword={keyword_score:.2f}, total={total_score:.2f}")
+            self.logger.debug(
+                "分类 '%s' 得分: name=%.2f, spec=%.2f, unit=%.2f, keyword=%.2f, total=%.2f",
+                category['name'], name_score, spec_score, unit_score, keyword_score, total_score
+            )
         
-        return min(total_score, 1.0)  # 确保不超过1.0
+        return total_score * 100
     
-    def _calculate_name_similarity(self, input_name: str, category_name: str) -> float:
-        """计算名称相似度"""
-        input_name = input_name.lower().strip()
-        category_name = category_name.lower().strip()
+    def _calculate_name_similarity(self, input_name: str, input_words: frozenset,
+                                   category: Dict[str, Any],
+                                   jaccard_score: float = None) -> float:
+        """计算名称相似度（输入名称为小写且已去除首尾空白，分词均预先计算；
+        jaccard_score 可由批量计算结果传入）"""
+        category_name = category['name_lc']
         
         # 完全匹配
         if input_name == category_name:
@@ -309,126 +651,71 @@ class SmartClassifier:
             return 0.8
             
         # 关键词匹配
-        input_words = set(re.findall(r'[\u4e00-\u9fff]+|[a-zA-Z]+', input_name))
-        category_words = set(re.findall(r'[\u4e00-\u9fff]+|[a-zA-Z]+', category_name))
+        category_words = category['name_words']
         
         if input_words and category_words:
-            intersection = input_words.intersection(category_words)
-            union = input_words.union(category_words)
-            jaccard_score = len(intersection) / len(union)
+            if jaccard_score is None:
+                intersection = input_words.intersection(category_words)
+                jaccard_score = len(intersection) / len(input_words.union(category_words))
             
             # 如果有交集，给予更高的基础分数
-            if intersection:
+            if jaccard_score > 0:
                 return max(jaccard_score * 0.6, 0.3)  # 至少给30%的分数
             
-        # 管道配件相关的特殊匹配规则
-        pipe_fittings = {
-            '弯头': ['管道配件', '弯头', '弯管'],
-            '三通': ['管道配件', '三通'],  
-            '法兰': ['管道配件', '法兰', '带颈对焊法兰', '平焊法兰'],
-            '管道': ['管道配件', '管道', '管子'],
-            '软管': ['管道配件', '软管', '金属软管'],
-            '疏水器': ['疏水阀', '管道配件', '疏水器'],
-            '疏水阀': ['疏水阀', '管道配件', '疏水器'],
-            '密封': ['机械密封及配件', '密封'],
-            '接头': ['管道配件', '接头', '终端接头'],
-            '对焊': ['管道配件', '对焊', '焊接'],
-            '压缩机': ['气体压缩机配件', '活塞式压缩机配件', '螺杆式压缩机配件', '离心式压缩机配件'],
-            '泵': ['工业泵配件', '离心泵配件', '往复泵配件', '计量泵配件'],
-            '阀门': ['管道配件', '阀门', '阀'],
-            '金属软管': ['管道配件', '软管', '金属软管'],
-            '螺塞': ['紧固件', '螺栓', '螺丝'],
-            '螺栓': ['紧固件', '螺塞', '螺丝'],
-            '螺钉': ['紧固件', '螺栓', '螺丝'],
-            '螺母': ['紧固件', '螺栓配件'],
-            '垫片': ['紧固件', '密封件']
-        }
-        
-        for material_type, related_categories in pipe_fittings.items():
-            if material_type in input_name:
-                for related in related_categories:
-                    if related in category_name:
-                        # 如果是完全匹配（如疏水器->疏水阀），给更高分数
-                        if material_type == input_name.strip() and related == category_name.strip():
-                            return 0.9
-                        # 如果是相关匹配，给中等分数
-                        return 0.6
-        
-        # 通用词汇相似度匹配 - 优先精确匹配
-        similar_words = {
-            '疏水器': ['疏水阀', '疏水', '蒸汽疏水器'],
-            '疏水阀': ['疏水器', '疏水', '蒸汽疏水阀'],
-            '蒸汽疏水器': ['疏水阀', '疏水器'],
-            '压缩机': ['压缩', '空压机', '气体压缩机'],
-            '接头': ['连接', '接口', '终端接头', '焊接接头'],
-            '对焊接头': ['接头', '焊接终端接头'],
-            '终端接头': ['接头', '对焊接头'],
-            '法兰': ['连接', '接口', '带颈法兰', '平焊法兰'],
-            '带颈对焊法兰': ['法兰', '对焊法兰'],
-            '密封': ['密封件', '密封圈', '机械密封'],
-            '机械密封': ['密封', '密封件'],
-            '软管': ['管道', '管子', '管', '金属软管'],
-            '金属软管': ['软管', '管道'],
-            '阀门': ['阀', '开关'],
-            '泵': ['水泵', '离心泵', '工业泵'],
-            '离心泵': ['泵', '工业泵'],
-            '往复泵': ['泵', '工业泵']
-        }
+        # 同义词规则：按规则顺序取第一个命中分类名称的候选
+        # （分类名称包含的候选词已在加载时求出，名称不含任何候选词的分类直接跳过）
+        category_terms = category['synonym_terms']
+        if not category_terms:
+            return 0.0
         
-        for word, similar_list in similar_words.items():
-            if word in input_name:
-                for similar in similar_list:
-                    if similar in category_name:
-                        # 疏水器和疏水阀应该高度匹配
-                        if (word == '疏水器' and similar == '疏水阀') or (word == '疏水阀' and similar == '疏水器'):
-                            return 0.95
-                        return 0.7
+        for related, exact_score, score in _synonym_candidates(input_name):
+            if related in category_terms:
+                if exact_score and related == category_name.strip():
+                    return exact_score
+                return score
                         
         return 0.0
     
-    def _calculate_spec_similarity(self, features: Dict[str, Any], 
+    def _calculate_spec_similarity(self, spec_query: _SpecQuery, 
                                  samples: List[Dict[str, Any]]) -> float:
         """计算规格特征相似度"""
-        if not samples:
-            return 0.0
-            
         max_score = 0.0
         
         for sample in samples:
-            score = 0.0
-            factors = 0
-            
-            # DN匹配
-            if features['extracted_dn'] or features['dn_input']:
-                input_dn = features['extracted_dn'] + [features['dn_input']]
-                sample_dn = sample.get('dn', '')
-                if any(dn and dn.lower() in sample_dn.lower() for dn in input_dn if dn):
-                    score += 1.0
-                factors += 1
-                
-            # PN/压力匹配  
-            if features['extracted_pn'] or features['pn_input']:
-                input_pn = features['extracted_pn'] + [features['pn_input']]
-                sample_pn = sample.get('pn', '')
-                if any(pn and pn.lower() in sample_pn.lower() for pn in input_pn if pn):
-                    score += 1.0
-                factors += 1
-                
-            # 材质匹配
-            if features['extracted_material'] or features['material_input']:
-                input_material = features['extracted_material'] + [features['material_input']]
-                sample_material = sample.get('material', '')
-                if any(mat and mat.lower() in sample_material.lower() 
-                      for mat in input_material if mat):
-                    score += 1.0
-                factors += 1
-                
-            if factors > 0:
-                sample_score = score / factors
+            sample_score = self._calculate_sample_spec_score(spec_query, sample)
+            if sample_score is not None:
                 max_score = max(max_score, sample_score)
         
         return max_score
     
+    def _calculate_sample_spec_score(self, spec_query: _SpecQuery, 
+                                     sample: Dict[str, Any]) -> Optional[float]:
+        """计算单个样例的规格匹配得分（没有可比较的规格项时返回None）"""
+        score = 0.0
+        factors = 0
+        
+        # DN匹配
+        if spec_query.dn_set is not None:
+            if _spec_value_matches(spec_query.dn_set, sample['dn_lc'], sample['dn_tokens']):
+                score += 1.0
+            factors += 1
+            
+        # PN/压力匹配  
+        if spec_query.pn_set is not None:
+            if _spec_value_matches(spec_query.pn_set, sample['pn_lc'], sample['pn_tokens']):
+                score += 1.0
+            factors += 1
+            
+        # 材质匹配
+        if spec_query.mat_set is not None:
+            if _spec_value_matches(spec_query.mat_set, sample['material_lc'], sample['material_tokens']):
+                score += 1.0
+            factors += 1
+            
+        if factors > 0:
+            return score / factors
+        return None
+    
     def _calculate_unit_similarity(self, input_unit: str, 
                                  samples: List[Dict[str, Any]]) -> float:
         """计算单位相似度"""
@@ -451,15 +738,10 @@ class SmartClassifier:
                     
         return 0.3
     
-    def _calculate_keyword_similarity(self, features: Dict[str, Any], 
+    def _calculate_keyword_similarity(self, input_keywords: frozenset, 
                                     category: Dict[str, Any]) -> float:
-        """计算关键词相似度"""
-        input_text = f"{features['name']} {features['spec']}"
-        category_text = f"{category['name']} {category.get('description', '')}"
-        
-        # 提取关键词
-        input_keywords = set(re.findall(r'[\u4e00-\u9fff]{2,}|[a-zA-Z]{2,}', input_text.lower()))
-        category_keywords = set(re.findall(r'[\u4e00-\u9fff]{2,}|[a-zA-Z]{2,}', category_text.lower()))
+        """计算关键词相似度（输入与分类的关键词均预先计算）"""
+        category_keywords = category['keyword_set']
         
         if input_keywords and category_keywords:
             intersection = input_keywords.intersection(category_keywords)
@@ -503,14 +785,14 @@ class SmartClassifier:
             
         return attributes
     
-    def _get_matching_samples(self, features: Dict[str, Any], 
+    def _get_matching_samples(self, spec_query: _SpecQuery, 
                             samples: List[Dict[str, Any]]) -> List[Dict[str, str]]:
         """获取匹配的示例"""
         matching_samples = []
         
         for sample in samples:
-            score = self._calculate_spec_similarity(features, [sample])
-            if score > 0.3:  # 相似度大于30%的样例
+            score = self._calculate_sample_spec_score(spec_query, sample)
+            if score is not None and score > 0.3:  # 相似度大于30%的样例
                 matching_samples.append({
                     'name': sample.get('name', ''),
                     'spec': sample.get('spec', ''),
@@ -2,16 +2,43 @@
 """
 增量同步API端点
 为MMP系统提供增量同步服务接口
+
+并发说明：同步接口是阻塞调用（同步耗时即请求耗时）。Flask作为WSGI应用时，
+async视图仍会占用一个worker直到返回，改写成async并不能提高并发；
+需要同时处理多个同步请求时，请使用多线程worker部署，
+例如 gunicorn -k gthread --threads 8。
 """
 
-from flask import Blueprint, request, jsonify
-from typing import Dict, Any, List
+from flask import Blueprint, request, current_app, g
+from typing import Dict, Any, List, Optional, Tuple
+import atexit
+import json
 import logging
-import traceback
-from datetime import datetime
+import queue
+import threading
+import weakref
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from operator import itemgetter
+
+# orjson（可选）：更快的响应序列化，原生支持datetime
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# fastjsonschema（可选）：预编译的请求体校验，未安装时使用等价的手写检查
+try:
+    import fastjsonschema
+    FASTJSONSCHEMA_AVAILABLE = True
+except ImportError:
+    FASTJSONSCHEMA_AVAILABLE = False
 
 from app.simplified_incremental_sync import (
-    SimplifiedIncrementalSync, ConflictResolution
+    SimplifiedIncrementalSync, ConflictResolution, new_sync_id
 )
 
 logger = logging.getLogger(__name__)
@@ -19,13 +46,444 @@ logger = logging.getLogger(__name__)
 # 创建Blueprint
 sync_bp = Blueprint('sync', __name__, url_prefix='/api/sync')
 
-# 全局同步系统实例
-sync_system = None
+# 同步系统实例保存在 app.extensions 中的键名
+SYNC_SYSTEM_EXTENSION = 'sync_system'
+INGEST_QUEUE_EXTENSION = 'sync_ingest_queue'
+RESOLUTION_WRITER_EXTENSION = 'sync_resolution_writer'
+CONFIG_CACHE_EXTENSION = 'sync_config_cache'
+
+# 支持的冲突解决策略（枚举不会变化，导入时计算一次）
+_SUPPORTED_RESOLUTIONS = tuple(res.value for res in ConflictResolution)
+
+# 后台写入队列：攒够 INGEST_MAX_BATCH 条或等待 INGEST_FLUSH_INTERVAL 秒后写入一次
+INGEST_MAX_BATCH = 5000
+INGEST_FLUSH_INTERVAL = 1.0
+# 进程退出时等待后台队列写完的最长时间（秒）
+INGEST_EXIT_FLUSH_TIMEOUT = 30
+
+# 人工冲突解决结果每批最多写入条数；排队超过 4 批时提交方阻塞等待
+RESOLUTION_MAX_BATCH_SIZE = 256
+# 进程退出时等待冲突解决结果写完的最长时间（秒）
+RESOLUTION_EXIT_FLUSH_TIMEOUT = 30
+
+@sync_bp.before_request
+def _stamp_request_time():
+    """每个请求只取一次当前时间，响应中的时间戳和ID都使用它"""
+    g.now = datetime.now()
+
+@sync_bp.before_request
+def _require_sync_system():
+    """同步系统未初始化时统一返回500，各接口无需再逐个检查"""
+    if current_app.extensions.get(SYNC_SYSTEM_EXTENSION) is None:
+        return _json({
+            'success': False,
+            'error': '同步系统未初始化'
+        }, 500)
+
+def _json_default(obj):
+    """序列化JSON原生不支持的类型（时间统一输出ISO格式）"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f'无法序列化类型: {type(obj).__name__}')
+
+def _dumps(obj: Any) -> bytes:
+    """序列化为JSON字节串（有orjson时使用orjson）"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, default=_json_default).encode('utf-8')
+
+def _body() -> Any:
+    """解析JSON请求体（有orjson时使用orjson；请求体为空或不是合法JSON时返回None）"""
+    raw = request.get_data(cache=False)
+    if not raw:
+        return None
+    try:
+        return orjson.loads(raw) if ORJSON_AVAILABLE else json.loads(raw)
+    except ValueError:
+        return None
+
+def _json(payload: Dict[str, Any], status: int = 200):
+    """构造JSON响应（datetime直接放入payload即可）"""
+    return current_app.response_class(_dumps(payload), status=status, mimetype='application/json')
+
+def _not_modified(sync_system: SimplifiedIncrementalSync):
+    """
+    计算当前版本的弱ETag；客户端缓存仍有效时返回 (etag, 304响应)，否则返回 (etag, None)
+    """
+    etag = sync_system.version
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return etag, response
+    return etag, None
+
+def _config_data_bytes(sync_system: SimplifiedIncrementalSync) -> bytes:
+    """当前配置序列化后的字节串，配置版本不变时复用上次结果"""
+    cached = current_app.extensions.get(CONFIG_CACHE_EXTENSION)
+    version = sync_system.sync_config_version
+    if cached is None or cached[0] != version:
+        cached = (version, _dumps({
+            'sync_config': sync_system.sync_config,
+            'source_priority': sync_system.source_priority,
+            'supported_resolutions': _SUPPORTED_RESOLUTIONS,
+            'sync_config_version': version
+        }))
+        current_app.extensions[CONFIG_CACHE_EXTENSION] = cached
+    return cached[1]
+
+# 请求体结构定义
+_FROM_SOURCE_SCHEMA = {
+    'type': 'object',
+    'required': ['source_system', 'data'],
+    'properties': {
+        'source_system': {'type': 'string'},
+        'sync_type': {'type': 'string'},
+        'data': {'type': 'array', 'minItems': 1, 'items': {'type': 'object'}},
+        'defer': {'type': 'boolean'}
+    }
+}
+
+_BATCH_SYNC_SCHEMA = {
+    'type': 'object',
+    'required': ['sync_sources'],
+    'properties': {
+        'sync_sources': {'type': 'array', 'items': {'type': 'object'}},
+        'sync_options': {'type': 'object'}
+    }
+}
+
+if FASTJSONSCHEMA_AVAILABLE:
+    _validate_from_source = fastjsonschema.compile(_FROM_SOURCE_SCHEMA)
+    _validate_batch_sync = fastjsonschema.compile(_BATCH_SYNC_SCHEMA)
+
+def _from_source_error(data: Any) -> Optional[str]:
+    """校验 /from-source 请求体，返回错误信息（通过时返回None）"""
+    if FASTJSONSCHEMA_AVAILABLE:
+        try:
+            _validate_from_source(data)
+            return None
+        except fastjsonschema.JsonSchemaException as e:
+            # e.name 为出错位置，如 data、data.source_system、data.data[0]
+            field = e.name
+    else:
+        if not isinstance(data, dict) or 'source_system' not in data or 'data' not in data:
+            field = 'data'
+        elif not isinstance(data['source_system'], str):
+            field = 'data.source_system'
+        elif not isinstance(data.get('sync_type', ''), str):
+            field = 'data.sync_type'
+        elif not isinstance(data['data'], list) or len(data['data']) == 0:
+            field = 'data.data'
+        elif not all(isinstance(record, dict) for record in data['data']):
+            field = 'data.data[]'
+        elif not isinstance(data.get('defer', False), bool):
+            field = 'data.defer'
+        else:
+            return None
+    
+    if field == 'data':
+        return '缺少必需字段source_system或data'
+    if field == 'data.defer':
+        return 'defer必须是布尔值'
+    if field == 'data.data':
+        return 'data必须是非空数组'
+    if field.startswith('data.data['):
+        return 'data中的每条记录必须是对象'
+    return f"{field[len('data.'):]}必须是字符串"
+
+# 校验通过后的 /from-source 请求参数
+_FromSourceReq = namedtuple('_FromSourceReq', 'source_system source_data sync_type defer')
+
+def _parse_from_source(data: Dict[str, Any]) -> _FromSourceReq:
+    """提取 /from-source 请求参数（须先经 _from_source_error 校验）"""
+    return _FromSourceReq(
+        data['source_system'],
+        data['data'],
+        data.get('sync_type', 'incremental'),
+        data.get('defer', False)
+    )
+
+def _batch_sync_error(data: Any) -> Optional[str]:
+    """校验 /batch-sync 请求体，返回错误信息（通过时返回None）"""
+    if FASTJSONSCHEMA_AVAILABLE:
+        try:
+            _validate_batch_sync(data)
+            return None
+        except fastjsonschema.JsonSchemaException as e:
+            field = e.name
+    else:
+        if not isinstance(data, dict) or 'sync_sources' not in data:
+            field = 'data'
+        elif not isinstance(data['sync_sources'], list) or \
+                not all(isinstance(source, dict) for source in data['sync_sources']):
+            field = 'data.sync_sources'
+        elif not isinstance(data.get('sync_options', {}), dict):
+            field = 'data.sync_options'
+        else:
+            return None
+    
+    if field == 'data':
+        return '缺少sync_sources字段'
+    if field.startswith('data.sync_sources'):
+        return 'sync_sources必须是对象数组'
+    return 'sync_options必须是对象'
+
+def _sorted_by_material_code(records: Any) -> Any:
+    """按物料编码排序一个数据源的记录（已有序或无法排序时原样返回）
+
+    各批次覆盖连续的编码区间，现有状态查询和写入都按索引顺序访问同步库。
+    排序稳定，同一编码的重复记录保持原有先后。
+    """
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        return records
+
+    codes = [str(record.get('material_code') or '') for record in records]
+    if all(prev <= cur for prev, cur in zip(codes, codes[1:])):
+        return records
+    return [record for _, record in sorted(zip(codes, records), key=itemgetter(0))]
+
+def _flush_ingest_at_exit(queue_ref: 'weakref.ref'):
+    """进程退出时写入后台队列中尚未落库的记录（弱引用，不阻止实例回收）"""
+    ingest_queue = queue_ref()
+    if ingest_queue is None:
+        return
+    completed, stats = ingest_queue.flush(INGEST_EXIT_FLUSH_TIMEOUT)
+    if not completed:
+        logger.error("退出时后台队列未在 %s 秒内写完，剩余 %s 条记录",
+                     INGEST_EXIT_FLUSH_TIMEOUT, stats['pending_records'])
+
+class BatchingIngestQueue:
+    """
+    同步数据的后台攒批写入队列
+    
+    /from-source 指定 defer 时只把记录放入队列并立即返回，由后台线程合并后
+    一次性调用 sync_from_sources 写入，多个请求共用一次事务提交。
+    同一数据源、同一同步类型中重复的物料编码只保留最后提交的记录。
+    """
+    
+    def __init__(self, sync_system: SimplifiedIncrementalSync,
+                 max_batch: int = INGEST_MAX_BATCH,
+                 flush_interval: float = INGEST_FLUSH_INTERVAL):
+        self.sync_system = sync_system
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        
+        self._cond = threading.Condition()
+        # (sync_type, source_system) -> {material_code或序号: 记录}
+        self._pending: Dict[Tuple[str, str], Dict[Any, Dict[str, Any]]] = {}
+        self._pending_count = 0
+        self._in_flight = False
+        self._flush_requested = False
+        self._sequence = 0
+        self._stats = self._empty_stats()
+        
+        self._worker = threading.Thread(target=self._run, name='sync-ingest', daemon=True)
+        self._worker.start()
+        # 晚于同步系统注册，退出时先写完队列，再由同步系统写入缓冲的同步历史
+        atexit.register(_flush_ingest_at_exit, weakref.ref(self))
+    
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            'batches': 0,
+            'total_records': 0,
+            'new_records': 0,
+            'updated_records': 0,
+            'conflicts': 0,
+            'errors': 0,
+            'failed_sources': []
+        }
+    
+    def submit(self, source_system: str, records: List[Dict[str, Any]],
+               sync_type: str = 'incremental') -> int:
+        """放入队列，返回当前待写入记录数"""
+        with self._cond:
+            self._sequence += 1
+            pending = self._pending.setdefault((sync_type, source_system), {})
+            before = len(pending)
+            for offset, record in enumerate(records):
+                # 没有物料编码的记录交给同步系统计为错误，不参与去重
+                key = record.get('material_code') or (self._sequence, offset)
+                pending[key] = record
+            self._pending_count += len(pending) - before
+            
+            if self._pending_count >= self.max_batch:
+                self._cond.notify_all()
+            return self._pending_count
+    
+    def flush(self, timeout: Optional[float] = None) -> Tuple[bool, Dict[str, Any]]:
+        """
+        立即写入队列中的全部记录并等待完成
+        
+        返回 (是否在超时前完成, 上次flush以来的累计统计)；未完成时不清空统计
+        """
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            completed = self._cond.wait_for(
+                lambda: not self._pending_count and not self._in_flight, timeout
+            )
+            stats = dict(self._stats, pending_records=self._pending_count)
+            if completed:
+                self._stats = self._empty_stats()
+            return completed, stats
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending_count)
+                # 不足一批时再等一会儿，让后续请求并入同一次提交
+                self._cond.wait_for(
+                    lambda: self._flush_requested or self._pending_count >= self.max_batch,
+                    self.flush_interval
+                )
+                pending, self._pending = self._pending, {}
+                self._pending_count = 0
+                self._flush_requested = False
+                self._in_flight = True
+            
+            try:
+                self._write(pending)
+            finally:
+                with self._cond:
+                    self._in_flight = False
+                    self._cond.notify_all()
+    
+    def _write(self, pending: Dict[Tuple[str, str], Dict[Any, Dict[str, Any]]]):
+        by_type: Dict[str, List[Tuple[str, List[Dict[str, Any]]]]] = {}
+        for (sync_type, source_system), records in pending.items():
+            by_type.setdefault(sync_type, []).append(
+                (source_system, _sorted_by_material_code(list(records.values())))
+            )
+        
+        for sync_type, sources in by_type.items():
+            try:
+                outcomes = self.sync_system.sync_from_sources(sources, sync_type)
+            except Exception as e:
+                logger.exception("后台写入失败")
+                outcomes = [e] * len(sources)
+            
+            with self._cond:
+                stats = self._stats
+                stats['batches'] += 1
+                for (source_system, _), outcome in zip(sources, outcomes):
+                    if isinstance(outcome, Exception):
+                        stats['failed_sources'].append({
+                            'source_system': source_system,
+                            'error': str(outcome)
+                        })
+                        continue
+                    stats['total_records'] += outcome.total_records
+                    stats['new_records'] += outcome.new_records
+                    stats['updated_records'] += outcome.updated_records
+                    stats['conflicts'] += outcome.conflicts
+                    stats['errors'] += outcome.errors
+
+def _flush_resolutions_at_exit(writer_ref: 'weakref.ref'):
+    """进程退出时写入尚未落库的人工冲突解决结果（弱引用，不阻止实例回收）"""
+    writer = writer_ref()
+    if writer is None:
+        return
+    completed, stats = writer.flush(RESOLUTION_EXIT_FLUSH_TIMEOUT)
+    if not completed:
+        logger.error("退出时冲突解决结果未在 %s 秒内写完，剩余 %s 条",
+                     RESOLUTION_EXIT_FLUSH_TIMEOUT, stats['pending_resolutions'])
+    if stats['failed_resolutions']:
+        logger.error("退出前有 %s 条冲突解决结果写入失败: %s",
+                     len(stats['failed_resolutions']), stats['failed_resolutions'])
+
+class ConflictResolutionBatchWriter:
+    """
+    人工冲突解决结果的后台批量写入
+    
+    接口只负责入队，后台线程每次取出最多 max_batch_size 条，
+    通过 resolve_conflicts 在一个事务中写入。整批失败时逐条重试，
+    仍失败的记入统计，由 flush 返回。
+    """
+    
+    def __init__(self, sync_system: SimplifiedIncrementalSync,
+                 max_batch_size: int = RESOLUTION_MAX_BATCH_SIZE):
+        self.sync_system = sync_system
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue(maxsize=max_batch_size * 4)
+        self._stats_lock = threading.Lock()
+        self._stats = self._empty_stats()
+        
+        self._worker = threading.Thread(target=self._run, name='sync-resolution', daemon=True)
+        self._worker.start()
+        # 晚于同步系统注册，退出时先写完解决结果，再由同步系统写入缓冲的同步历史
+        atexit.register(_flush_resolutions_at_exit, weakref.ref(self))
+    
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            'batches': 0,
+            'resolved': 0,
+            'failed_resolutions': []
+        }
+    
+    def submit(self, conflict_id: str, resolver: str, resolved_at: str,
+               merged_data: Optional[Dict[str, Any]] = None):
+        """提交一条解决结果（队列已满时阻塞）"""
+        self._queue.put((conflict_id, resolver, resolved_at, merged_data))
+    
+    def flush(self, timeout: Optional[float] = None) -> Tuple[bool, Dict[str, Any]]:
+        """
+        等待已提交的解决结果全部写入
+        
+        返回 (是否在超时前完成, 上次flush以来的累计统计)；未完成时不清空统计
+        """
+        with self._queue.all_tasks_done:
+            completed = self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, timeout
+            )
+            pending = self._queue.unfinished_tasks
+        with self._stats_lock:
+            stats = dict(self._stats, pending_resolutions=pending)
+            if completed:
+                self._stats = self._empty_stats()
+        return completed, stats
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def _write(self, batch: List[Tuple[str, str, str, Optional[Dict[str, Any]]]]):
+        failed = []
+        try:
+            self.sync_system.resolve_conflicts(batch)
+        except Exception:
+            logger.exception("批量写入人工冲突解决结果失败，逐条重试")
+            # 整批在一个事务中回滚，逐条重试使其余结果不受个别失败影响
+            for resolution in batch:
+                try:
+                    self.sync_system.resolve_conflicts([resolution])
+                except Exception as e:
+                    logger.exception("写入冲突 %s 的解决结果失败", resolution[0])
+                    failed.append({'conflict_id': resolution[0], 'error': str(e)})
+        
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['resolved'] += len(batch) - len(failed)
+            self._stats['failed_resolutions'].extend(failed)
 
 def init_sync_system(app):
     """初始化增量同步系统"""
-    global sync_system
-    
     try:
         main_db_path = app.config.get('DATABASE_PATH', 'business_data.db')
         sync_db_path = app.config.get('SYNC_DATABASE_PATH', 'sync_tracking.db')
@@ -34,11 +492,18 @@ def init_sync_system(app):
             main_db_path=main_db_path,
             sync_db_path=sync_db_path
         )
+        app.extensions[SYNC_SYSTEM_EXTENSION] = sync_system
+        app.extensions[INGEST_QUEUE_EXTENSION] = BatchingIngestQueue(
+            sync_system,
+            max_batch=app.config.get('SYNC_INGEST_MAX_BATCH', INGEST_MAX_BATCH),
+            flush_interval=app.config.get('SYNC_INGEST_FLUSH_INTERVAL', INGEST_FLUSH_INTERVAL)
+        )
+        app.extensions[RESOLUTION_WRITER_EXTENSION] = ConflictResolutionBatchWriter(sync_system)
         
         logger.info("增量同步系统初始化成功")
         
     except Exception as e:
-        logger.error(f"增量同步系统初始化失败: {e}")
+        logger.exception("增量同步系统初始化失败")
         raise
 
 @sync_bp.route('/from-source', methods=['POST'])
@@ -50,6 +515,7 @@ def sync_from_external_source():
     {
         "source_system": "ERP",
         "sync_type": "incremental",
+        "defer": false,
         "data": [
             {
                 "material_code": "M001",
@@ -60,34 +526,41 @@ def sync_from_external_source():
             }
         ]
     }
+    
+    defer为true时记录放入后台写入队列并立即返回202，
+    之后可调用 /flush 等待写入完成并获取统计
     """
     
     try:
-        if not sync_system:
-            return jsonify({
-                'success': False,
-                'error': '同步系统未初始化'
-            }), 500
+        sync_system = current_app.extensions[SYNC_SYSTEM_EXTENSION]
         
-        data = request.get_json()
+        data = _body()
         
-        # 验证必需字段
-        if not data or 'source_system' not in data or 'data' not in data:
-            return jsonify({
+        # 验证请求体结构
+        error = _from_source_error(data)
+        if error:
+            return _json({
                 'success': False,
-                'error': '缺少必需字段source_system或data'
-            }), 400
+                'error': error
+            }, 400)
         
-        source_system = data['source_system']
-        source_data = data['data']
-        sync_type = data.get('sync_type', 'incremental')
+        source_system, source_data, sync_type, defer = _parse_from_source(data)
         
-        # 验证数据格式
-        if not isinstance(source_data, list) or len(source_data) == 0:
-            return jsonify({
-                'success': False,
-                'error': 'data必须是非空数组'
-            }), 400
+        if defer:
+            pending_records = current_app.extensions[INGEST_QUEUE_EXTENSION].submit(
+                source_system, source_data, sync_type
+            )
+            return _json({
+                'success': True,
+                'data': {
+                    'ingest_id': new_sync_id(f"INGEST_{source_system}"),
+                    'source_system': source_system,
+                    'sync_type': sync_type,
+                    'queued_records': len(source_data),
+                    'pending_records': pending_records
+                },
+                'timestamp': g.now
+            }, 202)
         
         # 执行同步
         sync_result = sync_system.sync_from_source(
@@ -96,87 +569,164 @@ def sync_from_external_source():
             sync_type=sync_type
         )
         
-        return jsonify({
+        return _json({
             'success': True,
             'data': {
-                'sync_id': f"SYNC_{source_system}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                'sync_id': sync_result.sync_id,
                 'source_system': source_system,
                 'sync_type': sync_type,
-                'total_records': sync_result.total_records,
-                'new_records': sync_result.new_records,
-                'updated_records': sync_result.updated_records,
-                'conflicts': sync_result.conflicts,
-                'errors': sync_result.errors,
-                'processing_time': sync_result.processing_time,
-                'sync_timestamp': sync_result.sync_timestamp.isoformat()
+                **sync_result.to_dict()
             },
-            'timestamp': datetime.now().isoformat()
-        }), 200
+            'timestamp': g.now
+        }, 200)
         
     except Exception as e:
-        logger.error(f"数据源同步失败: {traceback.format_exc()}")
-        return jsonify({
+        logger.exception("数据源同步失败")
+        return _json({
             'success': False,
             'error': f'数据源同步失败: {str(e)}'
-        }), 500
+        }, 500)
+
+@sync_bp.route('/flush', methods=['POST'])
+def flush_ingest_queue():
+    """
+    写入后台队列中的全部记录并返回累计统计
+
+    请求体（可选）：
+    {
+        "timeout": 30
+    }
+    """
+
+    try:
+        data = _body() or {}
+        timeout = data.get('timeout', 30) if isinstance(data, dict) else 30
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or timeout <= 0:
+            return _json({
+                'success': False,
+                'error': 'timeout必须是正数'
+            }, 400)
+
+        completed, stats = current_app.extensions[INGEST_QUEUE_EXTENSION].flush(timeout=timeout)
+
+        return _json({
+            'success': True,
+            'data': {
+                'completed': completed,
+                **stats
+            },
+            'timestamp': g.now
+        }, 200 if completed else 202)
+
+    except Exception as e:
+        logger.exception("写入同步队列失败")
+        return _json({
+            'success': False,
+            'error': f'写入同步队列失败: {str(e)}'
+        }, 500)
+
+@sync_bp.route('/conflicts/flush', methods=['POST'])
+def flush_conflict_resolutions():
+    """
+    等待已提交的人工冲突解决结果写入并返回累计统计（含写入失败的冲突）
+
+    请求体（可选）：
+    {
+        "timeout": 30
+    }
+    """
+
+    try:
+        data = _body() or {}
+        timeout = data.get('timeout', 30) if isinstance(data, dict) else 30
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or timeout <= 0:
+            return _json({
+                'success': False,
+                'error': 'timeout必须是正数'
+            }, 400)
+
+        completed, stats = current_app.extensions[RESOLUTION_WRITER_EXTENSION].flush(timeout=timeout)
+
+        return _json({
+            'success': True,
+            'data': {
+                'completed': completed,
+                **stats
+            },
+            'timestamp': g.now
+        }, 200 if completed else 202)
+
+    except Exception as e:
+        logger.exception("写入冲突解决结果失败")
+        return _json({
+            'success': False,
+            'error': f'写入冲突解决结果失败: {str(e)}'
+        }, 500)
 
 @sync_bp.route('/status', methods=['GET'])
 def get_sync_status():
     """获取同步状态报告"""
     
     try:
-        if not sync_system:
-            return jsonify({
-                'success': False,
-                'error': '同步系统未初始化'
-            }), 500
+        sync_system = current_app.extensions[SYNC_SYSTEM_EXTENSION]
+        
+        # 数据与配置未变化时直接返回304
+        etag, not_modified = _not_modified(sync_system)
+        if not_modified is not None:
+            return not_modified
         
         status_report = sync_system.get_sync_status()
         
-        return jsonify({
+        response = _json({
             'success': True,
             'data': status_report,
-            'timestamp': datetime.now().isoformat()
-        }), 200
+            'timestamp': g.now
+        }, 200)
+        response.set_etag(etag, weak=True)
+        return response
         
     except Exception as e:
-        logger.error(f"获取同步状态失败: {traceback.format_exc()}")
-        return jsonify({
+        logger.exception("获取同步状态失败")
+        return _json({
             'success': False,
             'error': f'获取同步状态失败: {str(e)}'
-        }), 500
+        }, 500)
 
 @sync_bp.route('/conflicts', methods=['GET'])
 def get_unresolved_conflicts():
     """获取需要人工审核的冲突"""
     
     try:
-        if not sync_system:
-            return jsonify({
-                'success': False,
-                'error': '同步系统未初始化'
-            }), 500
+        sync_system = current_app.extensions[SYNC_SYSTEM_EXTENSION]
         
-        conflicts = sync_system.get_conflicts_for_review()
+        # 冲突逐条序列化并流式输出，响应结构与一次性返回相同
+        conflicts = sync_system.iter_conflicts_for_review()
+        # 先取第一条，查询出错时仍可返回500
+        first_conflict = next(conflicts, None)
+        timestamp = _dumps(g.now)
         
-        return jsonify({
-            'success': True,
-            'data': {
-                'conflicts': conflicts,
-                'total_conflicts': len(conflicts)
-            },
-            'timestamp': datetime.now().isoformat()
-        }), 200
+        def generate():
+            yield b'{"success":true,"data":{"conflicts":['
+            total_conflicts = 0
+            if first_conflict is not None:
+                yield _dumps(first_conflict)
+                total_conflicts = 1
+                for conflict in conflicts:
+                    yield b',' + _dumps(conflict)
+                    total_conflicts += 1
+            yield b'],"total_conflicts":' + str(total_conflicts).encode() + b'},"timestamp":' + timestamp + b'}'
+        
+        return current_app.response_class(generate(), status=200, mimetype='application/json')
         
     except Exception as e:
-        logger.error(f"获取冲突列表失败: {traceback.format_exc()}")
-        return jsonify({
+        logger.exception("获取冲突列表失败")
+        return _json({
             'success': False,
             'error': f'获取冲突列表失败: {str(e)}'
-        }), 500
+        }, 500)
 
 @sync_bp.route('/conflicts/<conflict_id>/resolve', methods=['POST'])
-def resolve_conflict_manually():
+def resolve_conflict_manually(conflict_id: str):
     """
     手动解决冲突
     
@@ -196,46 +746,58 @@ def resolve_conflict_manually():
     """
     
     try:
-        if not sync_system:
-            return jsonify({
-                'success': False,
-                'error': '同步系统未初始化'
-            }), 500
+        sync_system = current_app.extensions[SYNC_SYSTEM_EXTENSION]
         
-        conflict_id = request.view_args['conflict_id']
-        data = request.get_json()
+        data = _body()
         
-        if not data:
-            return jsonify({
+        if not data or not isinstance(data, dict):
+            return _json({
                 'success': False,
                 'error': '缺少请求数据'
-            }), 400
+            }, 400)
         
         resolution_strategy = data.get('resolution_strategy')
         resolution_notes = data.get('resolution_notes', '')
+        merged_data = data.get('merged_data')
+        
+        if resolution_strategy == 'manual_merge' and not isinstance(merged_data, dict):
+            return _json({
+                'success': False,
+                'error': 'manual_merge需要提供merged_data对象'
+            }, 400)
+        
+        if not sync_system.is_conflict_unresolved(conflict_id):
+            return _json({
+                'success': False,
+                'error': f'冲突 {conflict_id} 不存在或已解决'
+            }, 404)
         
-        # 这里简化实现，实际需要根据conflict_id查找冲突并解决
-        # 由于完整实现较复杂，此处返回成功状态
+        # 解决结果由后台线程与其他请求合并写入，这里只入队
+        current_app.extensions[RESOLUTION_WRITER_EXTENSION].submit(
+            conflict_id, 'manual', g.now.isoformat(),
+            merged_data if isinstance(merged_data, dict) else None
+        )
         
-        return jsonify({
+        return _json({
             'success': True,
             'data': {
+                'resolution_id': new_sync_id('RESOLVE'),
                 'conflict_id': conflict_id,
                 'resolution_strategy': resolution_strategy,
-                'resolved_at': datetime.now().isoformat(),
+                'resolved_at': g.now,
                 'resolved_by': 'manual',
                 'notes': resolution_notes
             },
-            'message': f'冲突 {conflict_id} 已手动解决',
-            'timestamp': datetime.now().isoformat()
-        }), 200
+            'message': f'冲突 {conflict_id} 的解决结果已提交',
+            'timestamp': g.now
+        }, 202)
         
     except Exception as e:
-        logger.error(f"手动解决冲突失败: {traceback.format_exc()}")
-        return jsonify({
+        logger.exception("手动解决冲突失败")
+        return _json({
             'success': False,
             'error': f'手动解决冲突失败: {str(e)}'
-        }), 500
+        }, 500)
 
 @sync_bp.route('/batch-sync', methods=['POST'])
 def batch_sync_multiple_sources():
@@ -265,25 +827,26 @@ def batch_sync_multiple_sources():
     """
     
     try:
-        if not sync_system:
-            return jsonify({
-                'success': False,
-                'error': '同步系统未初始化'
-            }), 500
+        sync_system = current_app.extensions[SYNC_SYSTEM_EXTENSION]
         
-        data = request.get_json()
+        data = _body()
         
-        if not data or 'sync_sources' not in data:
-            return jsonify({
+        error = _batch_sync_error(data)
+        if error:
+            return _json({
                 'success': False,
-                'error': '缺少sync_sources字段'
-            }), 400
+                'error': error
+            }, 400)
         
         sync_sources = data['sync_sources']
         sync_options = data.get('sync_options', {})
         
-        # 按优先级排序
-        sync_sources.sort(key=lambda x: x.get('priority', 999))
+        # 按优先级排序（缺省999）：优先级只取一次，已有序时（常见情况）跳过排序
+        priorities = [source.get('priority', 999) for source in sync_sources]
+        if any(prev > cur for prev, cur in zip(priorities, priorities[1:])):
+            sync_sources = [
+                source for _, source in sorted(zip(priorities, sync_sources), key=itemgetter(0))
+            ]
         
         batch_results = []
         overall_stats = {
@@ -294,30 +857,41 @@ def batch_sync_multiple_sources():
             'total_conflicts': 0
         }
         
-        # 逐个同步各数据源
+        # 所有数据源在同步系统的一个事务中依次处理（每个数据源独立回滚），只提交一次；
+        # 缺少必需字段的数据源不参与同步，单独记为失败
+        source_outcomes = iter(sync_system.sync_from_sources(
+            [
+                (source_config['source_system'], _sorted_by_material_code(source_config['data']))
+                for source_config in sync_sources
+                if 'source_system' in source_config and 'data' in source_config
+            ],
+            sync_type='batch'
+        ))
+        
         for source_config in sync_sources:
+            if 'source_system' not in source_config or 'data' not in source_config:
+                batch_results.append({
+                    'source_system': source_config.get('source_system'),
+                    'status': 'failed',
+                    'error': '缺少必需字段source_system或data'
+                })
+                overall_stats['failed_syncs'] += 1
+                logger.error("同步数据源 %s 失败: 缺少必需字段", source_config.get('source_system'))
+                continue
+            
+            sync_result = next(source_outcomes)
             try:
+                if isinstance(sync_result, Exception):
+                    raise sync_result
                 source_system = source_config['source_system']
-                source_data = source_config['data']
-                
-                # 执行单个数据源同步
-                sync_result = sync_system.sync_from_source(
-                    source_system=source_system,
-                    source_data=source_data,
-                    sync_type='batch'
-                )
                 
+                result = sync_result.to_dict()
+                del result['sync_timestamp']  # 批量结果不含各数据源的同步时间
                 batch_results.append({
                     'source_system': source_system,
+                    'sync_id': sync_result.sync_id,
                     'status': 'success',
-                    'result': {
-                        'total_records': sync_result.total_records,
-                        'new_records': sync_result.new_records,
-                        'updated_records': sync_result.updated_records,
-                        'conflicts': sync_result.conflicts,
-                        'errors': sync_result.errors,
-                        'processing_time': sync_result.processing_time
-                    }
+                    'result': result
                 })
                 
                 # 更新整体统计
@@ -333,83 +907,109 @@ def batch_sync_multiple_sources():
                 })
                 
                 overall_stats['failed_syncs'] += 1
-                logger.error(f"同步数据源 {source_config['source_system']} 失败: {e}")
+                logger.error("同步数据源 %s 失败: %s", source_config['source_system'], e)
         
-        return jsonify({
+        return _json({
             'success': True,
             'data': {
-                'batch_id': f"BATCH_SYNC_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                'batch_id': new_sync_id('BATCH_SYNC'),
                 'overall_statistics': overall_stats,
                 'source_results': batch_results,
                 'sync_options': sync_options
             },
-            'timestamp': datetime.now().isoformat()
-        }), 200
+            'timestamp': g.now
+        }, 200)
         
     except Exception as e:
-        logger.error(f"批量同步失败: {traceback.format_exc()}")
-        return jsonify({
+        logger.exception("批量同步失败")
+        return _json({
             'success': False,
             'error': f'批量同步失败: {str(e)}'
-        }), 500
+        }, 500)
 
 @sync_bp.route('/config', methods=['GET', 'POST'])
 def manage_sync_config():
-    """获取或更新同步配置"""
+    """
+    获取或更新同步配置
+    
+    POST请求体：
+    {
+        "expected_version": 3,  // GET返回的sync_config_version，不一致时返回409
+        "sync_config": {"batch_size": 500},
+        "source_priority": {"ERP": 1}
+    }
+    """
     
     try:
-        if not sync_system:
-            return jsonify({
-                'success': False,
-                'error': '同步系统未初始化'
-            }), 500
+        sync_system = current_app.extensions[SYNC_SYSTEM_EXTENSION]
         
         if request.method == 'GET':
-            # 获取当前配置
-            return jsonify({
-                'success': True,
-                'data': {
-                    'sync_config': sync_system.sync_config,
-                    'source_priority': sync_system.source_priority,
-                    'supported_resolutions': [res.value for res in ConflictResolution]
-                },
-                'timestamp': datetime.now().isoformat()
-            }), 200
+            etag, not_modified = _not_modified(sync_system)
+            if not_modified is not None:
+                return not_modified
+            
+            # 获取当前配置（配置部分使用缓存的序列化结果，只拼接时间戳）
+            body = b''.join((
+                b'{"success":true,"data":', _config_data_bytes(sync_system),
+                b',"timestamp":', _dumps(g.now), b'}'
+            ))
+            response = current_app.response_class(body, status=200, mimetype='application/json')
+            response.set_etag(etag, weak=True)
+            return response
             
         elif request.method == 'POST':
             # 更新配置
-            data = request.get_json()
+            data = _body()
             
-            if not data:
-                return jsonify({
+            if not data or not isinstance(data, dict):
+                return _json({
                     'success': False,
                     'error': '缺少配置数据'
-                }), 400
+                }, 400)
             
-            # 更新同步配置
-            if 'sync_config' in data:
-                sync_system.sync_config.update(data['sync_config'])
+            expected_version = data.get('expected_version')
+            if not isinstance(expected_version, int) or isinstance(expected_version, bool):
+                return _json({
+                    'success': False,
+                    'error': '缺少expected_version（请先获取当前配置版本）'
+                }, 400)
             
-            # 更新数据源优先级
-            if 'source_priority' in data:
-                sync_system.source_priority.update(data['source_priority'])
+            # 版本一致时更新同步配置与数据源优先级，否则说明配置已被他人修改
+            try:
+                new_version = sync_system.update_config(
+                    expected_version,
+                    sync_config=data.get('sync_config'),
+                    source_priority=data.get('source_priority')
+                )
+            except ValueError as e:
+                return _json({
+                    'success': False,
+                    'error': str(e)
+                }, 400)
+            if new_version is None:
+                return _json({
+                    'success': False,
+                    'error': '配置已被修改，请重新获取后再提交',
+                    'current_version': sync_system.sync_config_version
+                }, 409)
             
-            return jsonify({
+            return _json({
                 'success': True,
                 'data': {
                     'sync_config': sync_system.sync_config,
-                    'source_priority': sync_system.source_priority
+                    'source_priority': sync_system.source_priority,
+                    'sync_config_version': new_version
                 },
                 'message': '同步配置已更新',
-                'timestamp': datetime.now().isoformat()
-            }), 200
+                'timestamp': g.now
+            }, 200)
         
     except Exception as e:
-        logger.error(f"管理同步配置失败: {traceback.format_exc()}")
-        return jsonify({
+        logger.exception("管理同步配置失败")
+        return _json({
             'success': False,
             'error': f'管理同步配置失败: {str(e)}'
-        }), 500
+        }, 500)
 
 @sync_bp.route('/history', methods=['GET'])
 def get_sync_history():
@@ -423,32 +1023,25 @@ def get_sync_history():
     """
     
     try:
-        if not sync_system:
-            return jsonify({
-                'success': False,
-                'error': '同步系统未初始化'
-            }), 500
+        sync_system = current_app.extensions[SYNC_SYSTEM_EXTENSION]
         
         # 获取查询参数
         source_system = request.args.get('source_system')
         limit = int(request.args.get('limit', 20))
         status = request.args.get('status')
         
-        # 简化实现，返回状态报告中的recent_syncs
-        status_report = sync_system.get_sync_status()
-        recent_syncs = status_report.get('recent_syncs', [])
-        
-        # 应用筛选
-        if source_system:
-            recent_syncs = [sync for sync in recent_syncs if sync.get('source_system') == source_system]
+        etag, not_modified = _not_modified(sync_system)
+        if not_modified is not None:
+            return not_modified
         
-        if status:
-            recent_syncs = [sync for sync in recent_syncs if sync.get('status') == status]
-        
-        # 应用限制
-        recent_syncs = recent_syncs[:limit]
+        # 筛选和数量限制由同步系统在SQL中完成
+        recent_syncs = sync_system.query_sync_history(
+            source_system=source_system or None,
+            status=status or None,
+            limit=limit
+        )
         
-        return jsonify({
+        response = _json({
             'success': True,
             'data': {
                 'sync_history': recent_syncs,
@@ -459,34 +1052,36 @@ def get_sync_history():
                     'limit': limit
                 }
             },
-            'timestamp': datetime.now().isoformat()
-        }), 200
+            'timestamp': g.now
+        }, 200)
+        response.set_etag(etag, weak=True)
+        return response
         
     except Exception as e:
-        logger.error(f"获取同步历史失败: {traceback.format_exc()}")
-        return jsonify({
+        logger.exception("获取同步历史失败")
+        return _json({
             'success': False,
             'error': f'获取同步历史失败: {str(e)}'
-        }), 500
+        }, 500)
 
 # 错误处理
 @sync_bp.errorhandler(404)
 def not_found(error):
-    return jsonify({
+    return _json({
         'success': False,
         'error': '接口不存在'
-    }), 404
+    }, 404)
 
 @sync_bp.errorhandler(405)
 def method_not_allowed(error):
-    return jsonify({
+    return _json({
         'success': False,
         'error': '请求方法不被允许'
-    }), 405
+    }, 405)
 
 @sync_bp.errorhandler(500)
 def internal_error(error):
-    return jsonify({
+    return _json({
         'success': False,
         'error': '内部服务器错误'
-    }), 500
\ No newline at end of file
+    }, 500)
\ No newline at end of file
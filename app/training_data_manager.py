@@ -7,25 +7,270 @@ import sqlite3
 import json
 import pickle
 import logging
+import queue
+import re
+import threading
+import zlib
+import numpy as np
 import pandas as pd
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Tuple
+from itertools import chain, islice, repeat
+from pathlib import Path
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 import os
 
+# zstandard（可选）：压缩序列化后的模型，未安装时使用标准库zlib
+try:
+    import zstandard
+    ZSTANDARD_AVAILABLE = True
+except ImportError:
+    ZSTANDARD_AVAILABLE = False
+
+# orjson（可选）：JSON列的快速序列化
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# msgpack（可选）：特征名称的二进制编码，未安装时使用pickle
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# pyarrow（可选）：多线程C++ CSV解析
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# python-calamine（可选）：Rust实现的Excel读取，pandas 2.2起可作为read_excel引擎
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_AVAILABLE = tuple(int(part) for part in pd.__version__.split('.')[:2]) >= (2, 2)
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# 模型数据前缀：标记压缩方式，无前缀的是旧版本写入的未压缩pickle
+_MODEL_ZSTD_MAGIC = b'ZST1'
+_MODEL_ZLIB_MAGIC = b'ZLB1'
+MODEL_ZSTD_LEVEL = 9
+
+# 特征名称编码版本（首字节），TEXT类型的旧数据为JSON
+_FEATURES_MSGPACK = b'\x01'
+_FEATURES_PICKLE = b'\x02'
+
+# 每个连接缓存的预编译语句数量
+STATEMENT_CACHE_SIZE = 256
+
+# 导入训练样本时每次 executemany 的行数
+IMPORT_CHUNK_SIZE = 10000
+
+# 多行VALUES插入每条语句的行数（6列×100行，低于旧版SQLite的999个参数上限）
+MULTI_ROW_INSERT_ROWS = 100
+
+# 空闲只读连接的保留上限（并发读超过该数时临时新建连接，用完关闭）
+READ_POOL_SIZE = 4
+
+# 列名关键词 -> 目标字段；按顺序匹配，一列只映射到第一个命中的字段
+_COLUMN_KEYWORDS = (
+    ('material_code', ['编号', 'code', 'id', '代码']),
+    ('material_name', ['名称', 'name', '物料名']),
+    ('brand', ['品牌', 'brand', '厂家', '生产商', 'manufacturer']),
+    ('specification', ['规格', 'spec', '型号', 'specification']),
+    ('category', ['分类', 'category', '类别']),
+)
+_COLUMN_FIELD_PATTERNS = tuple(
+    (field, re.compile('|'.join(map(re.escape, keywords))))
+    for field, keywords in _COLUMN_KEYWORDS
+)
+
+# 训练样本的目标字段（顺序与插入语句一致）
+_SAMPLE_FIELDS = ('material_code', 'material_name', 'brand', 'specification', 'category')
+
+_SQL_INSERT_SAMPLE = '''
+    INSERT INTO training_samples 
+    (material_code, material_name, brand, specification, category, source_file)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+_SQL_INSERT_SAMPLES_MULTI = '''
+    INSERT INTO training_samples 
+    (material_code, material_name, brand, specification, category, source_file)
+    VALUES {}
+'''.format(', '.join(['(?, ?, ?, ?, ?, ?)'] * MULTI_ROW_INSERT_ROWS))
+
+_SQL_INSERT_RULE = '''
+    INSERT INTO classification_rules_cache
+    (rule_type, rule_key, rule_value, confidence, training_session_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+_SQL_INSERT_RESULT = '''
+    INSERT OR REPLACE INTO training_results 
+    (training_session_id, total_samples, model_accuracy, model_metrics,
+     keyword_rules, manufacturer_rules, specification_rules, enhanced_keywords, notes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_SQL_SELECT_LATEST_RESULT = '''
+    SELECT training_session_id, total_samples, model_accuracy, model_metrics,
+           keyword_rules, manufacturer_rules, specification_rules, 
+           enhanced_keywords, training_date
+    FROM training_results
+    ORDER BY training_date DESC
+    LIMIT 1
+'''
+
+_SQL_DEACTIVATE_MODEL = '''
+    UPDATE classification_models 
+    SET is_active = 0 
+    WHERE model_name = ? AND is_active = 1
+'''
+
+_SQL_INSERT_MODEL = '''
+    INSERT INTO classification_models
+    (model_name, model_version, model_type, model_data, 
+     feature_names, model_parameters, training_session_id, is_active)
+    VALUES (?, ?, ?, ?, ?, ?, ?, TRUE)
+'''
+
+_SQL_SELECT_ACTIVE_MODEL = '''
+    SELECT model_data, feature_names, model_parameters
+    FROM classification_models
+    WHERE model_name = ? AND is_active = 1
+'''
+
+_SQL_DELETE_SESSION_RULES = 'DELETE FROM classification_rules_cache WHERE training_session_id = ?'
+
+_SQL_SELECT_RULES_BY_TYPE = '''
+    SELECT rule_key, rule_value, confidence
+    FROM classification_rules_cache
+    WHERE rule_type = ? AND is_active = TRUE
+    ORDER BY id
+'''
+
+_SQL_SELECT_RULES = '''
+    SELECT rule_type, rule_key, rule_value, confidence
+    FROM classification_rules_cache
+    WHERE is_active = TRUE
+    ORDER BY id
+'''
+
+# 训练统计：各项计数在一条语句中完成
+_SQL_TRAINING_STATISTICS = '''
+    SELECT
+        (SELECT COUNT(*) FROM training_samples),
+        (SELECT COUNT(DISTINCT category) FROM training_samples WHERE category IS NOT NULL),
+        (SELECT COUNT(DISTINCT brand) FROM training_samples WHERE brand IS NOT NULL),
+        (SELECT COUNT(*) FROM training_results),
+        (SELECT COUNT(*) FROM classification_models WHERE is_active = TRUE)
+'''
+
+def _json_dumps(obj: Any) -> str:
+    """序列化为JSON文本（有orjson时使用orjson）"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode('utf-8')
+    return json.dumps(obj)
+
+def _json_loads(text: str) -> Any:
+    """解析JSON文本"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(text)
+    return json.loads(text)
+
 class TrainingDataManager:
     """训练数据和模型管理器"""
     
     def __init__(self, db_path: str = 'training_data.db'):
         self.db_path = db_path
+        
+        # 单个读写连接（写操作串行），读操作使用只读连接池
+        self._write_conn = self._connect()
+        self._write_lock = threading.Lock()
+        self._read_pool: queue.Queue = queue.Queue(maxsize=READ_POOL_SIZE)
+        
         self._init_database()
+        
+        # 训练统计缓存：(data_version, 统计结果)。data_version 由单独的连接读取，
+        # 任何连接（含其他进程）提交写入后都会变化
+        self._version_conn = self._connect(read_only=True)
+        self._version_lock = threading.Lock()
+        self._stats_cache: Optional[Tuple[int, Dict[str, Any]]] = None
+    
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """打开训练库连接并应用连接级的性能参数（这些PRAGMA不会持久化到库文件）"""
+        if read_only:
+            conn = sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro",
+                                   uri=True, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-65536')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA wal_autocheckpoint=1000')
+        return conn
+    
+    @contextmanager
+    def _writer(self) -> Iterator[sqlite3.Connection]:
+        """独占读写连接，正常结束时提交，异常时回滚"""
+        with self._write_lock, self._write_conn:
+            yield self._write_conn
+    
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """从连接池借出一个只读连接"""
+        try:
+            conn = self._read_pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect(read_only=True)
+        
+        try:
+            yield conn
+        finally:
+            try:
+                self._read_pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    def close(self):
+        """关闭读写连接和连接池中的只读连接"""
+        while True:
+            try:
+                self._read_pool.get_nowait().close()
+            except queue.Empty:
+                break
+        
+        with self._write_lock:
+            self._write_conn.close()
+        with self._version_lock:
+            self._version_conn.close()
+    
+    def _data_version(self) -> int:
+        """训练库的数据版本，库中有新提交后改变"""
+        with self._version_lock:
+            return self._version_conn.execute('PRAGMA data_version').fetchone()[0]
     
     def _init_database(self):
         """初始化训练数据库表结构"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._writer() as conn:
             cursor = conn.cursor()
             
+            # WAL模式写入库文件后持久生效，配合 synchronous=NORMAL 每次提交不再两次fsync
+            cursor.execute('PRAGMA journal_mode=WAL')
+            
             # 1. 训练数据表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS training_samples (
@@ -66,7 +311,7 @@ class TrainingDataManager:
                     model_version TEXT NOT NULL,
                     model_type TEXT,  -- tfidf, neural_network, etc.
                     model_data BLOB,  -- 序列化的模型数据
-                    feature_names TEXT,  -- JSON格式的特征名称
+                    feature_names BLOB,  -- 特征名称（首字节为编码版本）
                     model_parameters TEXT,  -- JSON格式的模型参数
                     training_session_id TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -93,8 +338,40 @@ class TrainingDataManager:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_training_samples_name ON training_samples(material_name)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_training_samples_brand ON training_samples(brand)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_training_samples_category ON training_samples(category)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_classification_rules_type ON classification_rules_cache(rule_type)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_classification_rules_active ON classification_rules_cache(is_active)')
+            
+            # 规则查询的覆盖索引：按类型筛选后直接从索引读取所需列，不再回表；
+            # id 紧随筛选列，索引顺序即写入顺序，ORDER BY id 无需额外排序
+            has_cover_index = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_rules_cache_cover'"
+            ).fetchone() is not None
+            if not has_cover_index:
+                cursor.execute('''
+                    CREATE INDEX idx_rules_cache_cover ON classification_rules_cache(
+                        rule_type, is_active, id, rule_key, rule_value, confidence
+                    )
+                ''')
+                cursor.execute('DROP INDEX IF EXISTS idx_classification_rules_type')
+                cursor.execute('DROP INDEX IF EXISTS idx_classification_rules_active')
+                # 新建索引后收集一次统计信息，供查询规划器选择
+                cursor.execute('ANALYZE classification_rules_cache')
+            
+            # 每个模型名称至多一个活跃版本：由部分唯一索引保证
+            has_active_index = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_models_one_active'"
+            ).fetchone() is not None
+            if not has_active_index:
+                # 旧数据库可能存在多个活跃版本，仅保留最新的一个
+                cursor.execute('''
+                    UPDATE classification_models SET is_active = 0
+                    WHERE is_active = 1 AND id NOT IN (
+                        SELECT MAX(id) FROM classification_models
+                        WHERE is_active = 1 GROUP BY model_name
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE UNIQUE INDEX idx_models_one_active
+                    ON classification_models(model_name) WHERE is_active = 1
+                ''')
             
             conn.commit()
             logger.info("训练数据库初始化完成")
@@ -104,8 +381,10 @@ class TrainingDataManager:
         training_session_id = f"import_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         total_imported = 0
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._writer() as conn:
             cursor = conn.cursor()
+            # 整个导入在一个事务中完成，各批次使用保存点
+            cursor.execute('BEGIN')
             
             for file_path in file_paths:
                 try:
@@ -114,33 +393,28 @@ class TrainingDataManager:
                         continue
                     
                     # 读取文件数据
-                    if file_path.endswith('.csv'):
-                        df = pd.read_csv(file_path)
-                    else:
-                        df = pd.read_excel(file_path)
+                    df = self._read_table(file_path)
                     
                     # 标准化列名映射
                     column_mapping = self._get_column_mapping(df.columns.tolist())
                     
-                    for _, row in df.iterrows():
-                        try:
-                            material_code = row.get(column_mapping.get('material_code', ''), '')
-                            material_name = row.get(column_mapping.get('material_name', ''), '')
-                            brand = row.get(column_mapping.get('brand', ''), '')
-                            specification = row.get(column_mapping.get('specification', ''), '')
-                            category = row.get(column_mapping.get('category', ''), '')
-                            
-                            if material_name:  # 至少需要物料名称
-                                cursor.execute('''
-                                    INSERT INTO training_samples 
-                                    (material_code, material_name, brand, specification, category, source_file)
-                                    VALUES (?, ?, ?, ?, ?, ?)
-                                ''', (material_code, material_name, brand, specification, category, file_path))
-                                total_imported += 1
-                        
-                        except Exception as e:
-                            logger.warning(f"导入行数据失败: {e}")
-                            continue
+                    # 按目标字段逐列取出numpy数组，未映射的字段为空字符串
+                    columns = [
+                        df[column_mapping[field]].to_numpy(dtype=object) if field in column_mapping
+                        else np.full(len(df), '', dtype=object)
+                        for field in _SAMPLE_FIELDS
+                    ]
+                    
+                    # 至少需要物料名称
+                    names = columns[_SAMPLE_FIELDS.index('material_name')]
+                    keep = pd.notna(names) & names.astype(bool)
+                    
+                    rows = zip(*(column[keep] for column in columns), repeat(file_path))
+                    while True:
+                        chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+                        if not chunk:
+                            break
+                        total_imported += self._insert_sample_chunk(cursor, chunk)
                     
                     logger.info(f"从 {file_path} 导入了 {len(df)} 条记录")
                 
@@ -153,118 +427,174 @@ class TrainingDataManager:
         logger.info(f"训练数据导入完成，会话ID: {training_session_id}, 总计: {total_imported} 条")
         return training_session_id
     
+    @staticmethod
+    def _read_table(file_path: str) -> pd.DataFrame:
+        """读取CSV/Excel文件（有pyarrow/python-calamine时使用更快的解析引擎）"""
+        if file_path.endswith('.csv'):
+            if PYARROW_AVAILABLE:
+                return pd.read_csv(file_path, engine='pyarrow')
+            return pd.read_csv(file_path)
+        
+        if CALAMINE_AVAILABLE:
+            return pd.read_excel(file_path, engine='calamine')
+        return pd.read_excel(file_path)
+    
+    @staticmethod
+    def _insert_sample_chunk(cursor: sqlite3.Cursor, chunk: List[Tuple]) -> int:
+        """批量插入一批训练样本，返回插入行数；整批失败时逐行重试并跳过出错的行"""
+        # 整组的行用多行VALUES语句插入，余下不足一组的逐行插入
+        full = len(chunk) - len(chunk) % MULTI_ROW_INSERT_ROWS
+        groups = (
+            tuple(chain.from_iterable(chunk[start:start + MULTI_ROW_INSERT_ROWS]))
+            for start in range(0, full, MULTI_ROW_INSERT_ROWS)
+        )
+        
+        cursor.execute('SAVEPOINT sample_chunk')
+        try:
+            cursor.executemany(_SQL_INSERT_SAMPLES_MULTI, groups)
+            cursor.executemany(_SQL_INSERT_SAMPLE, chunk[full:])
+            cursor.execute('RELEASE sample_chunk')
+            return len(chunk)
+        except sqlite3.Error:
+            cursor.execute('ROLLBACK TO sample_chunk')
+            cursor.execute('RELEASE sample_chunk')
+        
+        inserted = 0
+        for row in chunk:
+            try:
+                cursor.execute(_SQL_INSERT_SAMPLE, row)
+                inserted += 1
+            except sqlite3.Error as e:
+                logger.warning(f"导入行数据失败: {e}")
+        return inserted
+    
     def _get_column_mapping(self, columns: List[str]) -> Dict[str, str]:
         """获取列名映射"""
         mapping = {}
         
         for col in columns:
             col_lower = col.lower()
-            if any(keyword in col_lower for keyword in ['编号', 'code', 'id', '代码']):
-                mapping['material_code'] = col
-            elif any(keyword in col_lower for keyword in ['名称', 'name', '物料名']):
-                mapping['material_name'] = col
-            elif any(keyword in col_lower for keyword in ['品牌', 'brand', '厂家', '生产商', 'manufacturer']):
-                mapping['brand'] = col
-            elif any(keyword in col_lower for keyword in ['规格', 'spec', '型号', 'specification']):
-                mapping['specification'] = col
-            elif any(keyword in col_lower for keyword in ['分类', 'category', '类别']):
-                mapping['category'] = col
+            for field, pattern in _COLUMN_FIELD_PATTERNS:
+                if pattern.search(col_lower):
+                    mapping[field] = col
+                    break
         
         return mapping
     
-    def save_training_results(self, session_id: str, results: Dict[str, Any]) -> bool:
-        """保存训练结果"""
+    @staticmethod
+    def _dump_model(model_obj: Any) -> bytes:
+        """序列化并压缩模型"""
+        data = pickle.dumps(model_obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if ZSTANDARD_AVAILABLE:
+            return _MODEL_ZSTD_MAGIC + zstandard.ZstdCompressor(level=MODEL_ZSTD_LEVEL).compress(data)
+        return _MODEL_ZLIB_MAGIC + zlib.compress(data)
+    
+    @staticmethod
+    def _load_model(blob: bytes) -> Any:
+        """按前缀解压并反序列化模型（兼容未压缩的旧数据）"""
+        if blob.startswith(_MODEL_ZSTD_MAGIC):
+            if not ZSTANDARD_AVAILABLE:
+                raise RuntimeError('模型使用zstd压缩，需要安装zstandard')
+            return pickle.loads(zstandard.ZstdDecompressor().decompress(blob[len(_MODEL_ZSTD_MAGIC):]))
+        if blob.startswith(_MODEL_ZLIB_MAGIC):
+            return pickle.loads(zlib.decompress(blob[len(_MODEL_ZLIB_MAGIC):]))
+        return pickle.loads(blob)
+    
+    @staticmethod
+    def _dump_feature_names(feature_names: List[str]) -> bytes:
+        """编码特征名称（msgpack优先，否则pickle）"""
+        if MSGPACK_AVAILABLE:
+            return _FEATURES_MSGPACK + msgpack.packb(list(feature_names), use_bin_type=True)
+        return _FEATURES_PICKLE + pickle.dumps(list(feature_names), protocol=pickle.HIGHEST_PROTOCOL)
+    
+    @staticmethod
+    def _load_feature_names(value: Any) -> List[str]:
+        """按版本前缀解码特征名称（兼容JSON文本的旧数据）"""
+        if isinstance(value, str):
+            return _json_loads(value)
+        if value[:1] == _FEATURES_MSGPACK:
+            if not MSGPACK_AVAILABLE:
+                raise RuntimeError('特征名称使用msgpack编码，需要安装msgpack')
+            return msgpack.unpackb(value[1:], raw=False)
+        if value[:1] == _FEATURES_PICKLE:
+            return pickle.loads(value[1:])
+        return _json_loads(value)
+    
+    def save_training_results(self, session_id: str, results: Dict[str, Any]) -> Optional[int]:
+        """保存训练结果，返回新记录的id，失败时返回None"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._writer() as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    INSERT OR REPLACE INTO training_results 
-                    (training_session_id, total_samples, model_accuracy, model_metrics,
-                     keyword_rules, manufacturer_rules, specification_rules, enhanced_keywords, notes)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
+                cursor.execute(_SQL_INSERT_RESULT, (
                     session_id,
                     results.get('total_samples', 0),
                     results.get('model_accuracy', 0.0),
-                    json.dumps(results.get('model_metrics', {})),
-                    json.dumps(results.get('keyword_rules', {})),
-                    json.dumps(results.get('manufacturer_rules', {})),
-                    json.dumps(results.get('specification_rules', {})),
-                    json.dumps(results.get('enhanced_keywords', {})),
+                    _json_dumps(results.get('model_metrics', {})),
+                    _json_dumps(results.get('keyword_rules', {})),
+                    _json_dumps(results.get('manufacturer_rules', {})),
+                    _json_dumps(results.get('specification_rules', {})),
+                    _json_dumps(results.get('enhanced_keywords', {})),
                     results.get('notes', '')
                 ))
                 
+                result_id = cursor.lastrowid
                 conn.commit()
                 logger.info(f"训练结果已保存，会话ID: {session_id}")
-                return True
+                return result_id
         
         except Exception as e:
             logger.error(f"保存训练结果失败: {e}")
-            return False
+            return None
     
     def save_classification_model(self, model_name: str, model_version: str, 
                                 model_type: str, model_obj: Any, 
                                 feature_names: List[str], parameters: Dict,
-                                training_session_id: str) -> bool:
-        """保存分类模型"""
+                                training_session_id: str) -> Optional[int]:
+        """保存分类模型，返回新模型的id，失败时返回None"""
         try:
-            # 序列化模型
-            model_data = pickle.dumps(model_obj)
+            # 序列化并压缩模型
+            model_data = self._dump_model(model_obj)
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self._writer() as conn:
                 cursor = conn.cursor()
                 
-                # 先将其他相同名称的模型设为非活跃
-                cursor.execute('''
-                    UPDATE classification_models 
-                    SET is_active = FALSE 
-                    WHERE model_name = ?
-                ''', (model_name,))
+                # 先将当前活跃版本设为非活跃（部分唯一索引保证至多一行）
+                cursor.execute(_SQL_DEACTIVATE_MODEL, (model_name,))
                 
                 # 插入新模型
-                cursor.execute('''
-                    INSERT INTO classification_models
-                    (model_name, model_version, model_type, model_data, 
-                     feature_names, model_parameters, training_session_id, is_active)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, TRUE)
-                ''', (
+                cursor.execute(_SQL_INSERT_MODEL, (
                     model_name,
                     model_version,
                     model_type,
                     model_data,
-                    json.dumps(feature_names),
-                    json.dumps(parameters),
+                    self._dump_feature_names(feature_names),
+                    _json_dumps(parameters),
                     training_session_id
                 ))
                 
+                model_id = cursor.lastrowid
                 conn.commit()
                 logger.info(f"分类模型已保存: {model_name} v{model_version}")
-                return True
+                return model_id
         
         except Exception as e:
             logger.error(f"保存分类模型失败: {e}")
-            return False
+            return None
     
     def load_active_classification_model(self, model_name: str) -> Optional[Tuple[Any, List[str], Dict]]:
         """加载活跃的分类模型"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._reader() as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    SELECT model_data, feature_names, model_parameters
-                    FROM classification_models
-                    WHERE model_name = ? AND is_active = TRUE
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                ''', (model_name,))
+                cursor.execute(_SQL_SELECT_ACTIVE_MODEL, (model_name,))
                 
                 row = cursor.fetchone()
                 if row:
-                    model_obj = pickle.loads(row[0])
-                    feature_names = json.loads(row[1])
-                    parameters = json.loads(row[2])
+                    model_obj = self._load_model(row[0])
+                    feature_names = self._load_feature_names(row[1])
+                    parameters = _json_loads(row[2])
                     return model_obj, feature_names, parameters
                 
                 return None
@@ -276,17 +606,10 @@ class TrainingDataManager:
     def get_latest_training_results(self) -> Optional[Dict[str, Any]]:
         """获取最新的训练结果"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._reader() as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    SELECT training_session_id, total_samples, model_accuracy, model_metrics,
-                           keyword_rules, manufacturer_rules, specification_rules, 
-                           enhanced_keywords, training_date
-                    FROM training_results
-                    ORDER BY training_date DESC
-                    LIMIT 1
-                ''')
+                cursor.execute(_SQL_SELECT_LATEST_RESULT)
                 
                 row = cursor.fetchone()
                 if row:
@@ -294,11 +617,11 @@ class TrainingDataManager:
                         'training_session_id': row[0],
                         'total_samples': row[1],
                         'model_accuracy': row[2],
-                        'model_metrics': json.loads(row[3]) if row[3] else {},
-                        'keyword_rules': json.loads(row[4]) if row[4] else {},
-                        'manufacturer_rules': json.loads(row[5]) if row[5] else {},
-                        'specification_rules': json.loads(row[6]) if row[6] else {},
-                        'enhanced_keywords': json.loads(row[7]) if row[7] else {},
+                        'model_metrics': _json_loads(row[3]) if row[3] else {},
+                        'keyword_rules': _json_loads(row[4]) if row[4] else {},
+                        'manufacturer_rules': _json_loads(row[5]) if row[5] else {},
+                        'specification_rules': _json_loads(row[6]) if row[6] else {},
+                        'enhanced_keywords': _json_loads(row[7]) if row[7] else {},
                         'training_date': row[8]
                     }
                 
@@ -311,41 +634,29 @@ class TrainingDataManager:
     def cache_classification_rules(self, rules: Dict[str, Any], training_session_id: str):
         """缓存分类规则以提高查询性能"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._writer() as conn:
                 cursor = conn.cursor()
                 
                 # 清除旧的缓存
-                cursor.execute('DELETE FROM classification_rules_cache WHERE training_session_id = ?', 
-                             (training_session_id,))
-                
-                # 缓存关键词规则
-                if 'keyword_rules' in rules:
-                    for category, rule_data in rules['keyword_rules'].items():
-                        for keyword in rule_data.get('keywords', []):
-                            cursor.execute('''
-                                INSERT INTO classification_rules_cache
-                                (rule_type, rule_key, rule_value, confidence, training_session_id)
-                                VALUES (?, ?, ?, ?, ?)
-                            ''', ('keyword', keyword, category, rule_data.get('confidence_base', 0.5), training_session_id))
+                cursor.execute(_SQL_DELETE_SESSION_RULES, (training_session_id,))
                 
-                # 缓存制造商规则
-                if 'manufacturer_rules' in rules:
-                    for manufacturer, category in rules['manufacturer_rules'].items():
-                        cursor.execute('''
-                            INSERT INTO classification_rules_cache
-                            (rule_type, rule_key, rule_value, confidence, training_session_id)
-                            VALUES (?, ?, ?, ?, ?)
-                        ''', ('manufacturer', manufacturer, category, 0.75, training_session_id))
+                # 关键词、制造商、规格规则整理为行后一次写入
+                rule_rows = [
+                    ('keyword', keyword, category, rule_data.get('confidence_base', 0.5), training_session_id)
+                    for category, rule_data in rules.get('keyword_rules', {}).items()
+                    for keyword in rule_data.get('keywords', [])
+                ]
+                rule_rows.extend(
+                    ('manufacturer', manufacturer, category, 0.75, training_session_id)
+                    for manufacturer, category in rules.get('manufacturer_rules', {}).items()
+                )
+                rule_rows.extend(
+                    ('specification', keyword, category, 0.6, training_session_id)
+                    for category, spec_keywords in rules.get('specification_rules', {}).items()
+                    for keyword in spec_keywords
+                )
                 
-                # 缓存规格规则
-                if 'specification_rules' in rules:
-                    for category, spec_keywords in rules['specification_rules'].items():
-                        for keyword in spec_keywords:
-                            cursor.execute('''
-                                INSERT INTO classification_rules_cache
-                                (rule_type, rule_key, rule_value, confidence, training_session_id)
-                                VALUES (?, ?, ?, ?, ?)
-                            ''', ('specification', keyword, category, 0.6, training_session_id))
+                cursor.executemany(_SQL_INSERT_RULE, rule_rows)
                 
                 conn.commit()
                 logger.info(f"分类规则缓存完成，会话ID: {training_session_id}")
@@ -356,38 +667,25 @@ class TrainingDataManager:
     def get_classification_rules(self, rule_type: str = None) -> Dict[str, Any]:
         """获取分类规则"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._reader() as conn:
                 cursor = conn.cursor()
                 
                 if rule_type:
-                    cursor.execute('''
-                        SELECT rule_key, rule_value, confidence
-                        FROM classification_rules_cache
-                        WHERE rule_type = ? AND is_active = TRUE
-                    ''', (rule_type,))
+                    cursor.execute(_SQL_SELECT_RULES_BY_TYPE, (rule_type,))
                 else:
-                    cursor.execute('''
-                        SELECT rule_type, rule_key, rule_value, confidence
-                        FROM classification_rules_cache
-                        WHERE is_active = TRUE
-                    ''')
+                    cursor.execute(_SQL_SELECT_RULES)
                 
-                rules = {}
-                for row in cursor.fetchall():
-                    if rule_type:
-                        rule_key, rule_value, confidence = row
-                        if rule_value not in rules:
-                            rules[rule_value] = []
+                # 直接迭代游标逐行读取，不先构建完整结果列表
+                if rule_type:
+                    rules = defaultdict(list)
+                    for rule_key, rule_value, confidence in cursor:
                         rules[rule_value].append({'keyword': rule_key, 'confidence': confidence})
-                    else:
-                        rule_type_val, rule_key, rule_value, confidence = row
-                        if rule_type_val not in rules:
-                            rules[rule_type_val] = {}
-                        if rule_value not in rules[rule_type_val]:
-                            rules[rule_type_val][rule_value] = []
-                        rules[rule_type_val][rule_value].append({'keyword': rule_key, 'confidence': confidence})
+                    return dict(rules)
                 
-                return rules
+                rules_by_type = defaultdict(lambda: defaultdict(list))
+                for rule_type_val, rule_key, rule_value, confidence in cursor:
+                    rules_by_type[rule_type_val][rule_value].append({'keyword': rule_key, 'confidence': confidence})
+                return {type_key: dict(type_rules) for type_key, type_rules in rules_by_type.items()}
         
         except Exception as e:
             logger.error(f"获取分类规则失败: {e}")
@@ -396,33 +694,25 @@ class TrainingDataManager:
     def get_training_statistics(self) -> Dict[str, Any]:
         """获取训练统计信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # 训练样本统计
-                cursor.execute('SELECT COUNT(*) FROM training_samples')
-                total_samples = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(DISTINCT category) FROM training_samples WHERE category IS NOT NULL')
-                categories_count = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(DISTINCT brand) FROM training_samples WHERE brand IS NOT NULL')
-                brands_count = cursor.fetchone()[0]
-                
-                # 训练结果统计
-                cursor.execute('SELECT COUNT(*) FROM training_results')
-                training_sessions = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(*) FROM classification_models WHERE is_active = TRUE')
-                active_models = cursor.fetchone()[0]
-                
-                return {
-                    'total_training_samples': total_samples,
-                    'categories_count': categories_count,
-                    'brands_count': brands_count,
-                    'training_sessions': training_sessions,
-                    'active_models': active_models
-                }
+            # 库中没有新提交时直接返回上次的统计
+            data_version = self._data_version()
+            cached = self._stats_cache
+            if cached is not None and cached[0] == data_version:
+                return dict(cached[1])
+            
+            with self._reader() as conn:
+                (total_samples, categories_count, brands_count,
+                 training_sessions, active_models) = conn.execute(_SQL_TRAINING_STATISTICS).fetchone()
+            
+            stats = {
+                'total_training_samples': total_samples,
+                'categories_count': categories_count,
+                'brands_count': brands_count,
+                'training_sessions': training_sessions,
+                'active_models': active_models
+            }
+            self._stats_cache = (data_version, stats)
+            return dict(stats)
         
         except Exception as e:
             logger.error(f"获取训练统计失败: {e}")
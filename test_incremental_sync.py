@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+增量同步回归测试
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# 确保当前目录在Python路径中
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from app.simplified_incremental_sync import SimplifiedIncrementalSync
+
+
+@pytest.fixture
+def sync_system(tmp_path):
+    """创建带主表的临时同步系统"""
+    main_db = str(tmp_path / 'main.db')
+    conn = sqlite3.connect(main_db)
+    conn.execute('''
+        CREATE TABLE material_categories (
+            material_name TEXT PRIMARY KEY, category TEXT, specification TEXT,
+            manufacturer TEXT, material_type TEXT, unit TEXT,
+            last_updated TEXT, source_system TEXT
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+    sync = SimplifiedIncrementalSync(main_db, str(tmp_path / 'sync.db'))
+    yield sync
+    sync.close()
+
+
+def _material(code, name, last_modified):
+    return {'material_code': code, 'material_name': name, 'last_modified': last_modified}
+
+
+def test_edit_outside_conflict_window_is_update(sync_system):
+    """修改时间相差超过冲突窗口的变更按正常更新处理"""
+    sync_system.sync_from_source('ERP', [_material('M1', '阀门', '2024-01-01T00:00:00')])
+
+    result = sync_system.sync_from_source('ERP', [_material('M1', '球阀', '2024-01-02T00:00:00')])
+
+    assert result.updated_records == 1
+    assert result.conflicts == 0
+
+
+def test_edit_inside_conflict_window_is_conflict(sync_system):
+    """冲突窗口内的并发修改记为冲突"""
+    sync_system.sync_from_source('ERP', [_material('M1', '阀门', '2024-01-01T00:00:00')])
+
+    result = sync_system.sync_from_source('ERP', [_material('M1', '球阀', '2024-01-01T00:01:00')])
+
+    assert result.updated_records == 0
+    assert result.conflicts == 1
+
+
+def test_duplicate_code_conflicts_in_one_batch(sync_system):
+    """同一批次内同一物料的多次冲突互不影响，其他物料正常更新"""
+    sync_system.sync_from_source('ERP', [
+        _material('M1', '阀门', '2024-01-01T00:00:00'),
+        _material('M2', '螺栓', '2024-01-01T00:00:00'),
+    ])
+
+    result = sync_system.sync_from_source('ERP', [
+        _material('M1', '球阀', '2024-01-01T00:01:00'),
+        _material('M1', '闸阀', '2024-01-01T00:02:00'),
+        _material('M2', '螺母', '2024-03-01T00:00:00'),
+    ])
+
+    assert result.conflicts == 2
+    assert result.updated_records == 1
+    assert result.errors == 0
+
+
+def test_same_code_conflicts_across_sources(sync_system):
+    """一次多数据源同步中，不同数据源对同一物料的冲突各自保存"""
+    sync_system.sync_from_sources([
+        ('ERP', [_material('M1', '阀门', '2024-01-01T00:00:00')]),
+        ('PLM', [_material('M1', '阀门', '2024-01-01T00:00:00')]),
+    ])
+
+    results = sync_system.sync_from_sources([
+        ('ERP', [_material('M1', '球阀', '2024-01-01T00:01:00')]),
+        ('PLM', [_material('M1', '闸阀', '2024-01-01T00:01:00')]),
+    ])
+
+    assert [result.conflicts for result in results] == [1, 1]
+
+
+def test_conflict_save_failure_is_row_error(sync_system, monkeypatch):
+    """冲突记录保存失败只计为该行错误，同批其他物料的更新保留"""
+    sync_system.sync_from_source('ERP', [
+        _material('M1', '阀门', '2024-01-01T00:00:00'),
+        _material('M2', '螺栓', '2024-01-01T00:00:00'),
+    ])
+
+    def fail(conflict):
+        raise sqlite3.IntegrityError('UNIQUE constraint failed: sync_conflicts.conflict_id')
+    monkeypatch.setattr(sync_system, '_save_conflict_record', fail)
+
+    result = sync_system.sync_from_source('ERP', [
+        _material('M1', '球阀', '2024-01-01T00:01:00'),
+        _material('M2', '螺母', '2024-03-01T00:00:00'),
+    ])
+
+    assert result.errors == 1
+    assert result.conflicts == 0
+    assert result.updated_records == 1
+
+
+def test_known_hashes_dropped_after_external_write(sync_system, tmp_path):
+    """其他实例写入同步库后，本实例不再按过期的指纹缓存跳过记录"""
+    original = _material('M1', '阀门', '2024-01-01T00:00:00')
+    sync_system.sync_from_source('ERP', [original])
+
+    other = SimplifiedIncrementalSync(sync_system.main_db_path, sync_system.sync_db_path)
+    other.sync_from_source('ERP', [_material('M1', '球阀', '2024-01-02T00:00:00')])
+    other.close()
+
+    result = sync_system.sync_from_source('ERP', [original])
+
+    assert result.updated_records == 1
+
+
+def test_failed_source_rolls_back_alone(sync_system):
+    """一个数据源中途失败只回滚该数据源，同一事务中的其他数据源正常提交"""
+    sync_system.sync_config['batch_size'] = 2
+
+    def broken_source():
+        yield _material('B1', '阀门', '2024-01-01T00:00:00')
+        yield _material('B2', '阀门', '2024-01-01T00:00:00')
+        yield _material('B3', '阀门', '2024-01-01T00:00:00')
+        raise RuntimeError('source read failed')
+
+    results = sync_system.sync_from_sources([
+        ('PLM', broken_source()),
+        ('ERP', [_material('M1', '阀门', '2024-01-01T00:00:00')]),
+    ])
+
+    assert isinstance(results[0], RuntimeError)
+    assert results[1].new_records == 1
+    conn = sqlite3.connect(sync_system.sync_db_path)
+    rows = conn.execute('SELECT source_system, material_code FROM sync_records').fetchall()
+    conn.close()
+    assert rows == [('ERP', 'M1')]
+
+
+def test_conflict_local_record_has_raw_data(sync_system):
+    """待审核冲突的本地记录带有原始数据"""
+    sync_system.sync_config['enable_auto_resolution'] = False
+    sync_system.sync_from_source('ERP', [_material('M1', '阀门', '2024-01-01T00:00:00')])
+    sync_system.sync_from_source('ERP', [_material('M1', '球阀', '2024-01-01T00:01:00')])
+
+    conflicts = sync_system.get_conflicts_for_review()
+
+    assert len(conflicts) == 1
+    assert conflicts[0]['local_record']['raw_data']['material_name'] == '阀门'
+
+
+def test_local_wins_resolution_written_to_main(sync_system):
+    """本地记录胜出时也写入主库"""
+    sync_system.sync_from_source('ERP', [_material('M1', '阀门', '2024-01-01T00:02:00')])
+    result = sync_system.sync_from_source('ERP', [_material('M1', '球阀', '2024-01-01T00:01:00')])
+
+    assert result.conflicts == 1
+    conn = sqlite3.connect(sync_system.main_db_path)
+    rows = conn.execute('SELECT material_name, source_system FROM material_categories').fetchall()
+    conn.close()
+    assert rows == [('阀门', 'ERP')]
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_conflict_data_serialization(sync_system, monkeypatch, use_orjson):
+    """冲突快照中的状态和时间在orjson与标准库json下序列化结果一致"""
+    from app import simplified_incremental_sync
+    monkeypatch.setattr(simplified_incremental_sync, 'ORJSON_AVAILABLE',
+                        use_orjson and simplified_incremental_sync.ORJSON_AVAILABLE)
+    sync_system.sync_config['enable_auto_resolution'] = False
+    sync_system.sync_from_source('ERP', [_material('M1', '阀门', '2024-01-01T00:00:00')])
+    sync_system.sync_from_source('ERP', [_material('M1', '球阀', '2024-01-01T00:01:00')])
+
+    conflicts = sync_system.get_conflicts_for_review()
+
+    remote = conflicts[0]['remote_records'][0]
+    assert remote['sync_status'] == 'pending'
+    assert remote['last_modified'] == '2024-01-01T00:01:00'
+
+
+def test_conflict_keeps_local_version_after_update(sync_system):
+    """本地记录在冲突后被更新，待审核冲突仍显示冲突时的本地版本"""
+    sync_system.sync_config['enable_auto_resolution'] = False
+    sync_system.sync_from_source('ERP', [_material('M1', '阀门', '2024-01-01T00:00:00')])
+    sync_system.sync_from_source('ERP', [_material('M1', '球阀', '2024-01-01T00:01:00')])
+    sync_system.sync_from_source('ERP', [_material('M1', '闸阀', '2024-03-01T00:00:00')])
+
+    conflicts = sync_system.get_conflicts_for_review()
+
+    assert len(conflicts) == 1
+    local = conflicts[0]['local_record']
+    assert local['raw_data']['material_name'] == '阀门'
+    assert local['last_modified'] == '2024-01-01T00:00:00'
+
+
+def test_main_table_created_after_start(tmp_path):
+    """主表在同步系统启动后才创建，冲突解决结果仍写入主库"""
+    main_db = str(tmp_path / 'main.db')
+    sync = SimplifiedIncrementalSync(main_db, str(tmp_path / 'sync.db'))
+    try:
+        conn = sqlite3.connect(main_db)
+        conn.execute('''
+            CREATE TABLE material_categories (
+                material_name TEXT PRIMARY KEY, category TEXT, specification TEXT,
+                manufacturer TEXT, material_type TEXT, unit TEXT,
+                last_updated TEXT, source_system TEXT
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+        sync.sync_from_source('ERP', [_material('M1', '阀门', '2024-01-01T00:00:00')])
+        sync.sync_from_source('ERP', [_material('M1', '球阀', '2024-01-01T00:01:00')])
+    finally:
+        sync.close()
+
+    conn = sqlite3.connect(main_db)
+    rows = conn.execute('SELECT material_name FROM material_categories').fetchall()
+    conn.close()
+    assert rows == [('球阀',)]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+质量评估API回归测试
+"""
+
+import os
+import sys
+from datetime import date
+
+import pytest
+
+# 确保当前目录在Python路径中
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from app import quality_api
+from app.base_quality_assessment import BaseQualityAssessment
+
+
+@pytest.fixture
+def assessor(tmp_path, monkeypatch):
+    """使用临时配置库的质量评估器，缓存清空"""
+    monkeypatch.setattr(quality_api, 'quality_assessor', BaseQualityAssessment(str(tmp_path / 'config.db')))
+    quality_api._cached_assess.cache_clear()
+    yield quality_api.quality_assessor
+    quality_api._cached_assess.cache_clear()
+
+
+def test_assess_cache_distinguishes_value_types(assessor):
+    """数值相等但类型不同的字段值使用不同的缓存项"""
+    for value in (1, 1.0, True, '1'):
+        quality_api._assess_material({'material_name': '阀门', 'specification': 'DN100', 'source_id': value})
+
+    assert quality_api._cached_assess.cache_info().currsize == 4
+
+
+def test_assess_cache_returns_copies(assessor):
+    """修改返回的评估结果不影响缓存中的结果"""
+    material = {'material_name': '阀门', 'specification': 'DN100'}
+    first = quality_api._assess_material(material)
+    first.quality_issues.append('调用方追加')
+
+    second = quality_api._assess_material(material)
+
+    assert quality_api._cached_assess.cache_info().hits == 1
+    assert '调用方追加' not in second.quality_issues
+
+
+def test_assess_cache_expires_by_day(assessor, monkeypatch):
+    """跨自然日后重新评估，可靠性得分随数据时效更新"""
+    class NextDay(date):
+        @classmethod
+        def today(cls):
+            return date(2099, 1, 1)
+
+    material = {'material_name': '阀门', 'specification': 'DN100'}
+    quality_api._assess_material(material)
+    monkeypatch.setattr(quality_api, 'date', NextDay)
+    quality_api._assess_material(material)
+
+    assert quality_api._cached_assess.cache_info().misses == 2
+
+
+def test_now_iso_follows_second_boundary(monkeypatch):
+    """时间戳缓存按整秒切换，输出精确到秒"""
+    monkeypatch.setattr(quality_api, '_TS_CACHE', [-1, ''])
+    now = [1700000000.9]
+    monkeypatch.setattr(quality_api.time, 'time', lambda: now[0])
+    first = quality_api._now_iso()
+    now[0] = 1700000001.1
+
+    second = quality_api._now_iso()
+
+    assert first != second
+    assert '.' not in second
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+权重优化器回归测试
+"""
+
+import os
+import sys
+import threading
+
+# 确保当前目录在Python路径中
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from app.quality_weight_optimizer import QualityWeightOptimizer
+
+
+def _result(accuracy):
+    return {
+        'optimal_weights': {'completeness_score': 0.2},
+        'baseline_performance': {'mean_accuracy': 0.5},
+        'optimized_performance': {'mean_accuracy': accuracy},
+        'improvement': accuracy - 0.5,
+        'adopted': True,
+        'training_samples': 10
+    }
+
+
+def test_history_shared_across_threads(tmp_path):
+    """不同线程保存和读取优化历史使用同一连接"""
+    optimizer = QualityWeightOptimizer(str(tmp_path / 'mmp.db'), str(tmp_path / 'training.db'))
+    optimizer._save_optimization_result(_result(0.6))
+
+    errors = []
+
+    def worker():
+        try:
+            optimizer._save_optimization_result(_result(0.7))
+            if optimizer.get_optimization_history().empty:
+                errors.append('empty history')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(optimizer.get_optimization_history()) == 5
+    optimizer.close()
+
+
+def test_dimension_scores_drop_text_features(tmp_path):
+    """维度评分结果不包含中间文本特征列"""
+    optimizer = QualityWeightOptimizer(str(tmp_path / 'mmp.db'), str(tmp_path / 'training.db'))
+    training_data = optimizer._create_mock_training_data()
+
+    enhanced = optimizer._calculate_quality_dimensions(training_data)
+
+    assert [column for column in enhanced.columns if column.startswith('_')] == []
+    assert 'quality_label' in enhanced.columns
+    optimizer.close()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+智能分类器回归测试
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# 确保当前目录在Python路径中
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from app.smart_classifier import SmartClassifier
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """带分类源表的临时分类库"""
+    path = str(tmp_path / 'categories.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE material_categories (category_name TEXT, description TEXT, level INTEGER)')
+    conn.executemany('INSERT INTO material_categories VALUES (?, ?, ?)', [
+        ('阀门', '各类阀门', 1), ('阀门', '各类阀门', 1), ('管件', '', 2), ('深层', '', 4)
+    ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _schema(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT type, name FROM sqlite_master ORDER BY name').fetchall()
+    conn.close()
+    return rows
+
+
+def test_categories_follow_source(db_path):
+    """其他连接修改源表后重新加载分类数据（包括不改变行数的原地更新）"""
+    classifier = SmartClassifier(db_path)
+    assert [c['name'] for c in classifier.classification_data] == ['阀门', '管件']
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO material_categories VALUES ('法兰', '', 2)")
+    conn.commit()
+    assert [c['name'] for c in classifier.classification_data] == ['阀门', '法兰', '管件']
+
+    conn.execute("UPDATE material_categories SET category_name = '弯头' WHERE category_name = '法兰'")
+    conn.commit()
+    conn.close()
+    assert [c['name'] for c in classifier.classification_data] == ['阀门', '弯头', '管件']
+    classifier.close()
+
+
+def test_categories_cached_without_changes(db_path):
+    """源库未变化时复用已加载的分类数据"""
+    classifier = SmartClassifier(db_path)
+    first = classifier.classification_data
+
+    assert classifier.classification_data is first
+    classifier.close()
+
+
+def test_loading_leaves_source_schema_unchanged(db_path):
+    """加载分类数据不在分类库中建表或安装触发器"""
+    before = _schema(db_path)
+    classifier = SmartClassifier(db_path)
+
+    assert classifier.refresh_materialized() == 2
+    classifier.close()
+
+    assert _schema(db_path) == before
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+同步API回归测试
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+from flask import Flask
+
+# 确保当前目录在Python路径中
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from app import sync_api
+
+
+@pytest.fixture
+def client(tmp_path):
+    """注册同步蓝图的测试客户端"""
+    main_db = str(tmp_path / 'main.db')
+    conn = sqlite3.connect(main_db)
+    conn.execute('''
+        CREATE TABLE material_categories (
+            material_name TEXT PRIMARY KEY, category TEXT, specification TEXT,
+            manufacturer TEXT, material_type TEXT, unit TEXT,
+            last_updated TEXT, source_system TEXT
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+    app = Flask(__name__)
+    app.config.update(DATABASE_PATH=main_db, SYNC_DATABASE_PATH=str(tmp_path / 'sync.db'))
+    app.register_blueprint(sync_api.sync_bp)
+    sync_api.init_sync_system(app)
+    yield app.test_client()
+    app.extensions[sync_api.SYNC_SYSTEM_EXTENSION].close()
+
+
+def test_batch_sync_malformed_source_fails_alone(client):
+    """缺少data的数据源只记为该数据源失败，其他数据源正常同步"""
+    response = client.post('/api/sync/batch-sync', json={'sync_sources': [
+        {'source_system': 'ERP', 'data': [{'material_code': 'M1', 'material_name': '阀门'}]},
+        {'source_system': 'PLM'},
+    ]})
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['overall_statistics']['successful_syncs'] == 1
+    assert data['overall_statistics']['failed_syncs'] == 1
+    assert [result['status'] for result in data['source_results']] == ['success', 'failed']
+
+
+def test_deferred_records_written_at_exit(tmp_path):
+    """defer 提交后直接退出进程，队列中的记录在退出时写入"""
+    script = '''
+import sqlite3, sys
+sys.path.insert(0, {root!r})
+from flask import Flask
+from app import sync_api
+conn = sqlite3.connect({main!r})
+conn.execute('CREATE TABLE material_categories (material_name TEXT PRIMARY KEY)')
+conn.commit()
+app = Flask(__name__)
+app.config.update(DATABASE_PATH={main!r}, SYNC_DATABASE_PATH={sync!r},
+                  SYNC_INGEST_FLUSH_INTERVAL=3600)
+app.register_blueprint(sync_api.sync_bp)
+sync_api.init_sync_system(app)
+response = app.test_client().post('/api/sync/from-source', json={{
+    'source_system': 'ERP', 'defer': True,
+    'data': [{{'material_code': 'M1', 'material_name': '阀门'}}]
+}})
+assert response.status_code == 202
+'''.format(root=current_dir, main=str(tmp_path / 'main.db'), sync=str(tmp_path / 'sync.db'))
+
+    subprocess.run([sys.executable, '-c', script], check=True, timeout=60)
+
+    conn = sqlite3.connect(str(tmp_path / 'sync.db'))
+    rows = conn.execute('SELECT source_system, material_code FROM sync_records').fetchall()
+    conn.close()
+    assert rows == [('ERP', 'M1')]
+
+
+@pytest.mark.parametrize('sync_config', [
+    {'batch_size': 0},
+    {'batch_size': '500'},
+    {'conflict_resolution_strategy': 'newest'},
+    {'enable_auto_resolution': 'yes'},
+])
+def test_config_rejects_invalid_values(client, sync_config):
+    """不合法的配置值返回400，配置和版本保持不变"""
+    response = client.post('/api/sync/config', json={
+        'expected_version': 0, 'sync_config': sync_config
+    })
+
+    assert response.status_code == 400
+    data = client.get('/api/sync/config').get_json()['data']
+    assert data['sync_config_version'] == 0
+    assert data['sync_config']['batch_size'] == 1000
+
+
+def test_config_strategy_stored_as_enum(client):
+    """字符串形式的冲突解决策略转换为枚举保存"""
+    response = client.post('/api/sync/config', json={
+        'expected_version': 0,
+        'sync_config': {'conflict_resolution_strategy': 'source_priority', 'batch_size': 500}
+    })
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['sync_config']['conflict_resolution_strategy'] == 'source_priority'
+    sync_system = client.application.extensions[sync_api.SYNC_SYSTEM_EXTENSION]
+    assert sync_system.sync_config['conflict_resolution_strategy'].value == 'source_priority'
+
+
+def test_etag_read_does_not_write_history(client):
+    """计算ETag不落库缓冲的同步历史，有新历史时ETag改变"""
+    sync_system = client.application.extensions[sync_api.SYNC_SYSTEM_EXTENSION]
+    first = client.get('/api/sync/config').headers['ETag']
+
+    sync_system.sync_from_source('ERP', [{'material_code': 'M1', 'material_name': '阀门'}])
+    second = client.get('/api/sync/config').headers['ETag']
+
+    assert second != first
+    assert len(sync_system._history_buf) == 1
+
+
+def test_status_not_modified_until_sync(client):
+    """数据未变化时携带ETag的请求返回304，同步后返回新数据"""
+    etag = client.get('/api/sync/status').headers['ETag']
+
+    assert client.get('/api/sync/status', headers={'If-None-Match': etag}).status_code == 304
+
+    client.post('/api/sync/from-source', json={
+        'source_system': 'ERP', 'data': [{'material_code': 'M1', 'material_name': '阀门'}]
+    })
+    assert client.get('/api/sync/status', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_config_stale_version_conflict(client):
+    """基于过期版本的配置修改返回409，不覆盖他人的修改"""
+    assert client.post('/api/sync/config', json={
+        'expected_version': 0, 'sync_config': {'batch_size': 500}
+    }).status_code == 200
+
+    response = client.post('/api/sync/config', json={
+        'expected_version': 0, 'sync_config': {'batch_size': 200}
+    })
+
+    assert response.status_code == 409
+    assert response.get_json()['current_version'] == 1
+    assert client.get('/api/sync/config').get_json()['data']['sync_config']['batch_size'] == 500
+
+
+def _create_conflict(client):
+    """制造一个待人工审核的冲突，返回冲突ID"""
+    sync_system = client.application.extensions[sync_api.SYNC_SYSTEM_EXTENSION]
+    sync_system.sync_config['enable_auto_resolution'] = False
+    for name, last_modified in (('阀门', '2024-01-01T00:00:00'), ('球阀', '2024-01-01T00:01:00')):
+        sync_system.sync_from_source('ERP', [
+            {'material_code': 'M1', 'material_name': name, 'last_modified': last_modified}
+        ])
+    return sync_system.get_conflicts_for_review()[0]['conflict_id']
+
+
+def test_resolution_failure_reported_by_flush(client, monkeypatch):
+    """冲突解决结果写入失败时，flush 返回失败的冲突"""
+    conflict_id = _create_conflict(client)
+    sync_system = client.application.extensions[sync_api.SYNC_SYSTEM_EXTENSION]
+
+    def fail(resolutions):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(sync_system, 'resolve_conflicts', fail)
+
+    assert client.post(f'/api/sync/conflicts/{conflict_id}/resolve', json={
+        'resolution_strategy': 'manual_review'
+    }).status_code == 202
+    response = client.post('/api/sync/conflicts/flush', json={'timeout': 10})
+
+    data = response.get_json()['data']
+    assert data['completed'] is True
+    assert data['resolved'] == 0
+    assert [item['conflict_id'] for item in data['failed_resolutions']] == [conflict_id]
+
+
+def test_resolutions_written_at_exit(tmp_path):
+    """提交冲突解决结果后直接退出进程，结果在退出时写入"""
+    script = '''
+import sqlite3, sys, threading, time
+sys.path.insert(0, {root!r})
+from flask import Flask
+from app import sync_api
+conn = sqlite3.connect({main!r})
+conn.execute('CREATE TABLE material_categories (material_name TEXT PRIMARY KEY, category TEXT, '
+             'specification TEXT, manufacturer TEXT, material_type TEXT, unit TEXT, '
+             'last_updated TEXT, source_system TEXT)')
+conn.commit()
+app = Flask(__name__)
+app.config.update(DATABASE_PATH={main!r}, SYNC_DATABASE_PATH={sync!r})
+app.register_blueprint(sync_api.sync_bp)
+sync_api.init_sync_system(app)
+sync_system = app.extensions[sync_api.SYNC_SYSTEM_EXTENSION]
+sync_system.sync_config['enable_auto_resolution'] = False
+sync_system.sync_from_source('ERP', [{{'material_code': 'M1', 'material_name': 'a', 'last_modified': '2024-01-01T00:00:00'}}])
+sync_system.sync_from_source('ERP', [{{'material_code': 'M1', 'material_name': 'b', 'last_modified': '2024-01-01T00:01:00'}}])
+conflict_id = sync_system.get_conflicts_for_review()[0]['conflict_id']
+# 后台线程在退出开始后才写入，保证退出时结果仍未落库
+gate = threading.Event()
+resolve = sync_system.resolve_conflicts
+sync_system.resolve_conflicts = lambda batch: (gate.wait(), time.sleep(0.5), resolve(batch))
+sync_api.atexit.register(gate.set)
+response = app.test_client().post('/api/sync/conflicts/%s/resolve' % conflict_id,
+                                  json={{'resolution_strategy': 'manual_review'}})
+assert response.status_code == 202
+'''.format(root=current_dir, main=str(tmp_path / 'main.db'), sync=str(tmp_path / 'sync.db'))
+
+    subprocess.run([sys.executable, '-c', script], check=True, timeout=60)
+
+    conn = sqlite3.connect(str(tmp_path / 'sync.db'))
+    rows = conn.execute('SELECT resolved FROM sync_conflicts').fetchall()
+    conn.close()
+    assert rows == [(1,)]
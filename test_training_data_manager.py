@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+训练数据管理器回归测试
+"""
+
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+# 确保当前目录在Python路径中
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from app.training_data_manager import MULTI_ROW_INSERT_ROWS, TrainingDataManager
+
+
+def test_import_multi_row_chunks(tmp_path):
+    """整组与余下的行都写入，缺少物料名称的行跳过，空值保存为NULL"""
+    row_count = MULTI_ROW_INSERT_ROWS * 2 + 7
+    csv_path = str(tmp_path / 'samples.csv')
+    pd.DataFrame({
+        '物料名称': [f'阀门{i}' if i % 10 else None for i in range(row_count)],
+        '品牌': [None] + ['上海阀门厂'] * (row_count - 1),
+    }).to_csv(csv_path, index=False)
+
+    manager = TrainingDataManager(str(tmp_path / 'training.db'))
+    manager.import_training_data_from_files([csv_path])
+    manager.close()
+
+    conn = sqlite3.connect(str(tmp_path / 'training.db'))
+    total, names, brands = conn.execute(
+        'SELECT COUNT(*), COUNT(DISTINCT material_name), COUNT(brand) FROM training_samples'
+    ).fetchone()
+    conn.close()
+    expected = row_count - len(range(0, row_count, 10))
+    assert (total, names, brands) == (expected, expected, expected)
+
+
+def test_sample_chunk_skips_bad_row(tmp_path):
+    """多行插入中某一行违反约束时逐行重试，只跳过出错的行"""
+    manager = TrainingDataManager(str(tmp_path / 'training.db'))
+    manager.close()
+    rows = [(None, f'阀门{i}', None, None, None, 'samples.csv')
+            for i in range(MULTI_ROW_INSERT_ROWS + 3)]
+    rows[1] = (None, None, None, None, None, 'samples.csv')
+
+    conn = sqlite3.connect(str(tmp_path / 'training.db'))
+    inserted = TrainingDataManager._insert_sample_chunk(conn.cursor(), rows)
+    conn.commit()
+    total = conn.execute('SELECT COUNT(*) FROM training_samples').fetchone()[0]
+    conn.close()
+
+    assert inserted == total == MULTI_ROW_INSERT_ROWS + 2
+
+
+def test_save_training_results_returns_id(tmp_path):
+    """保存训练结果返回新记录的id，同一会话重新保存时返回替换后的id"""
+    manager = TrainingDataManager(str(tmp_path / 'training.db'))
+    first = manager.save_training_results('s1', {'total_samples': 3})
+    second = manager.save_training_results('s1', {'total_samples': 4})
+    manager.close()
+
+    conn = sqlite3.connect(str(tmp_path / 'training.db'))
+    rows = conn.execute('SELECT id, training_session_id, total_samples FROM training_results').fetchall()
+    conn.close()
+    assert second != first
+    assert rows == [(second, 's1', 4)]
+
+
+def test_save_training_results_failure_returns_none(tmp_path):
+    """写入失败时返回None"""
+    manager = TrainingDataManager(str(tmp_path / 'training.db'))
+    conn = sqlite3.connect(str(tmp_path / 'training.db'))
+    conn.execute('DROP TABLE training_results')
+    conn.commit()
+    conn.close()
+
+    assert manager.save_training_results('s1', {'total_samples': 3}) is None
+    manager.close()
+
+
+def test_active_model_switches_on_save(tmp_path):
+    """同名模型保存新版本后只有最新版本为活跃"""
+    manager = TrainingDataManager(str(tmp_path / 'training.db'))
+    first = manager.save_classification_model('tfidf', '1', 'tfidf', {'v': 1}, ['阀门'], {}, 's1')
+    second = manager.save_classification_model('tfidf', '2', 'tfidf', {'v': 2}, ['阀门'], {}, 's2')
+
+    assert second > first
+    model, feature_names, parameters = manager.load_active_classification_model('tfidf')
+    assert model == {'v': 2}
+    assert feature_names == ['阀门']
+    manager.close()